@@ -1,18 +1,19 @@
 import streamlit as st
 import pandas as pd
+import hashlib
 import io
+import time
 import yaml
 import bcrypt
 from pathlib import Path
 import streamlit.components.v1 as components
 from modules.auth import get_authenticator, get_user_info
-from modules.parsing import parse_uploaded_file, split_dataset_by_type
 from modules.storage import (
     archive_raw_file,
     save_parsed_dataset,
+    save_split_dataset,
     list_history,
     list_history_tests,
-    merge_all_parsed,
     list_parsed_datasets,
     load_csv,
     delete_path,
@@ -20,8 +21,21 @@ from modules.storage import (
     get_targets,
     save_targets,
     get_college_display,
+    read_raw_bytes,
+    plain_name,
 )
-from modules.quality import assess_qa, assess_exercises, summarize_quality
+from modules.quality import assess_qa, assess_exercises, summarize_quality, QUALITY_ERROR_RATIO_THRESHOLD
+from modules.cache import corpus_version, export_artifact, load_export_bundle, store_export_bundle, parse_uploaded_file_cached
+from modules.stats import summarize_colleges
+from modules.snapshot import load_corpus
+from modules.versions import create_version, list_versions, diff_versions, version_export_frames
+from modules.compaction import compact_parsed, plan_compaction, COMPACT_MIN_FILES
+from modules.search import search, sync_index, index_stats, search_available, SEARCH_PAGE_SIZE
+from modules.knowledge import coverage, point_totals, labelled_ratio, items_for_point, KNOWLEDGE_PAGE_SIZE
+from modules.similarity import suggest_knowledge, apply_knowledge_suggestions, missing_knowledge, similarity_available, sync_similarity, SUGGEST_MIN_SCORE
+from modules.sampling import draw_corpus_sample, load_sample, DEFAULT_STRATA, SAMPLE_SIZE
+from modules.tracing import start_trace, log_upload
+from modules.profiling import RerunProfile, profiling_enabled, branch_summary, list_slowest_reruns, load_profile_report, PROFILE_DIR, PROFILE_ENV
 
 def _suggestions_for_errors(errs: dict, dtype: str) -> list[str]:
     tips = []
@@ -54,7 +68,7 @@ def _suggestions_for_errors(errs: dict, dtype: str) -> list[str]:
     if not tips:
         tips.append("修复所有标红项（Error），并重新上传")
     return tips
-from modules.ui import render_overview, render_tabs, render_history, hide_deploy_button, render_login_branding, style_sidebar_menu, load_custom_css, render_metric_card, render_warnings
+from modules.ui import render_overview, render_tabs, render_history, select_dataset, hide_deploy_button, render_login_branding, style_sidebar_menu, load_custom_css, render_metric_card, render_warnings
 
 st.set_page_config(page_title="应用经济学语料提交平台 By A³ T @2025", layout="wide", menu_items={"Get help": None, "Report a bug": None, "About": None})
 load_custom_css()
@@ -89,8 +103,10 @@ elif authentication_status is None:
     # if _gh.exists():
     #     _html = _gh.read_text(encoding="utf-8")
     #     components.html(_html, height=800, scrolling=True)
-else:
-    user_info = get_user_info(username)
+
+
+def main(username: str, user_info: dict, _rerun_profile: RerunProfile | None):
+    """已登录用户的页面：侧边栏菜单与各功能页。"""
     st.sidebar.markdown(f"欢迎 **{user_info['display']}**")
 
     try:
@@ -108,12 +124,16 @@ else:
     #     for k in ["authentication_status", "username", "name"]:
     #         st.session_state.pop(k, None)
     if user_info["role"] == "admin":
-        menu = ["📊 汇总统计", "🏫 学院管理", "🧪 测试样例", "📦 汇总输出"]
+        menu = ["📊 汇总统计", "🏫 学院管理", "🧪 测试样例", "📦 汇总输出", "🔎 全局检索", "🧭 知识点覆盖", "🩺 性能分析"]
     else:
         menu = ["⬆️ 上传数据", "📚 查看语料数据"]
     style_sidebar_menu()
     st.sidebar.markdown("<div class='sidebar-brand'><h2>应用经济学语料提交平台</h2><div class='brand-byline'>By A³ T @2025</div><p>请选择菜单</p></div>", unsafe_allow_html=True)
     choice = st.sidebar.radio("菜单", menu)
+    if user_info["role"] == "admin":
+        st.sidebar.checkbox("性能分析模式", key="profiling_toggle", help="开启后记录每次页面重运行的耗时与热点函数")
+    if _rerun_profile is not None:
+        _rerun_profile.branch = choice
 
     from pathlib import Path as _P
     _gp = _P("handbook.md")
@@ -173,6 +193,55 @@ else:
         #st.subheader("上传学院收集的语料集")
         st.subheader("上传学院收集的语料集")
         
+        def _save_upload(df: pd.DataFrame, meta: dict, college: str, force: bool) -> dict:
+            with start_trace("save") as tracer:
+                partitions = save_split_dataset(df, meta, college)
+            types_saved = sorted({p["type"] for p in partitions})
+            log_upload(college, meta.get("filename", "-"), len(df),
+                       {"parse": meta.get("parse_perf", []), "save": tracer.records()},
+                       {"force": force, "partitions": [{k: p[k] for k in ("file", "exercise_type", "level", "rows")} for p in partitions]})
+            return {
+                "type": "/".join(types_saved) if types_saved else meta.get('type','-'),
+                "count": sum(p["rows"] for p in partitions),
+                "force": force,
+            }
+
+        def render_knowledge_suggestions(df: pd.DataFrame, meta: dict, key: str):
+            """缺失知识点（KN_EMPTY）行的知识点建议；勾选应用后返回补全并重新质检的 (df, meta)，否则附带建议列作预览。"""
+            if meta.get("type") != "习题库" or not similarity_available():
+                return df, meta, df
+            kn_empty = int(missing_knowledge(df).sum())
+            if not kn_empty:
+                return df, meta, df
+            sugg_key = f"kn_suggest_{key}"
+            with st.expander(f"💡 知识点建议（{kn_empty} 行缺失知识点）", expanded=sugg_key in st.session_state):
+                if st.button("生成知识点建议", key=f"btn_kn_suggest_{key}"):
+                    with st.spinner("正在匹配全库相似题..."):
+                        # 补齐未向量化或向量化规则已变更的文件
+                        sync_similarity()
+                        st.session_state[sugg_key] = suggest_knowledge(df)
+                sugg = st.session_state.get(sugg_key)
+                if sugg is None:
+                    st.caption("按题干匹配库中已标注知识点的相似题，为缺失知识点的行推荐知识点")
+                    return df, meta, df
+                if sugg.empty:
+                    st.info("库中没有足够相似的已标注题目，未能给出建议")
+                    return df, meta, df
+                min_conf = st.slider("最低置信度（近邻投票占比）", 0.0, 1.0, 0.5, 0.05, key=f"kn_conf_{key}")
+                chosen = sugg[sugg["confidence"] >= min_conf]
+                st.caption(f"{len(sugg)} / {kn_empty} 行有建议（最近邻相似度 ≥ {SUGGEST_MIN_SCORE}），其中 {len(chosen)} 行达到置信度")
+                stems = df["stem"] if "stem" in df.columns else pd.Series("", index=df.index)
+                st.dataframe(pd.DataFrame({
+                    "题干": stems.loc[chosen.index], "建议知识点": chosen["suggested_knowledge"],
+                    "置信度": chosen["confidence"], "相似度": chosen["similarity"], "参考题": chosen["neighbour"],
+                }), use_container_width=True)
+                if chosen.empty or not st.checkbox(f"入库前应用这 {len(chosen)} 条建议", key=f"kn_apply_{key}"):
+                    return df, meta, df.assign(suggested_knowledge=sugg["suggested_knowledge"])
+                df = assess_exercises(apply_knowledge_suggestions(df, chosen))
+                meta = dict(meta, quality_summary=summarize_quality(df))
+                st.success(f"已补全 {len(chosen)} 行知识点，质量检测已按补全后的数据重新计算")
+            return df, meta, df
+
         def render_upload_section(upload_type_label: str, user_info: dict, key_suffix: str):
             exercise_types = ["自动识别", "选择题", "填空题", "简答题", "论述题", "案例分析题", "判断题"]
             chosen_ex_type = None
@@ -191,16 +260,18 @@ else:
             uploaded = st.file_uploader("上传文件（支持 Excel/CSV）", type=["xlsx", "xls", "csv"], key=f"main_upload_{key_suffix}_{nonce}")
             
             if uploaded is not None:
-                raw_path = archive_raw_file(uploaded, user_info["college"])
                 _u_type = "习题库" if upload_type_label in ("本科习题库", "研究生习题库") else upload_type_label
-                meta, df, warnings = parse_uploaded_file(uploaded, _u_type, chosen_ex_type, chosen_level)
+                with start_trace("upload") as tracer:
+                    raw_path = archive_raw_file(uploaded, user_info["college"])
+                    meta, df, warnings = parse_uploaded_file_cached(uploaded, _u_type, chosen_ex_type, chosen_level)
+                meta["perf"] = tracer.records()
                 render_overview(meta)
+                df, meta, preview = render_knowledge_suggestions(df, meta, f"{key_suffix}_{getattr(uploaded, 'file_id', uploaded.name)}")
                 
                 type_mismatch = bool(meta.get("detected_type") and meta.get("type") and meta.get("detected_type") != meta.get("type"))
                 if type_mismatch:
                     st.error("类型选择与系统识别不一致：请检查文件结构或更正上传类型。已禁用入库与强制入库。")
                 else:
-                    QUALITY_ERROR_RATIO_THRESHOLD = 0.05
                     qs = (meta.get("quality_summary") or {})
                     err_ratio = float(qs.get("error_row_ratio", 0.0))
                     st.caption(f"质量错误占比：{round(err_ratio*100,2)}%（阈值 {int(QUALITY_ERROR_RATIO_THRESHOLD*100)}%）")
@@ -208,19 +279,7 @@ else:
                     with c1:
                         if err_ratio <= QUALITY_ERROR_RATIO_THRESHOLD:
                             if st.button("入库", type="primary", key=f"btn_save_{key_suffix}"):
-                                split_results = split_dataset_by_type(df, meta)
-                                total_saved = 0
-                                types_saved = set()
-                                for m, d in split_results:
-                                    save_parsed_dataset(d, m, user_info["college"])
-                                    total_saved += len(d)
-                                    types_saved.add(m.get('type', '-'))
-                                
-                                st.session_state["last_import_info"] = {
-                                    "type": "/".join(types_saved) if types_saved else meta.get('type','-'), 
-                                    "count": total_saved, 
-                                    "force": False
-                                }
+                                st.session_state["last_import_info"] = _save_upload(df, meta, user_info["college"], force=False)
                                 st.session_state[f"upload_nonce_{key_suffix}"] = nonce + 1
                                 if hasattr(st, "rerun"):
                                     st.rerun()
@@ -230,19 +289,7 @@ else:
                             st.error(f"质量错误占比 {round(err_ratio*100,2)}% 超过阈值，建议修复后再入库")
                     with c2:
                         if st.button("强制入库（忽略质量检测）", key=f"btn_force_{key_suffix}"):
-                            split_results = split_dataset_by_type(df, meta)
-                            total_saved = 0
-                            types_saved = set()
-                            for m, d in split_results:
-                                save_parsed_dataset(d, m, user_info["college"])
-                                total_saved += len(d)
-                                types_saved.add(m.get('type', '-'))
-
-                            st.session_state["last_import_info"] = {
-                                "type": "/".join(types_saved) if types_saved else meta.get('type','-'), 
-                                "count": total_saved, 
-                                "force": True
-                            }
+                            st.session_state["last_import_info"] = _save_upload(df, meta, user_info["college"], force=True)
                             st.session_state[f"upload_nonce_{key_suffix}"] = nonce + 1
                             if hasattr(st, "rerun"):
                                 st.rerun()
@@ -250,7 +297,7 @@ else:
                                 st.experimental_rerun()
                 
                 render_warnings(warnings)
-                render_tabs(df, meta, key_prefix=f"upload_preview_{key_suffix}")
+                render_tabs(preview, dict(meta, college=user_info["college"]), key_prefix=f"upload_preview_{key_suffix}")
 
         tab1, tab2, tab3 = st.tabs(["问答对", "本科习题库", "研究生习题库"])
         with tab1:
@@ -302,30 +349,21 @@ else:
         else:
             summaries = []
             for it in records:
-                name = it["file"]
-                is_qa = name.endswith("_parsed_qa.csv")
-                is_ex = (name.endswith("_parsed_ex.csv") or ("_parsed_ex" in name))
-                if is_qa or is_ex:
+                if it["type"]:
                     df_tmp = load_csv(it["path"])
-                    summaries.append({"上传日期": it["date"], "文件": name, "类型": ("问答对" if is_qa else "习题库"), "条目数": len(df_tmp)})
+                    summaries.append({"上传日期": it["date"], "文件": plain_name(it["file"]), "类型": ("问答对" if it["type"] == "qa" else "习题库"), "条目数": len(df_tmp)})
             if summaries:
                 st.subheader("语料数据汇总")
                 st.dataframe(pd.DataFrame(summaries), use_container_width=True)
             for item in records:
-                name = item["file"]
-                is_parsed_qa = name.endswith("_parsed_qa.csv")
-                is_parsed_ex = (name.endswith("_parsed_ex.csv") or ("_parsed_ex" in name))
-                is_parsed_generic = name.endswith("_parsed.csv")
-                if is_parsed_qa or is_parsed_ex or is_parsed_generic:
+                name = plain_name(item["file"])
+                if item["type"]:
                     df = load_csv(item["path"])
-                    if is_parsed_generic:
-                        type_name = "问答对" if {"question", "answer"}.issubset(set(df.columns)) else "习题库"
-                    else:
-                        type_name = "问答对" if is_parsed_qa else "习题库"
+                    type_name = "问答对" if item["type"] == "qa" else "习题库"
                     with st.expander(f"{item['date']} - {name} · 类型：{type_name} · 条目：{len(df)}"):
                         meta = {"type": type_name, "filename": item["file"], "total": len(df)}
                         render_overview(meta)
-                        render_tabs(df, meta, key_prefix=f"history-{item['path']}")
+                        render_tabs(df, dict(meta, path=item["path"], college=user_info["college"]), key_prefix=f"history-{item['path']}")
                         if st.button("删除", key=f"user-del-{item['path']}"):
                             if delete_path(item["path"]):
                                 st.success("已删除")
@@ -353,83 +391,7 @@ else:
                 selected_cols.append(code)
         level_filter = st.radio("级别过滤", ["全部", "本科", "研究生"], horizontal=True)
         sort_opt = st.radio("排序", ["按问答对数量", "按习题数量", "按达标状态", "按研究生习题数量"], horizontal=True)
-        rows = []
-        for c in selected_cols:
-            items = list_parsed_datasets(c)
-            qa_count = 0
-            ex_count = 0
-            qa_frames = []
-            ex_frames = []
-            for it in items:
-                df = load_csv(it["path"])
-                if it["type"] == "qa":
-                    qa_count += len(df)
-                    if not df.empty:
-                        qa_frames.append(df)
-                else:
-                    lev = it.get("level") or "本科"
-                    if level_filter == "全部" or lev == level_filter:
-                        ex_count += len(df)
-                        if not df.empty:
-                            df["level"] = lev
-                            ex_frames.append(df)
-            tgt = get_targets(c)
-            qa_status = "达标" if qa_count >= int(tgt.get("qa", 0)) and int(tgt.get("qa", 0)) > 0 else ("未设定" if int(tgt.get("qa", 0)) == 0 else "未达标")
-            # 统计级别：本科与研究生
-            ex_ug_count = 0
-            ex_grad_count = 0
-            for it in items:
-                if it["type"] == "ex":
-                    df = load_csv(it["path"])
-                    lev = it.get("level") or (df.get("level").iloc[0] if "level" in df.columns and len(df) else "本科")
-                    if lev == "研究生":
-                        ex_grad_count += len(df)
-                    else:
-                        ex_ug_count += len(df)
-            ex_ug_t = int(tgt.get("levels", {}).get("ug", {}).get("ex", 0))
-            ex_grad_t = int(tgt.get("levels", {}).get("grad", {}).get("ex", 0))
-            ex_status = "达标" if (ex_ug_count + ex_grad_count) >= int(tgt.get("ex", 0)) and int(tgt.get("ex", 0)) > 0 else ("未设定" if int(tgt.get("ex", 0)) == 0 else "未达标")
-            ex_ug_status = "达标" if ex_ug_count >= ex_ug_t and ex_ug_t > 0 else ("未设定" if ex_ug_t == 0 else "未达标")
-            ex_grad_status = "达标" if ex_grad_count >= ex_grad_t and ex_grad_t > 0 else ("未设定" if ex_grad_t == 0 else "未达标")
-            # 质量汇总（动态评估，不写入文件）
-            qa_summary = {"score_avg": 0, "error_row_ratio": 0.0}
-            ex_summary = {"score_avg": 0, "error_row_ratio": 0.0}
-            if qa_frames:
-                qa_all = pd.concat(qa_frames, ignore_index=True)
-                qa_summary = summarize_quality(assess_qa(qa_all))
-            if ex_frames:
-                ex_all = pd.concat(ex_frames, ignore_index=True)
-                ex_summary = summarize_quality(assess_exercises(ex_all))
-            total_rows = (len(pd.concat(qa_frames, ignore_index=True)) if qa_frames else 0) + (len(pd.concat(ex_frames, ignore_index=True)) if ex_frames else 0)
-            overall_error_ratio = 0.0
-            if total_rows > 0:
-                overall_error_ratio = (
-                    qa_summary.get("error_row_ratio", 0.0) * (len(pd.concat(qa_frames, ignore_index=True)) if qa_frames else 0)
-                    + ex_summary.get("error_row_ratio", 0.0) * (len(pd.concat(ex_frames, ignore_index=True)) if ex_frames else 0)
-                ) / total_rows
-            overall_score = 0.0
-            if total_rows > 0:
-                overall_score = (
-                    qa_summary.get("score_avg", 0.0) * (len(pd.concat(qa_frames, ignore_index=True)) if qa_frames else 0)
-                    + ex_summary.get("score_avg", 0.0) * (len(pd.concat(ex_frames, ignore_index=True)) if ex_frames else 0)
-                ) / total_rows
-            rows.append({
-                "学院": get_college_display(c),
-                "问答对": qa_count,
-                "问答对目标": int(tgt.get("qa", 0)),
-                "问答对状态": qa_status,
-                "习题": ex_count,
-                "习题目标": int(tgt.get("ex", 0)),
-                "习题状态": ex_status,
-                "本科习题": ex_ug_count,
-                "本科目标": ex_ug_t,
-                "本科状态": ex_ug_status,
-                "研究生习题": ex_grad_count,
-                "研究生目标": ex_grad_t,
-                "研究生状态": ex_grad_status,
-                "质量均分": round(overall_score, 2),
-                "红色问题比例": round(overall_error_ratio * 100, 2),
-            })
+        rows = summarize_colleges(selected_cols, level_filter)
         if rows:
             df_rows = pd.DataFrame(rows)
             if sort_opt == "按问答对数量":
@@ -442,34 +404,58 @@ else:
                 status_map = {"达标": 2, "未设定": 1, "未达标": 0}
                 df_rows = df_rows.sort_values(by=["问答对状态"], key=lambda s: s.map(status_map), ascending=False)
             st.dataframe(df_rows, use_container_width=True)
+            with st.expander("🎯 跨学院抽检"):
+                strata_labels = {"college": "学院", "level": "级别", "type": "题型", "flag": "质量标记"}
+                c_strata, c_n, c_seed = st.columns([3, 1, 1])
+                with c_strata:
+                    strata = st.multiselect("分层维度", list(strata_labels), default=list(DEFAULT_STRATA),
+                                            format_func=strata_labels.get, key="sample-strata")
+                with c_n:
+                    sample_n = st.number_input("抽样条数", min_value=1, max_value=200, value=SAMPLE_SIZE, key="sample-n")
+                with c_seed:
+                    sample_seed = st.number_input("随机种子", min_value=0, value=0, key="sample-seed")
+                if "flag" in strata:
+                    st.caption("按质量标记分层需要对所选学院的全部数据做质检，耗时较长")
+                if st.button("抽样", key="sample-draw"):
+                    levels = None if level_filter == "全部" else [level_filter]
+                    with st.spinner("正在抽样..."):
+                        sid, _ = draw_corpus_sample(selected_cols, int(sample_n), int(sample_seed), tuple(strata), levels=levels)
+                    st.session_state["sample-id"] = sid
+                sid = st.text_input("样本编号", key="sample-id", help="同一编号始终对应同一批样本，可发给其他审核人复查")
+                loaded = load_sample(sid.strip()) if sid else None
+                if sid and loaded is None:
+                    st.warning("未找到该样本编号")
+                elif loaded:
+                    sample_meta, sample_rows = loaded
+                    st.caption(f"样本 {sample_meta['id']}：共扫描 {sample_meta.get('scanned', 0)} 条，分层 {len(sample_meta.get('strata_sizes', {}))} 个")
+                    st.dataframe(sample_rows.rename(columns={"_college": "学院", "_level": "级别", "_type": "题型", "_flag": "质量标记", "_source": "来源文件", "_row": "行号"}),
+                                 use_container_width=True)
             for r in rows:
                 with st.expander(f"{r['学院']} 详情"):
                     code = name_map.get(r["学院"], None)
                     items = list_parsed_datasets(code or r["学院"])  
+                    # 仅加载管理员选中的文件，避免每次重运行读取并渲染全部文件
+                    picked = select_dataset(items, key=f"stats-pick-{code or r['学院']}")
+                    if picked:
+                        df = load_csv(picked["path"])
+                        meta = {"type": ("问答对" if picked["type"] == "qa" else "习题库"), "path": picked["path"], "college": code}
+                        render_tabs(df, meta, key_prefix=f"stats-{picked['path']}")
+                    if not items or not st.checkbox("计算质量汇总", value=False, key=f"stats-quality-{code or r['学院']}"):
+                        continue
                     # 质量细节：按类型显示
-                    qa_frames = []
-                    ex_frames = []
-                    for it in items:
-                        with st.expander(f"{it['date']} - {it['file']}"):
-                            df = load_csv(it["path"])
-                            meta = {"type": ("问答对" if it["type"] == "qa" else "习题库")}
-                            render_tabs(df, meta, key_prefix=f"stats-{it['path']}")
-                        if it["type"] == "qa" and not df.empty:
-                            qa_frames.append(df)
-                        elif it["type"] == "ex" and not df.empty:
-                            df["level"] = it.get("level") or df.get("level", "本科")
-                            ex_frames.append(df)
+                    qa_all, qa_skipped = load_corpus(colleges=[code or r["学院"]], types=["qa"])
+                    ex_all, ex_skipped = load_corpus(colleges=[code or r["学院"]], types=["ex"])
                     st.subheader("质量汇总")
-                    if qa_frames:
-                        qa_all = pd.concat(qa_frames, ignore_index=True)
+                    if qa_skipped or ex_skipped:
+                        st.caption(f"跳过 {len(qa_skipped) + len(ex_skipped)} 个无法读取的文件")
+                    if qa_all is not None and not qa_all.empty:
                         qa_sum = summarize_quality(assess_qa(qa_all))
                         st.write(f"问答对：均分 {qa_sum.get('score_avg',0)}，红色问题比例 {round(qa_sum.get('error_row_ratio',0)*100,2)}%")
-                    if ex_frames:
-                        ex_all = pd.concat(ex_frames, ignore_index=True)
+                    if ex_all is not None and not ex_all.empty:
                         ex_sum = summarize_quality(assess_exercises(ex_all))
                         st.write(f"习题（全部级别）：均分 {ex_sum.get('score_avg',0)}，红色问题比例 {round(ex_sum.get('error_row_ratio',0)*100,2)}%")
                         if "level" in ex_all.columns:
-                            for lev, part in ex_all.groupby("level"):
+                            for lev, part in ex_all.groupby("level", observed=True):
                                 psum = summarize_quality(assess_exercises(part))
                                 st.write(f"{lev}：均分 {psum.get('score_avg',0)}，红色问题比例 {round(psum.get('error_row_ratio',0)*100,2)}%")
         else:
@@ -583,16 +569,21 @@ else:
 
             with st.expander("上传记录与预览"):
                 parsed = list_parsed_datasets(code)
-                for item in parsed:
-                    with st.expander(f"{item['date']} - {item['file']} ({'问答对' if item['type']=='qa' else '习题库'})"):
-                        df = load_csv(item["path"])
-                        meta = {"type": ("问答对" if item["type"] == "qa" else "习题库")}
-                        render_tabs(df, meta, key_prefix=f"manage-{item['path']}")
-                        if st.button("删除", key=f"del-{item['path']}"):
-                            if delete_path(item["path"]):
-                                st.success("已删除")
-                            else:
-                                st.error("删除失败")
+                if parsed:
+                    st.dataframe(pd.DataFrame([
+                        {"上传日期": it["date"], "文件": it["file"], "类型": ("问答对" if it["type"] == "qa" else "习题库"), "级别": it.get("level") or "-"}
+                        for it in parsed
+                    ]), use_container_width=True)
+                item = select_dataset(parsed, key=f"manage-pick-{code}")
+                if item:
+                    df = load_csv(item["path"])
+                    meta = {"type": ("问答对" if item["type"] == "qa" else "习题库"), "path": item["path"], "college": code}
+                    render_tabs(df, meta, key_prefix=f"manage-{item['path']}")
+                    if st.button("删除", key=f"del-{item['path']}"):
+                        if delete_path(item["path"]):
+                            st.success("已删除")
+                        else:
+                            st.error("删除失败")
             with st.expander("账户与登录管理"):
                 with st.form("change_password_form"):
                     ch_username = st.text_input("选择用户名")
@@ -613,15 +604,26 @@ else:
                                 with open(cfg_path, "w", encoding="utf-8") as f:
                                     yaml.safe_dump(data, f, allow_unicode=True)
                                 st.success("已修改密码")
-                from modules.storage import list_logins
-                logs = list_logins(code)
-                if not logs:
+                from modules.logins import query_logins, active_users, LOGIN_PAGE_SIZE
+                daily = active_users("day", code, limit=30)
+                if not daily:
                     st.info("暂无登录记录")
                 else:
-                    for entry in logs:
-                        with st.expander(entry["date"]):
-                            for e in entry["events"]:
-                                st.write(e)
+                    weekly = active_users("week", code, limit=12)
+                    c_day, c_week = st.columns(2)
+                    with c_day:
+                        st.write("日活跃用户（近30天）")
+                        st.bar_chart(pd.DataFrame(daily).set_index("bucket")["users"])
+                    with c_week:
+                        st.write("周活跃用户（近12周）")
+                        st.bar_chart(pd.DataFrame(weekly).set_index("bucket")["users"])
+                    login_page = st.number_input("登录记录页码", min_value=1, value=1, key=f"logins-page-{code}")
+                    events, total = query_logins(code, page=int(login_page))
+                    st.caption(f"共 {total} 条登录记录，每页 {LOGIN_PAGE_SIZE} 条")
+                    if events:
+                        st.dataframe(pd.DataFrame(events).rename(columns={"time": "时间", "college": "学院", "username": "用户名"}), use_container_width=True)
+                    else:
+                        st.info("该页无记录")
 
     elif choice.endswith("测试样例"):
         st.header("测试样例")
@@ -636,7 +638,7 @@ else:
                     chosen_ex_type = None if sel == "自动识别" else sel
                 uploaded = st.file_uploader("上传样例文件", type=["xlsx", "xls", "csv"], key="test_uploader")
                 if uploaded is not None:
-                    meta, df, warnings = parse_uploaded_file(uploaded, upload_type, chosen_ex_type)
+                    meta, df, warnings = parse_uploaded_file_cached(uploaded, upload_type, chosen_ex_type)
                     render_overview(meta)
                     render_warnings(warnings)
                     render_tabs(df, meta, key_prefix="test_sample")
@@ -656,12 +658,16 @@ else:
                     chosen_ex_type = None if sel == "自动识别" else sel
                 uploaded = st.file_uploader("上传数据文件", type=["xlsx", "xls", "csv"], key="admin_upload_uploader")
                 if uploaded is not None:
-                    raw_path = archive_raw_file(uploaded, user_info["college"]) 
-                    meta, df, warnings = parse_uploaded_file(uploaded, upload_type, chosen_ex_type)
+                    meta, df, warnings = parse_uploaded_file_cached(uploaded, upload_type, chosen_ex_type)
                     render_overview(meta)
                     render_warnings(warnings)
                     render_tabs(df, meta, key_prefix="admin_upload_preview")
-                    save_parsed_dataset(df, meta, user_info["college"]) 
+                    # 每个上传（内容 + 类型）只归档、入库一次；预览中的交互引起的重运行不再重复保存
+                    upload_key = (hashlib.sha256(uploaded.getvalue()).hexdigest(), uploaded.name, upload_type, chosen_ex_type)
+                    if st.session_state.get("admin_upload_saved") != upload_key:
+                        archive_raw_file(uploaded, user_info["college"])
+                        save_parsed_dataset(df, meta, user_info["college"])
+                        st.session_state["admin_upload_saved"] = upload_key
             with tab_history:
                 records = list_history(user_info["college"]) 
                 if not records:
@@ -669,20 +675,16 @@ else:
                 else:
                     summaries = []
                     for it in records:
-                        is_qa = it["file"].endswith("_parsed_qa.csv")
-                        is_ex = it["file"].endswith("_parsed_ex.csv")
-                        if is_qa or is_ex:
+                        if it["type"]:
                             df_tmp = load_csv(it["path"])
-                            summaries.append({"上传日期": it["date"], "文件": it["file"], "类型": ("问答对" if is_qa else "习题库"), "条目数": len(df_tmp)})
+                            summaries.append({"上传日期": it["date"], "文件": it["file"], "类型": ("问答对" if it["type"] == "qa" else "习题库"), "条目数": len(df_tmp)})
                     if summaries:
                         st.subheader("上传记录汇总")
                         st.dataframe(pd.DataFrame(summaries), use_container_width=True)
                     for item in records:
-                        is_parsed_qa = item["file"].endswith("_parsed_qa.csv")
-                        is_parsed_ex = item["file"].endswith("_parsed_ex.csv")
-                        if is_parsed_qa or is_parsed_ex:
+                        if item["type"]:
                             df = load_csv(item["path"])
-                            type_name = "问答对" if is_parsed_qa else "习题库"
+                            type_name = "问答对" if item["type"] == "qa" else "习题库"
                             with st.expander(f"{item['date']} - {item['file']} · 类型：{type_name} · 条目：{len(df)}"):
                                 meta = {"type": type_name, "filename": item["file"], "total": len(df)}
                                 render_overview(meta)
@@ -690,8 +692,7 @@ else:
                         else:
                             with st.expander(f"{item['date']} - {item['file']} · 原始文件"):
                                 st.info("原始文件（预览略）")
-                                with open(item["path"], "rb") as fh:
-                                    st.download_button("下载原始文件", fh.read(), file_name=item["file"]) 
+                                st.download_button("下载原始文件", read_raw_bytes(item["path"]), file_name=plain_name(item["file"])) 
             with tab_history_test:
                 records = list_history_tests(user_info["college"]) 
                 if not records:
@@ -699,20 +700,16 @@ else:
                 else:
                     summaries = []
                     for it in records:
-                        is_qa = it["file"].endswith("_parsed_qa.csv")
-                        is_ex = it["file"].endswith("_parsed_ex.csv")
-                        if is_qa or is_ex:
+                        if it["type"]:
                             df_tmp = load_csv(it["path"])
-                            summaries.append({"上传日期": it["date"], "文件": it["file"], "类型": ("问答对" if is_qa else "习题库"), "条目数": len(df_tmp)})
+                            summaries.append({"上传日期": it["date"], "文件": it["file"], "类型": ("问答对" if it["type"] == "qa" else "习题库"), "条目数": len(df_tmp)})
                     if summaries:
                         st.subheader("测试记录汇总")
                         st.dataframe(pd.DataFrame(summaries), use_container_width=True)
                     for item in records:
-                        is_parsed_qa = item["file"].endswith("_parsed_qa.csv")
-                        is_parsed_ex = item["file"].endswith("_parsed_ex.csv")
-                        if is_parsed_qa or is_parsed_ex:
+                        if item["type"]:
                             df = load_csv(item["path"])
-                            type_name = "问答对" if is_parsed_qa else "习题库"
+                            type_name = "问答对" if item["type"] == "qa" else "习题库"
                             with st.expander(f"{item['date']} - {item['file']} · 类型：{type_name} · 条目：{len(df)}"):
                                 meta = {"type": type_name, "filename": item["file"], "total": len(df)}
                                 render_overview(meta)
@@ -720,8 +717,7 @@ else:
                         else:
                             with st.expander(f"{item['date']} - {item['file']} · 原始文件"):
                                 st.info("原始文件（预览略）")
-                                with open(item["path"], "rb") as fh:
-                                    st.download_button("下载原始文件", fh.read(), file_name=item["file"]) 
+                                st.download_button("下载原始文件", read_raw_bytes(item["path"]), file_name=plain_name(item["file"])) 
         else:
             upload_type = st.radio("类型", ["问答对", "习题库"], horizontal=True, key="test_type")
             exercise_types = ["自动识别", "选择题", "填空题", "简答题", "论述题", "案例分析题", "判断题"]
@@ -731,7 +727,7 @@ else:
                 chosen_ex_type = None if sel == "自动识别" else sel
             uploaded = st.file_uploader("上传样例文件", type=["xlsx", "xls", "csv"], key="test_uploader")
             if uploaded is not None:
-                meta, df, warnings = parse_uploaded_file(uploaded, upload_type, chosen_ex_type)
+                meta, df, warnings = parse_uploaded_file_cached(uploaded, upload_type, chosen_ex_type)
                 render_overview(meta)
                 render_warnings(warnings)
                 render_tabs(df, meta, key_prefix="test_sample_non_admin")
@@ -764,37 +760,83 @@ else:
                     frame.to_excel(writer, index=False, sheet_name=name[:31])
             buf.seek(0)
             return buf
-        def _render_download_group(prefix: str, qa_df: pd.DataFrame, ug_df: pd.DataFrame, grad_df: pd.DataFrame):
+        def _build_export_frames(codes: list[str]):
+            # 并发读取；导出不含日期列，单学院导出也不附加学院列
+            drop = ["date"] if len(codes) > 1 else ["date", "college"]
+            qa_df, qa_skipped = load_corpus(colleges=codes, types=["qa"])
+            ex_df, ex_skipped = load_corpus(colleges=codes, types=["ex"])
+            qa_df = pd.DataFrame() if qa_df is None else qa_df.drop(columns=drop)
+            ex_df = pd.DataFrame() if ex_df is None else ex_df.drop(columns=drop)
+            skipped = qa_skipped + ex_skipped
+            if "level" in ex_df.columns:
+                ug_df = ex_df[ex_df["level"].astype(str) == "本科"]
+                grad_df = ex_df[ex_df["level"].astype(str) == "研究生"]
+            else:
+                ug_df = pd.DataFrame()
+                grad_df = pd.DataFrame()
+            return {"qa": qa_df, "ug": ug_df, "grad": grad_df}, skipped
+        export_sheet_names = {"qa": "问答对", "ug": "本科习题库", "grad": "研究生习题库"}
+        def _get_export_bundle(codes: list[str]):
+            # 语料版本未变化时直接复用磁盘上的导出文件
+            version = corpus_version(codes)
+            bundle = load_export_bundle(version)
+            if bundle is None:
+                with st.spinner("正在生成导出文件..."):
+                    # 只缓存合并后的数据表；CSV / Excel / JSONL 在点击下载时才生成
+                    frames, skipped = _build_export_frames(codes)
+                    artifacts = {}
+                    for kind, frame in frames.items():
+                        buf = io.BytesIO()
+                        frame.to_parquet(buf, index=False)
+                        artifacts[f"{kind}.parquet"] = buf.getvalue()
+                    bundle = store_export_bundle(version, artifacts, {"counts": {k: len(v) for k, v in frames.items()},
+                                                                      "skipped": skipped})
+            return bundle
+        def _lazy_artifact(bundle: dict, kind: str, fmt: str):
+            # 供 st.download_button(data=callable) 使用：点击时生成并缓存，之后直接读取
+            def build():
+                frame = pd.read_parquet(bundle["files"][f"{kind}.parquet"])
+                if fmt == "csv":
+                    return frame.to_csv(index=False).encode("utf-8")
+                if fmt == "xlsx":
+                    return _to_excel({export_sheet_names[kind]: frame}).getvalue()
+                return (frame.to_json(orient="records", lines=True, force_ascii=False) if not frame.empty else "").encode("utf-8")
+            return lambda: export_artifact(bundle["version"], f"{kind}.{fmt}", build)
+        def _render_download_group(prefix: str, bundle: dict):
             auth_ok = bool(st.session_state.get("authentication_status"))
+            counts = bundle["meta"].get("counts", {})
+            skipped = bundle["meta"].get("skipped", [])
+            if skipped:
+                st.warning(f"有 {len(skipped)} 个文件无法读取，未包含在导出中：" + "、".join(Path(x["path"]).name for x in skipped))
             sum_cols = st.columns(3)
             with sum_cols[0]:
-                st.metric("问答对条目", f"{len(qa_df)}")
+                st.metric("问答对条目", f"{counts.get('qa', 0)}")
             with sum_cols[1]:
-                st.metric("本科习题条目", f"{len(ug_df)}")
+                st.metric("本科习题条目", f"{counts.get('ug', 0)}")
             with sum_cols[2]:
-                st.metric("研究生习题条目", f"{len(grad_df)}")
+                st.metric("研究生习题条目", f"{counts.get('grad', 0)}")
             cols_dl = st.columns(3)
             if not auth_ok:
                 st.warning("请先登录以下载")
                 return
             with cols_dl[0]:
                 st.markdown("下载所选择学院的问答对")
-                st.caption("CSV / Excel")
-                st.download_button("下载所选择学院的问答对 (CSV)", qa_df.to_csv(index=False).encode("utf-8"), file_name=f"{prefix}_问答对.csv")
-                qa_buf = _to_excel({"问答对": qa_df})
-                st.download_button("下载所选择学院的问答对 (Excel)", qa_buf.getvalue(), file_name=f"{prefix}_问答对.xlsx")
+                st.caption("CSV / Excel / JSONL")
+                st.download_button("下载所选择学院的问答对 (CSV)", _lazy_artifact(bundle, "qa", "csv"), file_name=f"{prefix}_问答对.csv")
+                st.download_button("下载所选择学院的问答对 (Excel)", _lazy_artifact(bundle, "qa", "xlsx"), file_name=f"{prefix}_问答对.xlsx")
+                st.download_button("下载所选择学院的问答对 (JSONL)", _lazy_artifact(bundle, "qa", "jsonl"), file_name=f"{prefix}_问答对.jsonl")
             with cols_dl[1]:
                 st.markdown("下载本科习题库")
-                st.caption("CSV / Excel")
-                st.download_button("下载本科习题库 (CSV)", ug_df.to_csv(index=False).encode("utf-8"), file_name=f"{prefix}_本科_习题库.csv")
-                ug_buf = _to_excel({"本科习题库": ug_df})
-                st.download_button("下载本科习题库 (Excel)", ug_buf.getvalue(), file_name=f"{prefix}_本科_习题库.xlsx")
+                st.caption("CSV / Excel / JSONL")
+                st.download_button("下载本科习题库 (CSV)", _lazy_artifact(bundle, "ug", "csv"), file_name=f"{prefix}_本科_习题库.csv")
+                st.download_button("下载本科习题库 (Excel)", _lazy_artifact(bundle, "ug", "xlsx"), file_name=f"{prefix}_本科_习题库.xlsx")
+                st.download_button("下载本科习题库 (JSONL)", _lazy_artifact(bundle, "ug", "jsonl"), file_name=f"{prefix}_本科_习题库.jsonl")
             with cols_dl[2]:
                 st.markdown("下载研究生习题库")
-                st.caption("CSV / Excel")
-                st.download_button("下载研究生习题库 (CSV)", grad_df.to_csv(index=False).encode("utf-8"), file_name=f"{prefix}_研究生_习题库.csv")
-                grad_buf = _to_excel({"研究生习题库": grad_df})
-                st.download_button("下载研究生习题库 (Excel)", grad_buf.getvalue(), file_name=f"{prefix}_研究生_习题库.xlsx")
+                st.caption("CSV / Excel / JSONL")
+                st.download_button("下载研究生习题库 (CSV)", _lazy_artifact(bundle, "grad", "csv"), file_name=f"{prefix}_研究生_习题库.csv")
+                st.download_button("下载研究生习题库 (Excel)", _lazy_artifact(bundle, "grad", "xlsx"), file_name=f"{prefix}_研究生_习题库.xlsx")
+                st.download_button("下载研究生习题库 (JSONL)", _lazy_artifact(bundle, "grad", "jsonl"), file_name=f"{prefix}_研究生_习题库.jsonl")
         if select_all:
             selected_codes = [code for _, code in filtered_items]
         else:
@@ -806,45 +848,182 @@ else:
             pass
         elif len(selected_codes) == 1:
             code = selected_codes[0]
-            items = list_parsed_datasets(code)
-            qa_frames = []
-            ex_frames = []
-            for it in items:
-                df = load_csv(it["path"])
-                if it["type"] == "qa":
-                    qa_frames.append(df)
-                else:
-                    ex_frames.append(df)
-            qa_df = pd.concat(qa_frames, ignore_index=True) if qa_frames else pd.DataFrame()
-            ex_df = pd.concat(ex_frames, ignore_index=True) if ex_frames else pd.DataFrame()
-            disp = get_college_display(code)
-            if "level" in ex_df.columns:
-                ug_df = ex_df[ex_df["level"].astype(str) == "本科"]
-                grad_df = ex_df[ex_df["level"].astype(str) == "研究生"]
+            _render_download_group(get_college_display(code), _get_export_bundle([code]))
+        else:
+            _render_download_group("所选", _get_export_bundle(selected_codes))
+
+        with st.expander("🗜 合并小文件"):
+            plans = plan_compaction()
+            st.caption(f"同一学院 / 级别 / 题型下的小解析文件达到 {COMPACT_MIN_FILES} 个时合并为一个列式文件，保留来源文件与上传日期；合并过程中读取不受影响")
+            if not plans:
+                st.info("暂无需要合并的分区")
             else:
-                ug_df = pd.DataFrame()
-                grad_df = pd.DataFrame()
-            _render_download_group(disp, qa_df, ug_df, grad_df)
+                st.dataframe(pd.DataFrame([{"分区": p["partition"], "待合并文件": len(p["sources"]), "已有合并文件": p["previous"] is not None}
+                                           for p in plans]), use_container_width=True)
+                if st.button("立即合并", key="compact-run"):
+                    results = compact_parsed()
+                    st.success(f"已合并 {sum(r['files'] for r in results)} 个文件，涉及 {len(results)} 个分区")
+                    skipped = [s for r in results for s in r["skipped"]]
+                    if skipped:
+                        st.warning(f"有 {len(skipped)} 个文件未能合并")
+
+        with st.expander("🕓 语料版本（可复现训练所用语料）"):
+            note = st.text_input("版本说明", key="version-note", placeholder="例如：2025 秋季模型训练")
+            if st.button("创建版本", key="version-create"):
+                v = create_version(note)
+                st.success(f"已创建 {v['id']}：{v['files']} 个文件，{v['rows']} 条（变更文件 {v['changed_files']}，新增数据块 {v['new_blocks']}）")
+                if v["skipped"]:
+                    st.warning(f"有 {len(v['skipped'])} 个文件无法读取，未包含在版本中")
+            versions = list_versions()
+            if versions:
+                st.dataframe(pd.DataFrame(versions)[["id", "created", "note", "files", "rows", "changed_files"]]
+                             .rename(columns={"id": "版本", "created": "创建时间", "note": "说明", "files": "文件数", "rows": "条目", "changed_files": "变更文件"}),
+                             use_container_width=True)
+                ids = [v["id"] for v in versions]
+                vid = st.selectbox("选择版本", ["（未选择）"] + ids[::-1], key="version-pick")
+                if vid in ids:
+                    pos = ids.index(vid)
+                    if pos > 0:
+                        d = diff_versions(ids[pos - 1], vid)
+                        st.caption(f"相对 {ids[pos - 1]}：新增文件 {len(d['added'])}，删除文件 {len(d['removed'])}，变更文件 {len(d['changed'])}；"
+                                   f"新增 {d['rows_added']} 行，删除 {d['rows_removed']} 行")
+                    frames = version_export_frames(vid, selected_codes or None)
+                    vcols = st.columns(3)
+                    for col, (kind, label) in zip(vcols, [("qa", "问答对"), ("ug", "本科习题库"), ("grad", "研究生习题库")]):
+                        with col:
+                            st.download_button(f"下载 {vid} {label} (CSV)", frames[kind].to_csv(index=False).encode("utf-8"),
+                                               file_name=f"{vid}_{label}.csv", key=f"version-dl-{kind}")
+
+    elif choice.endswith("全局检索"):
+        st.header("全局检索")
+        if not search_available():
+            st.error("当前 SQLite 不支持 FTS5 trigram 分词（需 3.34 及以上版本），无法使用全局检索")
         else:
-            all_cols = selected_codes
-            qa_frames = []
-            ex_frames = []
-            for c in all_cols:
-                items = list_parsed_datasets(c)
-                for it in items:
-                    df = load_csv(it["path"])
-                    if it["type"] == "qa":
-                        df["college"] = get_college_display(c)
-                        qa_frames.append(df)
-                    else:
-                        df["college"] = get_college_display(c)
-                        ex_frames.append(df)
-            qa_all = pd.concat(qa_frames, ignore_index=True) if qa_frames else pd.DataFrame()
-            ex_all = pd.concat(ex_frames, ignore_index=True) if ex_frames else pd.DataFrame()
-            if "level" in ex_all.columns:
-                ug_all = ex_all[ex_all["level"].astype(str) == "本科"]
-                grad_all = ex_all[ex_all["level"].astype(str) == "研究生"]
+            if st.button("重建索引", key="search-rebuild"):
+                with st.spinner("正在重建全文索引..."):
+                    res = sync_index(rebuild=True)
+                st.success(f"已重建：{res['files']} 个文件，{res['indexed']} 条")
+            else:
+                # 压缩 / 合并 / 迁移等改写的文件在此按大小与修改时间增量补齐
+                res = sync_index()
+            for sk in res["skipped"]:
+                st.warning(f"未能索引 {sk['path']}：{sk['error']}")
+            stats = index_stats()
+            st.caption(f"索引覆盖 {stats['files']} 个解析文件、{stats['items']} 条语料；多个关键词以空格分隔（同时包含）")
+            cols = get_colleges()
+            disp_map = {get_college_display(c): c for c in cols}
+            c_q, c_col, c_type = st.columns([3, 2, 2])
+            with c_q:
+                q = st.text_input("关键词", key="search-q", placeholder="题干 / 问题 / 答案 / 解析 / 知识点")
+            with c_col:
+                sel_cols = st.multiselect("学院", list(disp_map.keys()), key="search-colleges")
+            with c_type:
+                sel_types = st.multiselect("题型", ["问答对", "选择题", "填空题", "简答题", "论述题", "案例分析题", "判断题"], key="search-types")
+            if q.strip():
+                search_page = st.number_input("页码", min_value=1, value=1, key="search-page")
+                t0 = time.perf_counter()
+                hits, total = search(q, [disp_map[d] for d in sel_cols] or None, sel_types or None, page=int(search_page))
+                st.caption(f"共 {total} 条结果，每页 {SEARCH_PAGE_SIZE} 条，用时 {(time.perf_counter() - t0) * 1000:.1f} ms")
+                if hits:
+                    view = pd.DataFrame(hits)[["college", "level", "exercise_type", "stem", "question", "answer", "analysis", "knowledge", "date", "file", "row"]]
+                    st.dataframe(view.rename(columns={
+                        "college": "学院", "level": "级别", "exercise_type": "题型", "stem": "题干", "question": "问题",
+                        "answer": "答案", "analysis": "解析", "knowledge": "知识点", "date": "日期", "file": "文件", "row": "行号",
+                    }), use_container_width=True)
+                else:
+                    st.info("该页无结果")
+
+    elif choice.endswith("知识点覆盖"):
+        st.header("知识点覆盖")
+        if not search_available():
+            st.error("当前 SQLite 不支持 FTS5 trigram 分词（需 3.34 及以上版本），无法建立知识点索引")
+        else:
+            # 知识点倒排索引随全文索引在保存时增量维护，这里只补齐被改写的文件
+            res = sync_index()
+            for sk in res["skipped"]:
+                st.warning(f"未能索引 {sk['path']}：{sk['error']}")
+            cols = get_colleges()
+            disp_map = {get_college_display(c): c for c in cols}
+            c_col, c_lvl = st.columns(2)
+            with c_col:
+                sel_cols = st.multiselect("学院", list(disp_map.keys()), key="kn-colleges")
+            with c_lvl:
+                sel_levels = st.multiselect("级别", ["本科", "研究生"], key="kn-levels")
+            sel_codes = [disp_map[d] for d in sel_cols] or None
+            ratio = labelled_ratio(sel_codes, sel_levels or None)
+            totals = point_totals(sel_codes, sel_levels or None)
+            n_items = int(ratio["items"].sum()) if not ratio.empty else 0
+            n_labelled = int(ratio["labelled"].sum()) if not ratio.empty else 0
+            m1, m2, m3 = st.columns(3)
+            m1.metric("知识点数", len(totals))
+            m2.metric("已标注条目", f"{n_labelled}/{n_items}")
+            m3.metric("标注率", f"{(n_labelled / n_items * 100) if n_items else 0:.2f}%")
+            if totals.empty:
+                st.info("暂无知识点数据")
             else:
-                ug_all = pd.DataFrame()
-                grad_all = pd.DataFrame()
-            _render_download_group("所选", qa_all, ug_all, grad_all)
+                st.subheader("各学院 / 级别标注情况")
+                st.dataframe(ratio.rename(columns={
+                    "college": "学院", "level": "级别", "items": "条目数", "labelled": "已标注",
+                    "points": "知识点数", "labelled_pct": "标注率(%)",
+                }), use_container_width=True)
+                top_n = st.slider("显示前 N 个知识点", 10, 200, 30, key="kn-top")
+                st.subheader("高频知识点")
+                st.bar_chart(totals.head(top_n).set_index("point")["items"])
+                cov = coverage(sel_codes, sel_levels or None)
+                pivot = cov.pivot_table(index="point", columns="college", values="items", aggfunc="sum", fill_value=0)
+                pivot = pivot.loc[totals["point"].head(top_n)]
+                st.subheader("知识点 × 学院")
+                st.dataframe(pivot, use_container_width=True)
+                st.subheader("按知识点查看条目")
+                point = st.selectbox("知识点", totals["point"].tolist(), key="kn-point")
+                kn_page = st.number_input("页码", min_value=1, value=1, key="kn-page")
+                hits, total = items_for_point(point, sel_codes, page=int(kn_page))
+                st.caption(f"共 {total} 条，每页 {KNOWLEDGE_PAGE_SIZE} 条")
+                if hits:
+                    st.dataframe(pd.DataFrame(hits).rename(columns={
+                        "college": "学院", "level": "级别", "exercise_type": "题型", "stem": "题干/问题",
+                        "knowledge": "知识点", "path": "文件", "row": "行号",
+                    }), use_container_width=True)
+
+    elif choice.endswith("性能分析"):
+        st.header("性能分析")
+        st.caption(f"在侧边栏开启“性能分析模式”（仅当前会话），或设置环境变量 {PROFILE_ENV}=1（所有会话）后，每次页面重运行的耗时与热点函数会记录到 {PROFILE_DIR}")
+        summary = branch_summary()
+        if not summary:
+            st.info("暂无性能记录")
+        else:
+            st.subheader("各页面分支耗时")
+            st.dataframe(pd.DataFrame(summary).rename(columns={
+                "branch": "菜单", "reruns": "重运行次数", "total_ms": "总耗时(ms)",
+                "mean_ms": "平均(ms)", "p95_ms": "P95(ms)", "max_ms": "最大(ms)",
+            }), use_container_width=True)
+            slowest = list_slowest_reruns(20)
+            st.subheader("最慢的重运行")
+            st.dataframe(pd.DataFrame(slowest)[["ts", "branch", "user", "wall_ms", "report"]], use_container_width=True)
+            reports = [r["report"] for r in slowest if r.get("has_report")]
+            if reports:
+                sel_report = st.selectbox("查看热点函数", reports, key="profile_report_sel")
+                report = load_profile_report(sel_report)
+                if report:
+                    st.write(f"{report['branch']} · {report['ts']} · 总耗时 {report['wall_ms']} ms")
+                    c_cum, c_tot = st.columns(2)
+                    with c_cum:
+                        st.caption("按累计耗时 (cumtime)")
+                        st.dataframe(pd.DataFrame(report.get("top_cumulative", [])), use_container_width=True)
+                    with c_tot:
+                        st.caption("按自身耗时 (tottime)")
+                        st.dataframe(pd.DataFrame(report.get("top_tottime", [])), use_container_width=True)
+
+
+if authentication_status:
+    user_info = get_user_info(username)
+    # 性能分析模式：环境变量 APP_PROFILE=1 或管理员侧边栏开关
+    _rerun_profile = None
+    if profiling_enabled(bool(st.session_state.get("profiling_toggle")) and user_info["role"] == "admin"):
+        _rerun_profile = RerunProfile("-", username)
+    try:
+        main(username, user_info, _rerun_profile)
+    finally:
+        # st.stop / st.rerun / 异常中断时同样结束本次分析，避免分析器一直开启
+        if _rerun_profile is not None:
+            _rerun_profile.finish()
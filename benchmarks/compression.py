@@ -0,0 +1,124 @@
+"""Disk footprint vs. read latency of the compression settings for parsed CSVs and raw uploads.
+
+Parsed: a synthetic bank is parsed once, then written and read back through pandas with each
+codec/level (as _write_parsed and load_csv / iter_csv_chunks do). Raw: the upload bytes
+(CSV and multi-sheet workbook) are compressed and read back through read_raw_bytes.
+
+Usage:
+    python -m benchmarks.compression --rows 100k
+    python -m benchmarks.compression --rows 100k --codecs none,gzip:3,zstd:3,zstd:19
+"""
+import argparse
+import json
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import pandas as pd
+
+from benchmarks.corpus import as_upload, generate_csv, generate_workbook, parse_size
+
+BENCH_DIR = Path(__file__).resolve().parent
+RESULTS_PATH = BENCH_DIR / "results" / "compression.json"
+DEFAULT_CODECS = "none,gzip:1,gzip:3,gzip:6,gzip:9,zstd:1,zstd:3,zstd:9"
+
+
+def _codecs(spec: str) -> list[tuple[str, int]]:
+    out = []
+    for item in spec.split(","):
+        codec, _, level = item.strip().partition(":")
+        if codec == "zstd":
+            try:
+                import zstandard  # noqa: F401
+            except ImportError:
+                print(f"跳过 {item}：未安装 zstandard", file=sys.stderr)
+                continue
+        out.append((codec, int(level or 0)))
+    return out
+
+
+def _best(fn, repeat: int) -> float:
+    times = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - t0)
+    return min(times)
+
+
+def parsed_tradeoffs(df: pd.DataFrame, codecs: list[tuple[str, int]], tmp: Path, repeat: int = 3) -> list[dict]:
+    import modules.storage as storage
+
+    rows = []
+    for codec, level in codecs:
+        path = tmp / f"bank_parsed_ex_ug.csv{storage._blob_suffix(codec)}"
+        compression = storage._csv_compression(codec, level)
+        write_s = _best(lambda: df.to_csv(path, index=False, compression=compression), repeat)
+        read_s = _best(lambda: storage.load_csv(str(path)), repeat)
+        chunk_s = _best(lambda: sum(len(c) for c in storage.iter_csv_chunks(str(path))), repeat)
+        rows.append({
+            "codec": codec, "level": level, "bytes": path.stat().st_size,
+            "write_ms": round(write_s * 1000, 1), "read_ms": round(read_s * 1000, 1),
+            "chunked_read_ms": round(chunk_s * 1000, 1),
+        })
+    base = rows[0]["bytes"] if rows and rows[0]["codec"] == "none" else None
+    for r in rows:
+        r["ratio"] = round(base / r["bytes"], 2) if base else None
+    return rows
+
+
+def raw_tradeoffs(data: bytes, name: str, codecs: list[tuple[str, int]], tmp: Path, repeat: int = 3) -> list[dict]:
+    import modules.storage as storage
+
+    rows = []
+    for codec, level in codecs:
+        path = tmp / f"{name}{storage._blob_suffix(codec)}"
+        compress_s = _best(lambda: path.write_bytes(storage._compress(data, codec, level)), repeat)
+        read_s = _best(lambda: storage.read_raw_bytes(str(path)), repeat)
+        rows.append({
+            "codec": codec, "level": level, "bytes": path.stat().st_size,
+            "ratio": round(len(data) / path.stat().st_size, 2),
+            "compress_ms": round(compress_s * 1000, 1), "read_ms": round(read_s * 1000, 1),
+        })
+    return rows
+
+
+def _print(title: str, rows: list[dict]) -> None:
+    print(title)
+    for r in rows:
+        print("  " + "  ".join(f"{k}={v}" for k, v in r.items()))
+
+
+def main(argv: list[str] | None = None) -> int:
+    from modules.parsing import parse_uploaded_file
+
+    parser = argparse.ArgumentParser(description="Disk footprint vs read latency per compression codec/level")
+    parser.add_argument("--rows", default="100k", help="合成语料行数，例如 10k / 100k / 1m")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--codecs", default=DEFAULT_CODECS, help="逗号分隔的 codec:level 列表")
+    parser.add_argument("--repeat", type=int, default=3, help="每项测量重复次数（取最快）")
+    parser.add_argument("--output", default=str(RESULTS_PATH))
+    args = parser.parse_args(argv)
+
+    n = parse_size(args.rows)
+    codecs = _codecs(args.codecs)
+    raw_csv = generate_csv(n, args.seed)
+    raw_xlsx = generate_workbook(min(n, 20_000), args.seed)
+    _, df, _ = parse_uploaded_file(as_upload(raw_csv, "bank.csv"), "习题库")
+    results = {"rows": n}
+    with tempfile.TemporaryDirectory() as tmp:
+        results["parsed_csv"] = parsed_tradeoffs(df, codecs, Path(tmp), args.repeat)
+        results["raw_csv"] = raw_tradeoffs(raw_csv, "bank.csv", codecs, Path(tmp), args.repeat)
+        results["raw_xlsx"] = raw_tradeoffs(raw_xlsx, "bank.xlsx", codecs, Path(tmp), args.repeat)
+    for key in ("parsed_csv", "raw_csv", "raw_xlsx"):
+        _print(key, results[key])
+
+    out = Path(args.output)
+    out.parent.mkdir(parents=True, exist_ok=True)
+    out.write_text(json.dumps(results, ensure_ascii=False, indent=2), encoding="utf-8")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
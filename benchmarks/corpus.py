@@ -0,0 +1,167 @@
+"""Synthetic corpus generator for benchmarks.
+
+Produces raw-upload-like Chinese economics exercises (mixed types, spread A–F
+option columns, multi-sheet workbooks) and populated storage trees.
+"""
+import datetime as dt
+from contextlib import contextmanager
+from io import BytesIO
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+CONCEPTS = [
+    "需求价格弹性", "边际效用", "机会成本", "消费者剩余", "生产者剩余", "边际成本", "规模经济",
+    "完全竞争市场", "垄断竞争", "寡头垄断", "纳什均衡", "外部性", "公共物品", "科斯定理",
+    "国内生产总值", "通货膨胀", "菲利普斯曲线", "IS-LM模型", "货币乘数", "流动性陷阱",
+    "财政政策", "货币政策", "比较优势", "汇率制度", "购买力平价", "利率平价", "资本资产定价模型",
+    "有效市场假说", "期权定价", "久期", "信用利差", "税收归宿", "拉弗曲线", "索洛模型",
+]
+STEM_TEMPLATES = [
+    "关于{c}，下列说法正确的是？",
+    "在{m}条件下，{c}如何影响均衡价格与产量？",
+    "简述{c}的基本含义及其在{m}中的应用。",
+    "{c}的提出者是谁？",
+    "结合{m}的实际案例，分析{c}的政策含义。",
+    "若其他条件不变，{c}上升将导致什么结果？",
+    "请判断：{c}只适用于{m}。",
+    "论述{c}与{c2}之间的关系。",
+]
+MARKETS = ["短期", "长期", "开放经济", "封闭经济", "完全竞争", "不完全竞争", "中国经济转型", "金融危机"]
+OPTION_TEXTS = [
+    "价格上升", "价格下降", "产量不变", "需求曲线右移", "供给曲线左移", "均衡数量增加",
+    "社会福利损失", "无法确定", "利率上升", "汇率贬值", "投资增加", "储蓄减少",
+]
+TYPES = ["选择题", "判断题", "填空题", "简答题", "论述题", "案例分析题"]
+TYPE_WEIGHTS = [0.45, 0.15, 0.15, 0.12, 0.08, 0.05]
+SHEET_NAMES = {
+    "选择题": "单选题", "判断题": "判断题", "填空题": "填空题",
+    "简答题": "简答题", "论述题": "论述题", "案例分析题": "案例分析题",
+}
+SIZES = {"1k": 1_000, "10k": 10_000, "100k": 100_000, "1m": 1_000_000}
+
+
+def parse_size(label: str) -> int:
+    key = label.strip().lower()
+    if key in SIZES:
+        return SIZES[key]
+    for suffix, mult in (("k", 1_000), ("m", 1_000_000)):
+        if key.endswith(suffix):
+            return int(float(key[:-1]) * mult)
+    return int(key)
+
+
+def generate_exercises(n: int, seed: int = 0, error_rate: float = 0.05) -> pd.DataFrame:
+    """Raw exercise rows with Chinese headers and spread A–F option columns."""
+    rng = np.random.default_rng(seed)
+    types = rng.choice(TYPES, size=n, p=TYPE_WEIGHTS)
+    c1 = rng.integers(0, len(CONCEPTS), size=n)
+    c2 = rng.integers(0, len(CONCEPTS), size=n)
+    mk = rng.integers(0, len(MARKETS), size=n)
+    tpl = rng.integers(0, len(STEM_TEMPLATES), size=n)
+    n_opts = rng.integers(4, 7, size=n)  # 4..6 options, spreading into E/F
+    opt_idx = rng.integers(0, len(OPTION_TEXTS), size=(n, 6))
+    ans_letter = rng.integers(0, 4, size=n)
+    judge = rng.integers(0, 2, size=n)
+    missing_kn = rng.random(n) < error_rate
+    bad_ans = rng.random(n) < error_rate / 2
+
+    stems = [
+        STEM_TEMPLATES[tpl[i]].format(c=CONCEPTS[c1[i]], c2=CONCEPTS[c2[i]], m=MARKETS[mk[i]]) + f"（{i + 1}）"
+        for i in range(n)
+    ]
+    letters = "ABCDEF"
+    opt_cols = {k: [""] * n for k in letters}
+    answers = [""] * n
+    analyses = [""] * n
+    for i in range(n):
+        t = types[i]
+        concept = CONCEPTS[c1[i]]
+        if t == "选择题":
+            for j in range(n_opts[i]):
+                opt_cols[letters[j]][i] = OPTION_TEXTS[opt_idx[i, j]]
+            answers[i] = "G" if bad_ans[i] else letters[ans_letter[i]]
+            analyses[i] = f"根据{concept}的定义，选项{letters[ans_letter[i]]}正确。"
+        elif t == "判断题":
+            answers[i] = "正确" if judge[i] else "错误"
+            analyses[i] = f"{concept}并不局限于{MARKETS[mk[i]]}。"
+        elif t == "填空题":
+            answers[i] = concept
+            analyses[i] = f"考查{concept}的基本概念。"
+        else:
+            answers[i] = f"{concept}是指在{MARKETS[mk[i]]}条件下，经济主体面临约束时的最优选择结果，其影响取决于市场结构与政策环境。"
+            analyses[i] = f"作答要点：定义{concept}，说明机制，结合{MARKETS[mk[i]]}举例。"
+    knowledge = ["" if missing_kn[i] else f"{CONCEPTS[c1[i]]}；{CONCEPTS[c2[i]]}" for i in range(n)]
+    df = pd.DataFrame({
+        "序号": np.arange(1, n + 1).astype(str),
+        "题型": types,
+        "题干": stems,
+        **{k: opt_cols[k] for k in letters},
+        "答案": answers,
+        "解析": analyses,
+        "知识点": knowledge,
+    })
+    return df
+
+
+def generate_csv(n: int, seed: int = 0) -> bytes:
+    return generate_exercises(n, seed).to_csv(index=False).encode("utf-8")
+
+
+def generate_workbook(n: int, seed: int = 0) -> bytes:
+    """Multi-sheet workbook with one sheet per exercise type (type column dropped, as teachers usually do)."""
+    df = generate_exercises(n, seed)
+    buf = BytesIO()
+    with pd.ExcelWriter(buf, engine="openpyxl") as writer:
+        for t, part in df.groupby("题型", sort=False):
+            part = part.drop(columns=["题型"])
+            if t != "选择题":
+                part = part.drop(columns=list("ABCDEF"))
+            part.to_excel(writer, index=False, sheet_name=SHEET_NAMES[t])
+    return buf.getvalue()
+
+
+def as_upload(data: bytes, name: str) -> BytesIO:
+    buf = BytesIO(data)
+    buf.name = name
+    return buf
+
+
+@contextmanager
+def use_storage_root(root: Path):
+    """Point modules.storage at a scratch root for the duration of the block (test uploads go to root/_tests)."""
+    import modules.storage as storage
+    orig, orig_test = storage.BASE, storage.BASE_TEST
+    storage.BASE, storage.BASE_TEST = Path(root), Path(root) / "_tests"
+    try:
+        yield Path(root)
+    finally:
+        storage.BASE, storage.BASE_TEST = orig, orig_test
+
+
+def populate_storage(root: Path, n_rows: int, colleges: list[str], files_per_college: int = 20, seed: int = 0) -> int:
+    """Write a parsed corpus of n_rows split across colleges, days and levels through save_split_dataset."""
+    import modules.storage as storage
+    from modules.parsing import parse_uploaded_file
+
+    meta, parsed, _ = parse_uploaded_file(as_upload(generate_csv(n_rows, seed), "bank.csv"), "习题库")
+    parsed = parsed.drop(columns=["quality_score", "quality_flags"], errors="ignore")
+    n_files = max(1, len(colleges) * files_per_college)
+    chunks = np.array_split(np.arange(len(parsed)), n_files)
+    start_day = dt.date(2025, 9, 1)
+    orig_today = storage._today
+    written = 0
+    try:
+        with use_storage_root(root):
+            for k, idx in enumerate(chunks):
+                college = colleges[k % len(colleges)]
+                day = (start_day + dt.timedelta(days=k // len(colleges))).isoformat()
+                storage._today = lambda day=day: day
+                part = parsed.iloc[idx]
+                level = "研究生" if k % 3 == 2 else "本科"
+                part_meta = dict(meta, filename=f"bank{k:04d}.xlsx", level=level)
+                written += sum(p["rows"] for p in storage.save_split_dataset(part, part_meta, college))
+    finally:
+        storage._today = orig_today
+    return written
@@ -0,0 +1,142 @@
+"""Peak-RSS benchmark for the upload pipeline (parse → quality → split → save).
+
+Each measurement runs in a fresh interpreter so peaks do not leak between runs.
+
+Usage:
+    python -m benchmarks.memory --rows 500k
+    python -m benchmarks.memory --rows 500k --compare HEAD~1
+    python -m benchmarks.memory --rows 1m --dtypes
+"""
+import argparse
+import json
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+
+import pandas as pd
+
+from benchmarks.corpus import as_upload, generate_csv, parse_size
+
+BENCH_DIR = Path(__file__).resolve().parent
+REPO_ROOT = BENCH_DIR.parent
+RESULTS_PATH = BENCH_DIR / "results" / "memory.json"
+
+# 子进程脚本只依赖 parse_uploaded_file / save_parsed_dataset，以便在旧版本代码上运行对比
+_CHILD = r"""
+import json, os, resource, sys, tempfile, time
+from io import BytesIO
+from pathlib import Path
+sys.path.insert(0, os.getcwd())
+
+def rss():
+    with open("/proc/self/statm") as f:
+        return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+
+import modules.storage as storage
+from modules.parsing import parse_uploaded_file
+
+buf = BytesIO(Path(sys.argv[1]).read_bytes())
+buf.name = "bank.csv"
+base = rss()
+t0 = time.perf_counter()
+meta, df, _ = parse_uploaded_file(buf, "习题库")
+t1 = time.perf_counter()
+with tempfile.TemporaryDirectory() as d:
+    storage.BASE = Path(d)
+    if hasattr(storage, "save_split_dataset"):
+        storage.save_split_dataset(df, meta, "bench")
+    else:
+        from modules.parsing import split_dataset_by_type
+        for m, part in split_dataset_by_type(df, meta):
+            storage.save_parsed_dataset(part, m, "bench")
+t2 = time.perf_counter()
+peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+print(json.dumps({
+    "rows": len(df),
+    "baseline_mb": round(base / 2**20, 1),
+    "peak_mb": round(peak / 2**20, 1),
+    "pipeline_peak_mb": round((peak - base) / 2**20, 1),
+    "parse_s": round(t1 - t0, 2),
+    "save_s": round(t2 - t1, 2),
+}))
+"""
+
+
+def measure(tree: Path, csv_path: Path) -> dict:
+    out = subprocess.run([sys.executable, "-c", _CHILD, str(csv_path)], cwd=tree,
+                         capture_output=True, text=True, check=True)
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+
+def _worktree(rev: str, dest: Path) -> Path:
+    subprocess.run(["git", "worktree", "add", "--detach", str(dest), rev], cwd=REPO_ROOT,
+                   capture_output=True, check=True)
+    return dest
+
+
+def dtype_footprint(n: int, seed: int = 0) -> dict:
+    """In-memory size of a merged corpus (as merge_all_parsed builds it) under different dtypes."""
+    from modules.dtypes import apply_dtype_policy, text_dtype
+    from modules.parsing import parse_uploaded_file
+
+    _, df, _ = parse_uploaded_file(as_upload(generate_csv(n, seed), "bank.csv"), "习题库")
+    colleges = ["economy", "finance", "intl", "west", "tax", "mgmt"]
+    df = df.assign(
+        college=[colleges[i % len(colleges)] for i in range(len(df))],
+        date=[f"2025-09-{1 + i % 30:02d}" for i in range(len(df))],
+    )
+    text_cols = [c for c, t in df.dtypes.items() if t == object or isinstance(t, pd.StringDtype)]
+    variants = {
+        "object": df.astype({c: object for c in text_cols}),
+        "pyarrow_str": df.astype({c: text_dtype() for c in text_cols}),
+        "policy": apply_dtype_policy(df),
+    }
+    out = {"rows": len(df)}
+    for name, frame in variants.items():
+        out[f"{name}_mb"] = round(frame.memory_usage(deep=True).sum() / 2**20, 1)
+    return out
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description="Peak RSS of the upload pipeline on a synthetic exercise bank")
+    parser.add_argument("--rows", default="500k", help="合成语料行数，例如 100k / 500k / 1m")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--compare", default=None, help="同时测量该 git 版本（临时 worktree）作为对照")
+    parser.add_argument("--dtypes", action="store_true", help="改为测量合并语料在不同 dtype 下的内存占用")
+    parser.add_argument("--output", default=str(RESULTS_PATH))
+    args = parser.parse_args(argv)
+
+    n = parse_size(args.rows)
+    if args.dtypes:
+        res = dtype_footprint(n, args.seed)
+        print(json.dumps(res, ensure_ascii=False))
+        out = Path(args.output).with_name("memory_dtypes.json") if args.output == str(RESULTS_PATH) else Path(args.output)
+        out.parent.mkdir(parents=True, exist_ok=True)
+        out.write_text(json.dumps(res, ensure_ascii=False, indent=2), encoding="utf-8")
+        return 0
+    results = {"rows": n}
+    with tempfile.TemporaryDirectory() as tmp:
+        csv_path = Path(tmp) / "bank.csv"
+        csv_path.write_bytes(generate_csv(n, args.seed))
+        results["current"] = measure(REPO_ROOT, csv_path)
+        print(f"current   {json.dumps(results['current'], ensure_ascii=False)}", flush=True)
+        if args.compare:
+            tree = Path(tmp) / "compare"
+            try:
+                results["compare"] = dict(measure(_worktree(args.compare, tree), csv_path), rev=args.compare)
+            finally:
+                subprocess.run(["git", "worktree", "remove", "--force", str(tree)], cwd=REPO_ROOT, capture_output=True)
+            print(f"{args.compare:<9} {json.dumps(results['compare'], ensure_ascii=False)}")
+            old, new = results["compare"]["pipeline_peak_mb"], results["current"]["pipeline_peak_mb"]
+            if old:
+                print(f"pipeline peak: {old} MB → {new} MB ({round((new - old) / old * 100, 1)}%)")
+
+    out = Path(args.output)
+    out.parent.mkdir(parents=True, exist_ok=True)
+    out.write_text(json.dumps(results, ensure_ascii=False, indent=2), encoding="utf-8")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,265 @@
+"""Benchmark runner for parsing, quality and storage hot paths.
+
+Usage:
+    python -m benchmarks.run --sizes 1k,10k
+    python -m benchmarks.run --sizes 1k,10k --save-baseline
+    python -m benchmarks.run --sizes 100k --only parse,assess --fail-on-regression
+"""
+import argparse
+import json
+import platform
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import pandas as pd
+
+from benchmarks.corpus import (
+    as_upload,
+    generate_csv,
+    generate_workbook,
+    parse_size,
+    populate_storage,
+    use_storage_root,
+)
+from modules.parsing import _read_file, _normalize_exercises, parse_uploaded_file
+from modules.quality import assess_exercises, summarize_quality
+
+BENCH_DIR = Path(__file__).resolve().parent
+BASELINE_PATH = BENCH_DIR / "baseline.json"
+RESULTS_DIR = BENCH_DIR / "results"
+# openpyxl 写入/读取百万行工作簿耗时过长，超过该规模只测 CSV
+XLSX_MAX_ROWS = 100_000
+STORAGE_COLLEGES = ["economy", "finance", "intl", "west", "tax", "mgmt"]
+
+
+class Fixtures:
+    """Lazily built inputs for one corpus size, shared across benchmarks."""
+
+    def __init__(self, n: int, seed: int, workdir: Path):
+        self.n = n
+        self.seed = seed
+        self.workdir = workdir
+        self._cache = {}
+
+    def get(self, key, build):
+        if key not in self._cache:
+            self._cache[key] = build()
+        return self._cache[key]
+
+    @property
+    def csv_bytes(self) -> bytes:
+        return self.get("csv", lambda: generate_csv(self.n, self.seed))
+
+    @property
+    def xlsx_bytes(self) -> bytes:
+        return self.get("xlsx", lambda: generate_workbook(self.n, self.seed))
+
+    @property
+    def raw_frame(self) -> pd.DataFrame:
+        return self.get("raw", lambda: _read_file(as_upload(self.csv_bytes, "bank.csv"))["CSV"])
+
+    @property
+    def normalized(self) -> pd.DataFrame:
+        return self.get("normalized", lambda: _normalize_exercises(self.raw_frame)[0])
+
+    @property
+    def assessed(self) -> pd.DataFrame:
+        return self.get("assessed", lambda: assess_exercises(self.normalized))
+
+    @property
+    def storage_root(self) -> Path:
+        def build():
+            root = self.workdir / f"storage_{self.n}"
+            populate_storage(root, self.n, STORAGE_COLLEGES, seed=self.seed)
+            return root
+        return self.get("storage", build)
+
+
+def bench_read_file_csv(fx: Fixtures):
+    return lambda: _read_file(as_upload(fx.csv_bytes, "bank.csv"))
+
+
+def bench_read_file_xlsx(fx: Fixtures):
+    if fx.n > XLSX_MAX_ROWS:
+        return None
+    data = fx.xlsx_bytes
+    return lambda: _read_file(as_upload(data, "bank.xlsx"))
+
+
+def bench_normalize_exercises(fx: Fixtures):
+    raw = fx.raw_frame
+    return lambda: _normalize_exercises(raw)
+
+
+def bench_parse_csv(fx: Fixtures):
+    return lambda: parse_uploaded_file(as_upload(fx.csv_bytes, "bank.csv"), "习题库")
+
+
+def bench_parse_xlsx(fx: Fixtures):
+    if fx.n > XLSX_MAX_ROWS:
+        return None
+    data = fx.xlsx_bytes
+    return lambda: parse_uploaded_file(as_upload(data, "bank.xlsx"), "习题库")
+
+
+def bench_assess_exercises(fx: Fixtures):
+    df = fx.normalized
+    return lambda: assess_exercises(df)
+
+
+def bench_summarize_quality(fx: Fixtures):
+    df = fx.assessed
+    return lambda: summarize_quality(df)
+
+
+def _with_storage(fx: Fixtures, fn):
+    root = fx.storage_root
+
+    def run():
+        with use_storage_root(root):
+            return fn()
+    return run
+
+
+def bench_list_parsed_datasets(fx: Fixtures):
+    from modules.storage import list_parsed_datasets
+    return _with_storage(fx, lambda: [list_parsed_datasets(c) for c in STORAGE_COLLEGES])
+
+
+def bench_merge_all_parsed(fx: Fixtures):
+    from modules.storage import merge_all_parsed
+    return _with_storage(fx, merge_all_parsed)
+
+
+def bench_stats_aggregation(fx: Fixtures):
+    from modules.stats import summarize_colleges
+    return _with_storage(fx, lambda: summarize_colleges(STORAGE_COLLEGES))
+
+
+def bench_suggest_knowledge(fx: Fixtures):
+    from modules import similarity
+    if not similarity.similarity_available():
+        return None
+    # 整个上传都缺知识点：以同规模语料为近邻库，矩阵加载计入首轮（取最快一轮即缓存命中后的批量建议）
+    upload = fx.assessed.assign(knowledge="")
+    return _with_storage(fx, lambda: similarity.suggest_knowledge(upload))
+
+
+BENCHMARKS = {
+    "read_file_csv": bench_read_file_csv,
+    "read_file_xlsx": bench_read_file_xlsx,
+    "normalize_exercises": bench_normalize_exercises,
+    "parse_csv": bench_parse_csv,
+    "parse_xlsx": bench_parse_xlsx,
+    "assess_exercises": bench_assess_exercises,
+    "summarize_quality": bench_summarize_quality,
+    "list_parsed_datasets": bench_list_parsed_datasets,
+    "merge_all_parsed": bench_merge_all_parsed,
+    "stats_aggregation": bench_stats_aggregation,
+    "suggest_knowledge": bench_suggest_knowledge,
+}
+
+
+def _measure(fn, repeat: int) -> list[float]:
+    times = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - t0)
+    return times
+
+
+def run(sizes: list[str], only: list[str] | None, repeat: int, seed: int) -> dict:
+    results = {}
+    names = [n for n in BENCHMARKS if not only or any(o in n for o in only)]
+    with tempfile.TemporaryDirectory(prefix="bench_") as tmp:
+        for label in sizes:
+            n = parse_size(label)
+            fx = Fixtures(n, seed, Path(tmp))
+            for name in names:
+                fn = BENCHMARKS[name](fx)
+                key = f"{name}@{label.lower()}"
+                if fn is None:
+                    print(f"{key:<36} skipped")
+                    continue
+                times = _measure(fn, repeat)
+                best = min(times)
+                results[key] = {
+                    "rows": n,
+                    "seconds": round(best, 6),
+                    "median": round(statistics.median(times), 6),
+                    "rows_per_s": round(n / best, 1) if best > 0 else None,
+                }
+                print(f"{key:<36} {best:>10.4f}s  {n / best if best else 0:>12.0f} rows/s", flush=True)
+    return results
+
+
+def compare(results: dict, baseline: dict, tolerance: float) -> list[dict]:
+    report = []
+    for key, cur in results.items():
+        base = baseline.get(key)
+        if not base or not base.get("seconds"):
+            continue
+        ratio = cur["seconds"] / base["seconds"]
+        report.append({"benchmark": key, "baseline": base["seconds"], "current": cur["seconds"],
+                       "ratio": round(ratio, 3), "regression": ratio > 1 + tolerance})
+    return report
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.run", description="解析/质检/存储热点基准测试")
+    parser.add_argument("--sizes", default="1k,10k", help="语料规模，逗号分隔：1k,10k,100k,1m")
+    parser.add_argument("--only", default=None, help="仅运行名称包含这些关键字的基准，逗号分隔")
+    parser.add_argument("--repeat", type=int, default=3, help="每项重复次数（取最小值）")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default=str(RESULTS_DIR / "latest.json"), help="结果 JSON 路径")
+    parser.add_argument("--baseline", default=str(BASELINE_PATH), help="对比基线 JSON 路径")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="允许的耗时增幅（0.25 即 25%%）")
+    parser.add_argument("--save-baseline", action="store_true", help="将本次结果写入基线")
+    parser.add_argument("--fail-on-regression", action="store_true", help="存在回退时返回非零退出码")
+    args = parser.parse_args(argv)
+
+    sizes = [s for s in args.sizes.split(",") if s.strip()]
+    only = [s.strip() for s in args.only.split(",")] if args.only else None
+    results = run(sizes, only, max(1, args.repeat), args.seed)
+    payload = {
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "env": {"python": platform.python_version(), "pandas": pd.__version__, "machine": platform.machine()},
+        "results": results,
+    }
+    out = Path(args.output)
+    out.parent.mkdir(parents=True, exist_ok=True)
+    out.write_text(json.dumps(payload, ensure_ascii=False, indent=2), encoding="utf-8")
+    print(f"结果已写入 {out}")
+
+    if args.save_baseline:
+        base_path = Path(args.baseline)
+        merged = {}
+        if base_path.exists():
+            merged = json.loads(base_path.read_text(encoding="utf-8")).get("results", {})
+        merged.update(results)
+        payload["results"] = merged
+        base_path.write_text(json.dumps(payload, ensure_ascii=False, indent=2), encoding="utf-8")
+        print(f"基线已更新 {base_path}")
+        return 0
+
+    base_path = Path(args.baseline)
+    if not base_path.exists():
+        print("未找到基线，跳过对比")
+        return 0
+    baseline = json.loads(base_path.read_text(encoding="utf-8")).get("results", {})
+    report = compare(results, baseline, args.tolerance)
+    regressions = [r for r in report if r["regression"]]
+    for r in report:
+        mark = "REGRESSION" if r["regression"] else "ok"
+        print(f"{r['benchmark']:<36} {r['baseline']:>10.4f}s -> {r['current']:>10.4f}s  x{r['ratio']:<6} {mark}")
+    if regressions:
+        print(f"{len(regressions)} 项基准耗时超过基线 {int(args.tolerance * 100)}%")
+    return 1 if (regressions and args.fail_on_regression) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
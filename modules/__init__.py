@@ -1 +1,6 @@
+import pandas as pd
 
+# 写时复制：切片与 assign 共享底层数据，避免解析/质检/入库链路中的隐式整表复制
+# （pandas 3 起为默认行为，2.x 需显式开启）
+if int(pd.__version__.split(".")[0]) < 3:
+    pd.set_option("mode.copy_on_write", True)
@@ -0,0 +1,221 @@
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+
+import pandas as pd
+
+from modules.parsing import parse_uploaded_file
+from modules.quality import RULES_VERSION
+from modules.storage import list_parsed_datasets
+from modules.tracing import span, start_trace, record_spans
+
+BASE_CACHE = Path("storage_cache")
+EXPORT_CACHE_DIR = BASE_CACHE / "exports"
+# 汇总输出缓存总容量上限（字节），超出后按最近使用时间淘汰
+EXPORT_CACHE_MAX_BYTES = int(os.environ.get("EXPORT_CACHE_MAX_BYTES", 512 * 1024 * 1024))
+# 导出格式变化时递增，使旧缓存全部失效
+EXPORT_FORMAT_VERSION = "2"
+_BUNDLE_META = "_meta.json"
+# 解析结果内存缓存上限（字节，按 DataFrame 深度内存估算），进程内所有会话共享
+PARSE_CACHE_MAX_BYTES = int(os.environ.get("PARSE_CACHE_MAX_BYTES", 256 * 1024 * 1024))
+
+
+def corpus_version(colleges: list[str]) -> str:
+    """Hash the parsed-dataset entries (path, size, mtime) of the given colleges."""
+    h = hashlib.sha256(f"export-v{EXPORT_FORMAT_VERSION}\n".encode("utf-8"))
+    for code in sorted(colleges):
+        h.update(f"#{code}\n".encode("utf-8"))
+        for it in sorted(list_parsed_datasets(code), key=lambda x: x["path"]):
+            try:
+                st = Path(it["path"]).stat()
+            except OSError:
+                continue
+            h.update(f"{it['path']}\t{st.st_size}\t{st.st_mtime_ns}\n".encode("utf-8"))
+    return h.hexdigest()[:20]
+
+
+def _bundle_dir(version: str) -> Path:
+    return EXPORT_CACHE_DIR / version
+
+
+def load_export_bundle(version: str) -> dict | None:
+    """Return {"version", "meta": dict, "files": {name: Path}} for a complete cached bundle, else None."""
+    d = _bundle_dir(version)
+    meta_path = d / _BUNDLE_META
+    if not meta_path.exists():
+        return None
+    try:
+        with open(meta_path, "r", encoding="utf-8") as f:
+            meta = json.load(f)
+    except Exception:
+        return None
+    files = {}
+    for name in meta.get("files", []):
+        p = d / name
+        if not p.exists():
+            return None
+        files[name] = p
+    # 记录最近使用时间，供淘汰策略参考
+    try:
+        os.utime(meta_path, None)
+    except OSError:
+        pass
+    return {"version": version, "meta": meta, "files": files}
+
+
+def store_export_bundle(version: str, artifacts: dict[str, bytes], meta: dict | None = None) -> dict:
+    """Write artifacts under the version key; the meta file is written last and marks the bundle complete."""
+    d = _bundle_dir(version)
+    for name, data in artifacts.items():
+        _write_artifact(d / name, data)
+    info = dict(meta or {})
+    info["files"] = list(artifacts.keys())
+    info["created"] = time.time()
+    _write_artifact(d / _BUNDLE_META, json.dumps(info, ensure_ascii=False).encode("utf-8"))
+    evict_export_cache(keep=version)
+    return {"version": version, "meta": info, "files": {name: d / name for name in artifacts}}
+
+
+def _write_artifact(path: Path, data: bytes):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    # 每个写入方使用独立的临时文件：多个会话同时生成同一文件时不会交错写入
+    fd, tmp = tempfile.mkstemp(prefix=f".{path.name}.", suffix=".tmp", dir=path.parent)
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(tmp, path)
+    except BaseException:
+        Path(tmp).unlink(missing_ok=True)
+        raise
+
+
+def export_artifact(version: str, name: str, build) -> bytes:
+    """Bytes of a derived artifact of a bundle; build() runs only on first request, the result is cached beside the bundle."""
+    path = _bundle_dir(version) / name
+    try:
+        return path.read_bytes()
+    except OSError:
+        pass
+    data = build()
+    _write_artifact(path, data)
+    return data
+
+
+def _dir_size(d: Path) -> int:
+    total = 0
+    for p in d.rglob("*"):
+        try:
+            if p.is_file():
+                total += p.stat().st_size
+        except OSError:
+            pass
+    return total
+
+
+def evict_export_cache(max_bytes: int | None = None, keep: str | None = None) -> list[str]:
+    """Remove least recently used bundles until the cache fits in max_bytes."""
+    limit = EXPORT_CACHE_MAX_BYTES if max_bytes is None else max_bytes
+    if not EXPORT_CACHE_DIR.exists():
+        return []
+    bundles = []
+    for d in EXPORT_CACHE_DIR.iterdir():
+        if not d.is_dir():
+            continue
+        meta_path = d / _BUNDLE_META
+        try:
+            last_used = meta_path.stat().st_mtime if meta_path.exists() else d.stat().st_mtime
+        except OSError:
+            continue
+        bundles.append((last_used, d.name, _dir_size(d)))
+    total = sum(b[2] for b in bundles)
+    removed = []
+    for _, name, size in sorted(bundles):
+        if total <= limit:
+            break
+        if name == keep:
+            continue
+        shutil.rmtree(EXPORT_CACHE_DIR / name, ignore_errors=True)
+        total -= size
+        removed.append(name)
+    return removed
+
+
+class ParseCache:
+    """Process-wide LRU of parse results, bounded by the estimated memory of the cached frames."""
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self._items: OrderedDict = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            item = self._items.get(key)
+            if item is None:
+                return None
+            self._items.move_to_end(key)
+            return item[0]
+
+    def put(self, key, value, size: int):
+        with self._lock:
+            if key in self._items:
+                self._bytes -= self._items.pop(key)[1]
+            if size > self.max_bytes:
+                return
+            self._items[key] = (value, size)
+            self._bytes += size
+            while self._bytes > self.max_bytes and self._items:
+                _, (_, old_size) = self._items.popitem(last=False)
+                self._bytes -= old_size
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+            self._bytes = 0
+
+    @property
+    def nbytes(self) -> int:
+        return self._bytes
+
+    def __len__(self):
+        return len(self._items)
+
+
+_parse_cache = ParseCache(PARSE_CACHE_MAX_BYTES)
+
+
+def _upload_bytes(uploaded_file) -> bytes:
+    if hasattr(uploaded_file, "getvalue"):
+        return uploaded_file.getvalue()
+    data = uploaded_file.read()
+    uploaded_file.seek(0)
+    return data
+
+
+def parse_uploaded_file_cached(uploaded_file, upload_type: str, exercise_type: str | None = None, exercise_level: str | None = None):
+    """parse_uploaded_file memoized on (content hash, name, upload type, exercise type, level, rules version).
+
+    The returned DataFrame is shared between reruns and must not be modified in place.
+    """
+    with span("parse_cache_lookup") as rec:
+        digest = hashlib.sha256(_upload_bytes(uploaded_file)).hexdigest()
+        key = (digest, uploaded_file.name, upload_type, exercise_type, exercise_level, RULES_VERSION)
+        hit = _parse_cache.get(key)
+        rec["hit"] = hit is not None
+    if hit is not None:
+        meta, df, warnings = hit
+        return dict(meta, parse_cached=True), df, list(warnings)
+    with start_trace("parse") as tracer:
+        meta, df, warnings = parse_uploaded_file(uploaded_file, upload_type, exercise_type, exercise_level)
+    record_spans(tracer.records())
+    meta["parse_perf"] = tracer.records()
+    size = int(df.memory_usage(deep=True).sum()) if isinstance(df, pd.DataFrame) else 0
+    _parse_cache.put(key, (meta, df, list(warnings)), size)
+    return dict(meta), df, warnings
@@ -0,0 +1,416 @@
+import argparse
+import hashlib
+import os
+import sys
+import time
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from io import BytesIO
+from pathlib import Path
+
+from modules.parsing import parse_uploaded_file
+from modules.quality import QUALITY_ERROR_RATIO_THRESHOLD
+from modules.storage import archive_raw_file, save_split_dataset
+from modules.tracing import start_trace, log_upload
+
+SUPPORTED_SUFFIXES = (".xlsx", ".xls", ".csv")
+
+
+def _collect_files(paths: list[str]) -> list[Path]:
+    files, seen = [], set()
+    for raw in paths:
+        p = Path(raw)
+        if p.is_dir():
+            found = sorted(f for f in p.rglob("*") if f.is_file() and f.suffix.lower() in SUPPORTED_SUFFIXES)
+        elif p.is_file() and p.suffix.lower() in SUPPORTED_SUFFIXES:
+            found = [p]
+        else:
+            found = []
+        # 同一文件经不同参数重复给出时只导入一次
+        for f in found:
+            if f.resolve() not in seen:
+                seen.add(f.resolve())
+                files.append(f)
+    return files
+
+
+def _upload_names(files: list[Path]) -> dict[Path, str]:
+    """Upload name per file: its base name, plus a suffix from its path when several files share that name.
+
+    Files with the same name would otherwise be saved to the same parsed file (same college, date
+    and partition), and later ones would overwrite earlier ones.
+    """
+    counts = Counter(f.name for f in files)
+    names = {}
+    for f in files:
+        if counts[f.name] > 1:
+            tag = hashlib.sha1(str(f.resolve()).encode("utf-8")).hexdigest()[:8]
+            names[f] = f"{f.stem}-{tag}{f.suffix}"
+        else:
+            names[f] = f.name
+    return names
+
+
+def _open_upload(path: Path, name: str | None = None) -> BytesIO:
+    # 模拟 Streamlit UploadedFile：提供 name / getvalue / getbuffer
+    buf = BytesIO(path.read_bytes())
+    buf.name = name or path.name
+    return buf
+
+
+def _ingest_one(path: str, college: str, upload_type: str, exercise_type: str | None, level: str | None,
+                max_error_ratio: float, dry_run: bool, force: bool, upload_name: str | None = None) -> dict:
+    start = time.perf_counter()
+    result = {"file": path, "status": "error", "rows": 0, "saved": 0, "quality": None, "message": "", "seconds": 0.0}
+    if upload_name and upload_name != Path(path).name:
+        result["saved_as"] = upload_name
+    try:
+        upload = _open_upload(Path(path), upload_name)
+        with start_trace("parse") as parse_trace:
+            meta, df, warnings = parse_uploaded_file(upload, upload_type, exercise_type, level)
+        qs = meta.get("quality_summary") or {}
+        result["rows"] = len(df)
+        result["quality"] = qs
+        result["warnings"] = len(warnings)
+        err_ratio = float(qs.get("error_row_ratio", 0.0))
+        if df.empty:
+            result["status"] = "empty"
+        elif err_ratio > max_error_ratio and not force:
+            result["status"] = "gated"
+            result["message"] = f"质量错误占比 {round(err_ratio*100, 2)}% 超过阈值 {round(max_error_ratio*100, 2)}%"
+        elif dry_run:
+            result["status"] = "dry-run"
+        else:
+            with start_trace("save") as save_trace:
+                archive_raw_file(upload, college)
+                partitions = save_split_dataset(df, meta, college)
+                result["saved"] = sum(p["rows"] for p in partitions)
+                result["partitions"] = partitions
+            log_upload(college, meta.get("filename", "-"), len(df),
+                       {"parse": parse_trace.records(), "save": save_trace.records()}, {"source": "cli"})
+            result["status"] = "saved"
+    except Exception as e:
+        result["message"] = str(e)
+    result["seconds"] = time.perf_counter() - start
+    return result
+
+
+def _format_result(r: dict) -> str:
+    q = r.get("quality") or {}
+    line = (
+        f"[{r['status']}] {r['file']}  rows={r['rows']}  saved={r['saved']}  "
+        f"score={q.get('score_avg', 0)}  error_ratio={round(float(q.get('error_row_ratio', 0.0))*100, 2)}%  "
+        f"{r['seconds']:.2f}s"
+    )
+    if q.get("errors"):
+        line += "  errors=" + ",".join(f"{k}:{v}" for k, v in sorted(q["errors"].items(), key=lambda kv: -kv[1]))
+    if r.get("saved_as"):
+        line += f"  同名文件，保存为 {r['saved_as']}"
+    if r.get("message"):
+        line += f"  {r['message']}"
+    return line
+
+
+def cmd_ingest(args) -> int:
+    files = _collect_files(args.paths)
+    names = _upload_names(files)
+    if not files:
+        print("未找到可导入的文件 (.xlsx/.xls/.csv)", file=sys.stderr)
+        return 1
+    if args.type == "问答对":
+        upload_type, level = "问答对", None
+    else:
+        upload_type, level = "习题库", args.level
+    workers = max(1, args.workers or os.cpu_count() or 1)
+    job_args = (args.college, upload_type, args.exercise_type, level, args.max_error_ratio, args.dry_run, args.force)
+
+    start = time.perf_counter()
+    results = []
+    if workers == 1 or len(files) == 1:
+        for f in files:
+            r = _ingest_one(str(f), *job_args, upload_name=names[f])
+            print(_format_result(r), flush=True)
+            results.append(r)
+    else:
+        with ProcessPoolExecutor(max_workers=min(workers, len(files))) as pool:
+            futures = [pool.submit(_ingest_one, str(f), *job_args, upload_name=names[f]) for f in files]
+            for fut in as_completed(futures):
+                r = fut.result()
+                print(_format_result(r), flush=True)
+                results.append(r)
+    elapsed = max(time.perf_counter() - start, 1e-9)
+
+    rows = sum(r["rows"] for r in results)
+    by_status = {}
+    for r in results:
+        by_status[r["status"]] = by_status.get(r["status"], 0) + 1
+    print(
+        f"共 {len(results)} 个文件，{rows} 条，用时 {elapsed:.2f}s，"
+        f"吞吐 {len(results)/elapsed:.2f} 文件/s，{rows/elapsed:.0f} 条/s；"
+        + "，".join(f"{k}={v}" for k, v in sorted(by_status.items()))
+    )
+    return 1 if any(r["status"] in ("error", "gated") for r in results) else 0
+
+
+def cmd_snapshot(args) -> int:
+    from modules.snapshot import compact_snapshot, load_manifest, rebuild_snapshot, sync_snapshot
+
+    start = time.perf_counter()
+    skipped = rebuild_snapshot() if args.rebuild else sync_snapshot()
+    if args.compact and not args.rebuild:
+        for key, r in compact_snapshot().items():
+            print(f"{key}: {r['segments_before']} 段 → 1 段，{r['rows']} 条")
+    for s in skipped:
+        print(f"跳过 {s['path']}：{s['error']}", file=sys.stderr)
+    m = load_manifest()
+    for key, ds in sorted(m["datasets"].items()):
+        rows = sum(seg["rows"] for seg in ds["segments"])
+        print(f"{key}: {len(ds['segments'])} 段，{rows} 行（含待清理 {len(ds['tombstones'])} 个删除标记）")
+    print(f"来源文件 {len(m['sources'])} 个，用时 {time.perf_counter() - start:.2f}s")
+    return 1 if skipped else 0
+
+
+def cmd_search(args) -> int:
+    from modules import search
+
+    if not search.search_available():
+        print("当前 SQLite 不支持 FTS5 trigram 分词（需 3.34 及以上版本）", file=sys.stderr)
+        return 1
+    start = time.perf_counter()
+    res = search.sync_index(rebuild=args.rebuild)
+    for s in res["skipped"]:
+        print(f"跳过 {s['path']}：{s['error']}", file=sys.stderr)
+    stats = search.index_stats()
+    print(f"重新索引 {res['files']} 个文件（{res['indexed']} 条），移除 {res['removed']} 条；"
+          f"索引共 {stats['files']} 个文件、{stats['items']} 条，用时 {time.perf_counter() - start:.2f}s")
+    if args.query:
+        start = time.perf_counter()
+        rows, total = search.search(" ".join(args.query), page=args.page)
+        for r in rows:
+            text = (r["stem"] or r["question"] or "").replace("\n", " ")
+            print(f"[{r['college']}/{r['exercise_type']}] {text[:60]}  ({r['path']}#{r['row']})")
+        print(f"共 {total} 条结果，第 {args.page} 页，用时 {(time.perf_counter() - start) * 1000:.1f} ms")
+    return 1 if res["skipped"] else 0
+
+
+def cmd_similar(args) -> int:
+    from modules import similarity
+
+    if not similarity.similarity_available():
+        print("未安装 scipy，无法构建相似题矩阵", file=sys.stderr)
+        return 1
+    start = time.perf_counter()
+    res = similarity.sync_similarity(rebuild=args.rebuild)
+    for s in res["skipped"]:
+        print(f"跳过 {s['path']}：{s['error']}", file=sys.stderr)
+    print(f"重新向量化 {res['files']} 个文件（{res['indexed']} 条），移除 {res['removed']} 条，"
+          f"用时 {time.perf_counter() - start:.2f}s")
+    if args.text:
+        start = time.perf_counter()
+        for r in similarity.similar_items(" ".join(args.text), args.k):
+            print(f"{r['score']:.3f}  [{r['college']}/{r['exercise_type']}] {(r['stem'] or '')[:60]}  ({r['src']}#{r['row']})")
+        print(f"用时 {(time.perf_counter() - start) * 1000:.1f} ms")
+    return 1 if res["skipped"] else 0
+
+
+def cmd_knowledge(args) -> int:
+    from modules import knowledge, search
+
+    if not search.search_available():
+        print("当前 SQLite 不支持 FTS5 trigram 分词（需 3.34 及以上版本）", file=sys.stderr)
+        return 1
+    res = search.sync_index()
+    for s in res["skipped"]:
+        print(f"跳过 {s['path']}：{s['error']}", file=sys.stderr)
+    start = time.perf_counter()
+    colleges = args.college or None
+    if args.point:
+        rows, total = knowledge.items_for_point(args.point, colleges, page=args.page)
+        for r in rows:
+            print(f"[{r['college']}/{r['level'] or '-'}/{r['exercise_type']}] {(r['stem'] or '').replace(chr(10), ' ')[:60]}  ({r['path']}#{r['row']})")
+        print(f"共 {total} 条，第 {args.page} 页，用时 {(time.perf_counter() - start) * 1000:.1f} ms")
+        return 0
+    for r in knowledge.labelled_ratio(colleges).itertuples():
+        print(f"{r.college}/{r.level or '-'}：{r.labelled}/{r.items} 条已标注（{r.labelled_pct}%），{r.points} 个知识点")
+    for r in knowledge.point_totals(colleges, limit=args.top).itertuples():
+        print(f"{r.items:>6}  {r.colleges} 个学院  {r.point}")
+    print(f"用时 {(time.perf_counter() - start) * 1000:.1f} ms")
+    return 1 if res["skipped"] else 0
+
+
+def cmd_versions(args) -> int:
+    from modules import versions
+
+    if args.action == "create":
+        v = versions.create_version(args.note or "")
+        print(f"{v['id']}：{v['files']} 个文件，{v['rows']} 条；变更文件 {v['changed_files']}，新增数据块 {v['new_blocks']}")
+        for s in v["skipped"]:
+            print(f"跳过 {s['path']}：{s['error']}", file=sys.stderr)
+        return 1 if v["skipped"] else 0
+    if args.action == "list":
+        for v in versions.list_versions():
+            print(f"{v['id']}  {v['created']}  {v['files']} 个文件  {v['rows']} 条  {v.get('note', '')}")
+        return 0
+    if args.action == "diff":
+        if len(args.ids) != 2:
+            print("diff 需要两个版本号，例如 versions diff v0001 v0002", file=sys.stderr)
+            return 2
+        d = versions.diff_versions(*args.ids)
+        for src in d["added"]:
+            print(f"+ {src}")
+        for src in d["removed"]:
+            print(f"- {src}")
+        for c in d["changed"]:
+            print(f"~ {c['path']}  +{c['rows_added']} / -{c['rows_removed']} 行")
+        print(f"{d['from']} → {d['to']}：新增 {d['rows_added']} 行，删除 {d['rows_removed']} 行")
+        return 0
+    if args.action == "export":
+        if len(args.ids) != 1:
+            print("export 需要一个版本号", file=sys.stderr)
+            return 2
+        for p in versions.export_version(args.ids[0], args.out, args.college or None):
+            print(p)
+        return 0
+    if args.action == "deleted":
+        for e in versions.list_deleted():
+            print(f"{e['deleted_at']}  {e['path']}  ({e['size']} B)")
+        return 0
+    if args.action == "restore":
+        entries = {e["path"]: e for e in versions.list_deleted()}
+        missing = [p for p in args.ids if p not in entries]
+        for p in args.ids:
+            if p in entries:
+                print(versions.restore_deleted(entries[p]))
+        for p in missing:
+            print(f"没有该文件的删除记录：{p}", file=sys.stderr)
+        return 1 if missing else 0
+    return 2
+
+
+def cmd_compact(args) -> int:
+    from modules.compaction import compact_parsed
+
+    start = time.perf_counter()
+    results = compact_parsed(is_test=args.tests, small_bytes=args.small_bytes, min_files=args.min_files,
+                             dry_run=args.dry_run)
+    for r in results:
+        if args.dry_run:
+            print(f"{r['partition']}: {r['files']} 个小文件待合并")
+        else:
+            print(f"{r['partition']}: 合并 {r['files']} 个文件 → {r['file'] or '-'}（{r['rows']} 行）")
+        for s in r["skipped"]:
+            print(f"跳过 {s['path']}：{s['error']}", file=sys.stderr)
+    prefix = "（预览）" if args.dry_run else ""
+    print(f"{prefix}{len(results)} 个分区，用时 {time.perf_counter() - start:.2f}s")
+    return 1 if any(r["skipped"] for r in results) else 0
+
+
+def cmd_compress(args) -> int:
+    import modules.storage as storage
+
+    if args.codec:
+        storage.PARSED_COMPRESSION = args.codec
+    if args.level is not None:
+        storage.PARSED_COMPRESSION_LEVEL = args.level
+    files = storage.compress_parsed(is_test=args.tests, dry_run=args.dry_run)
+    before = sum(f["before"] for f in files)
+    after = sum(f["after"] for f in files)
+    for f in files:
+        print(f"{f['from']} → {Path(f['to']).name}  {f['before']} B → {f['after']} B")
+    prefix = "（预览）" if args.dry_run else ""
+    print(f"{prefix}重写 {len(files)} 个解析文件：{before / 2**20:.2f} MB → {after / 2**20:.2f} MB"
+          f"（压缩方式 {storage._parsed_codec()}，级别 {storage.PARSED_COMPRESSION_LEVEL}）")
+    return 0
+
+
+def cmd_migrate_layout(args) -> int:
+    from modules.storage import migrate_layout
+
+    moves = migrate_layout(is_test=args.tests, dry_run=args.dry_run)
+    labels = {"moved": "移动", "renamed": "改名移动", "duplicate": "重复，删除旧文件"}
+    for m in moves:
+        print(f"[{labels[m['status']]}] {m['from']} → {m['to']}")
+    prefix = "（预览）" if args.dry_run else ""
+    print(f"{prefix}共 {len(moves)} 个解析文件迁移到分区目录")
+    return 0
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(prog="python -m modules.cli", description="语料平台命令行工具")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p_ingest = sub.add_parser("ingest", help="批量解析并入库文件或目录")
+    p_ingest.add_argument("paths", nargs="+", help="文件或目录（递归查找 .xlsx/.xls/.csv）")
+    p_ingest.add_argument("--college", required=True, help="学院代码，例如 finance")
+    p_ingest.add_argument("--type", choices=["习题库", "问答对"], default="习题库", help="上传类型")
+    p_ingest.add_argument("--level", choices=["本科", "研究生"], default="本科", help="习题级别")
+    p_ingest.add_argument("--exercise-type", default=None,
+                          choices=["选择题", "填空题", "简答题", "论述题", "案例分析题", "判断题"],
+                          help="指定题型（默认自动识别）")
+    p_ingest.add_argument("--max-error-ratio", type=float, default=QUALITY_ERROR_RATIO_THRESHOLD,
+                          help="Error 行占比上限，超过则不入库（默认与界面阈值一致）")
+    p_ingest.add_argument("--force", action="store_true", help="忽略质量门槛强制入库")
+    p_ingest.add_argument("--dry-run", action="store_true", help="仅解析与质检，不写入存储")
+    p_ingest.add_argument("--workers", type=int, default=None, help="并行进程数（默认 CPU 核数）")
+    p_ingest.set_defaults(func=cmd_ingest)
+
+    p_snap = sub.add_parser("snapshot", help="同步 / 压实合并语料快照（storage/_corpus）")
+    p_snap.add_argument("--compact", action="store_true", help="同步后压实：每个数据集重写为单个分段并清理删除标记")
+    p_snap.add_argument("--rebuild", action="store_true", help="删除快照并从解析结果完整重建")
+    p_snap.set_defaults(func=cmd_snapshot)
+
+    p_search = sub.add_parser("search-index", help="同步 / 重建全文检索索引（storage/_search），可附带查询")
+    p_search.add_argument("query", nargs="*", help="同步后执行的检索关键词（空格分隔，同时包含）")
+    p_search.add_argument("--rebuild", action="store_true", help="清空索引并从解析结果完整重建")
+    p_search.add_argument("--page", type=int, default=1, help="结果页码")
+    p_search.set_defaults(func=cmd_search)
+
+    p_sim = sub.add_parser("similar-index", help="同步 / 重建相似题 TF-IDF 矩阵（storage/_similar），可附带查询题干")
+    p_sim.add_argument("text", nargs="*", help="同步后查询与该题干最相似的条目")
+    p_sim.add_argument("--rebuild", action="store_true", help="删除全部矩阵并从解析结果重新向量化")
+    p_sim.add_argument("-k", type=int, default=5, help="返回条数")
+    p_sim.set_defaults(func=cmd_similar)
+
+    p_kn = sub.add_parser("knowledge", help="知识点覆盖统计（基于 storage/_search 中的知识点倒排索引）")
+    p_kn.add_argument("point", nargs="?", help="列出带该知识点的条目")
+    p_kn.add_argument("--college", action="append", help="学院代码，可重复")
+    p_kn.add_argument("--top", type=int, default=20, help="显示条目最多的前 N 个知识点")
+    p_kn.add_argument("--page", type=int, default=1, help="结果页码")
+    p_kn.set_defaults(func=cmd_knowledge)
+
+    p_ver = sub.add_parser("versions", help="语料版本：创建 / 列出 / 对比 / 导出，查看与恢复已删除文件")
+    p_ver.add_argument("action", choices=["create", "list", "diff", "export", "deleted", "restore"])
+    p_ver.add_argument("ids", nargs="*", help="版本号（diff 两个，export 一个）或 restore 的文件路径（相对 storage/）")
+    p_ver.add_argument("--note", default=None, help="版本说明，例如训练任务名")
+    p_ver.add_argument("--out", default="exports", help="export 输出目录")
+    p_ver.add_argument("--college", action="append", help="export 仅导出指定学院（可重复）")
+    p_ver.set_defaults(func=cmd_versions)
+
+    p_cmp = sub.add_parser("compact", help="把各学院 / 级别 / 题型分区下的小解析文件合并为 Parquet 文件")
+    p_cmp.add_argument("--dry-run", action="store_true", help="只列出待合并的分区")
+    p_cmp.add_argument("--min-files", type=int, default=None, help="分区内小文件达到该数量才合并（默认 COMPACT_MIN_FILES）")
+    p_cmp.add_argument("--small-bytes", type=int, default=None, help="小于该字节数的文件视为小文件（默认 COMPACT_SMALL_BYTES）")
+    p_cmp.add_argument("--tests", action="store_true", help="合并测试存储（storage_tests）")
+    p_cmp.set_defaults(func=cmd_compact)
+
+    p_zip = sub.add_parser("compress", help="按 PARSED_COMPRESSION 重写已存储的解析结果 CSV")
+    p_zip.add_argument("--codec", choices=["none", "gzip", "zstd"], default=None, help="覆盖 PARSED_COMPRESSION")
+    p_zip.add_argument("--level", type=int, default=None, help="覆盖 PARSED_COMPRESSION_LEVEL")
+    p_zip.add_argument("--dry-run", action="store_true", help="只估算压缩后大小，不改写文件")
+    p_zip.add_argument("--tests", action="store_true", help="处理测试存储（storage_tests）")
+    p_zip.set_defaults(func=cmd_compress)
+
+    p_mig = sub.add_parser("migrate-layout", help="把旧目录（学院/日期/）下的解析结果迁移到分区目录 storage/parsed/")
+    p_mig.add_argument("--dry-run", action="store_true", help="只列出迁移计划，不移动文件")
+    p_mig.add_argument("--tests", action="store_true", help="迁移测试存储（storage_tests）")
+    p_mig.set_defaults(func=cmd_migrate_layout)
+    return parser
+
+
+def main(argv: list[str] | None = None) -> int:
+    args = build_parser().parse_args(argv)
+    return args.func(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,206 @@
+"""Compaction of small parsed files under <storage>/parsed.
+
+Within each college=/level=/type= partition, small CSVs (and the previous compacted file)
+are merged into one Parquet file under date=__HIVE_DEFAULT_PARTITION__; every row keeps its
+source file and upload date in provenance columns. The partition's entry in the compaction
+manifest is swapped atomically before any absorbed file is deleted, so readers see either
+the old files or the new compacted file.
+"""
+import os
+import threading
+from pathlib import Path
+
+import pandas as pd
+
+import modules.storage as storage
+from modules.dtypes import apply_dtype_policy, concat_frames
+from modules.tracing import span
+
+# 小于该字节数的解析文件参与合并
+COMPACT_SMALL_BYTES = int(os.environ.get("COMPACT_SMALL_BYTES", 1024 * 1024))
+# 分区内小文件达到该数量才合并
+COMPACT_MIN_FILES = int(os.environ.get("COMPACT_MIN_FILES", 4))
+COMPACTED_PREFIX = "compacted"
+_lock = threading.Lock()
+
+
+def _root(is_test: bool) -> Path:
+    return storage._parsed_root(is_test)
+
+
+def _partition_of(path: str, root: Path) -> str:
+    # college=/level=/type=：合并文件所在目录的上两级
+    return Path(path).parent.parent.relative_to(root).as_posix()
+
+
+def _source_key(path: str, root: Path) -> str:
+    return Path(path).relative_to(root).as_posix()
+
+
+def plan_compaction(is_test: bool = False, small_bytes: int | None = None,
+                    min_files: int | None = None) -> list[dict]:
+    """Partitions worth compacting: {partition, sources (small CSV items), previous (compacted item or None)}."""
+    small_bytes = COMPACT_SMALL_BYTES if small_bytes is None else small_bytes
+    min_files = COMPACT_MIN_FILES if min_files is None else min_files
+    root = _root(is_test)
+    groups = {}
+    for it in storage._iter_partitioned(root):
+        g = groups.setdefault(_partition_of(it["path"], root), {"sources": [], "previous": None})
+        if it["path"].endswith(".parquet"):
+            g["previous"] = it
+            continue
+        try:
+            size = Path(it["path"]).stat().st_size
+        except OSError:
+            continue
+        if size < small_bytes:
+            g["sources"].append(it)
+    return [dict(g, partition=k) for k, g in sorted(groups.items()) if len(g["sources"]) >= max(min_files, 1)]
+
+
+def _compacted_name(seq: int, it: dict) -> str:
+    if it["type"] == "qa":
+        suffix = "qa"
+    else:
+        suffix = "ex_grad" if it["level"] == "研究生" else "ex_ug"
+    return f"{COMPACTED_PREFIX}-{seq:06d}_parsed_{suffix}.parquet"
+
+
+def _read_source(it: dict, root: Path) -> pd.DataFrame:
+    df = storage._read_table(it["path"])
+    if df.empty and not len(df.columns):
+        raise ValueError("空文件或无法解析")
+    return apply_dtype_policy(df).assign(**{
+        storage.PROVENANCE_SOURCE: storage._partition_column(_source_key(it["path"], root), len(df)),
+        storage.PROVENANCE_DATE: storage._partition_column(it["date"], len(df)),
+    })
+
+
+def _compact_partition(plan: dict, root: Path) -> dict:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    frames, absorbed, skipped = [], [], []
+    prev = plan["previous"]
+    if prev is not None:
+        frames.append(pq.read_table(prev["path"]).to_pandas())
+    for it in plan["sources"]:
+        try:
+            df = _read_source(it, root)
+        except Exception as e:
+            skipped.append({"path": it["path"], "error": f"{type(e).__name__}: {e}"})
+            continue
+        frames.append(df)
+        absorbed.append({"path": _source_key(it["path"], root), "date": it["date"], "rows": len(df), "item": it})
+    result = {"partition": plan["partition"], "files": len(absorbed), "skipped": skipped, "file": None, "rows": 0}
+    if not absorbed:
+        return result
+    merged = concat_frames(frames)
+    d = root / plan["partition"] / f"date={storage.NULL_PARTITION}"
+    d.mkdir(parents=True, exist_ok=True)
+    with _lock, storage._file_lock(root / ".compaction.lock"):
+        m = storage.load_compaction_manifest(root)
+        old = m["parts"].get(plan["partition"])
+        if old and not (d / old["file"]).exists():
+            # 合并文件已被删除：其登记的来源随之失效
+            old = None
+        if (old["file"] if old else None) != (Path(prev["path"]).name if prev else None):
+            # 期间另一个进程已合并该分区：放弃本次结果，下次重新规划
+            result["skipped"].append({"path": plan["partition"], "error": "分区已被并发合并"})
+            return result
+        name = _compacted_name(m["next_seq"], absorbed[0]["item"])
+        m["next_seq"] += 1
+        tmp = d / f".{name}.tmp"
+        pq.write_table(pa.Table.from_pandas(merged, preserve_index=False), tmp)
+        os.replace(tmp, d / name)
+        sources = (old["sources"] if old else []) + [{k: a[k] for k in ("path", "date", "rows")} for a in absorbed]
+        m["parts"][plan["partition"]] = {
+            "file": name,
+            "rows": len(merged),
+            "dates": sorted({s["date"] for s in sources}),
+            "sources": sources,
+        }
+        # 清单原子替换后读者即切换到新合并文件，此后再删除被合并的文件
+        storage._write_json_atomic(root / storage.COMPACTION_MANIFEST, m)
+    for it in [a["item"] for a in absorbed] + ([prev] if prev else []):
+        try:
+            Path(it["path"]).unlink()
+        except OSError:
+            pass
+    result.update(file=str(d / name), rows=len(merged))
+    return result
+
+
+def release_source(path) -> bool:
+    """Take a parsed file back out of its partition's compacted file before it is written again.
+
+    Called when a file with an absorbed name (in any compression) is about to be rewritten, e.g.
+    a same-day re-upload. The compacted file is rewritten without that source's rows under a new
+    name and the manifest entry swapped, so the new CSV is read on its own. Returns True when
+    the file had been compacted.
+    """
+    import pyarrow.parquet as pq
+
+    path = Path(path)
+    if storage._partition_values(path) is None:
+        return False
+    root = path.parents[4]
+    if not (root / storage.COMPACTION_MANIFEST).exists():
+        return False
+    partition = _partition_of(str(path), root)
+    key = storage.plain_name(_source_key(str(path), root))
+
+    def _released(entry: dict | None) -> list[str]:
+        return [s["path"] for s in (entry or {}).get("sources", []) if storage.plain_name(s["path"]) == key]
+
+    if not _released(storage.load_compaction_manifest(root)["parts"].get(partition)):
+        return False
+    d = root / partition / f"date={storage.NULL_PARTITION}"
+    with _lock, storage._file_lock(root / ".compaction.lock"):
+        m = storage.load_compaction_manifest(root)
+        entry = m["parts"].get(partition)
+        released = _released(entry)
+        if not released:
+            return False
+        old = d / entry["file"]
+        sources = [s for s in entry["sources"] if s["path"] not in released]
+        if sources:
+            table = pq.read_table(old, filters=[(storage.PROVENANCE_SOURCE, "not in", released)])
+            name = _compacted_name(m["next_seq"], storage.parsed_item(old))
+            m["next_seq"] += 1
+            tmp = d / f".{name}.tmp"
+            pq.write_table(table, tmp)
+            os.replace(tmp, d / name)
+            m["parts"][partition] = {
+                "file": name,
+                "rows": table.num_rows,
+                "dates": sorted({s["date"] for s in sources}),
+                "sources": sources,
+            }
+        else:
+            del m["parts"][partition]
+        storage._write_json_atomic(root / storage.COMPACTION_MANIFEST, m)
+    try:
+        old.unlink()
+    except OSError:
+        pass
+    return True
+
+
+def compact_parsed(is_test: bool = False, small_bytes: int | None = None, min_files: int | None = None,
+                   dry_run: bool = False) -> list[dict]:
+    """Merge small parsed files per partition; returns {partition, files, rows, file, skipped} per partition.
+
+    With dry_run only the plan is reported (rows/file are left empty).
+    """
+    root = _root(is_test)
+    plans = plan_compaction(is_test, small_bytes, min_files)
+    if dry_run:
+        return [{"partition": p["partition"], "files": len(p["sources"]), "skipped": [], "file": None, "rows": 0}
+                for p in plans]
+    results = []
+    with span(f"compact_parsed[{len(plans)} partitions]") as rec:
+        for p in plans:
+            results.append(_compact_partition(p, root))
+        rec["rows"] = sum(r["rows"] for r in results)
+    return results
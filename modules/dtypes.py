@@ -0,0 +1,52 @@
+import numpy as np
+import pandas as pd
+
+# 低基数列按 category 存储（题型 / 级别 / 学院 / 日期）
+CATEGORY_COLUMNS = ("type", "level", "college", "date")
+
+
+def text_dtype():
+    """pyarrow-backed strings with NaN as missing value (same semantics as the default str reads).
+
+    Falls back to Python object strings when pyarrow is not installed.
+    """
+    try:
+        import pyarrow  # noqa: F401
+    except ImportError:
+        return object
+    try:
+        return pd.StringDtype("pyarrow", na_value=np.nan)
+    except TypeError:
+        # pandas 2.1–2.2
+        return pd.StringDtype("pyarrow_numpy")
+
+
+def _is_text(dtype) -> bool:
+    return dtype == object or isinstance(dtype, pd.StringDtype)
+
+
+def apply_dtype_policy(df: pd.DataFrame, categories: tuple[str, ...] = CATEGORY_COLUMNS) -> pd.DataFrame:
+    """Convert text columns to text_dtype() and low-cardinality columns to category; numeric columns are kept."""
+    if df is None or df.empty or not df.columns.is_unique:
+        return df
+    text = text_dtype()
+    conv = {}
+    for c, dtype in df.dtypes.items():
+        if c in categories:
+            if not isinstance(dtype, pd.CategoricalDtype):
+                conv[c] = "category"
+        elif _is_text(dtype) and dtype != text:
+            conv[c] = text
+    return df.astype(conv) if conv else df
+
+
+def concat_frames(frames: list[pd.DataFrame], ignore_index: bool = True) -> pd.DataFrame:
+    """pd.concat that keeps policy columns categorical.
+
+    Plain pd.concat falls back to text when categoricals differ between frames; those columns
+    are cast back once on the concatenated frame instead of aligning every frame beforehand.
+    """
+    frames = [f for f in frames if f is not None]
+    if not frames:
+        return pd.DataFrame()
+    return apply_dtype_policy(pd.concat(frames, ignore_index=ignore_index))
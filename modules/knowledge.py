@@ -0,0 +1,119 @@
+"""Knowledge-point inverted index and coverage analytics.
+
+The free-text knowledge column is normalized (modules.normalize), split on its separators
+(；、, and the like) and each point stripped of surrounding punctuation and quotes. The
+postings point → item id live in the search index database (modules.search), which is
+updated on every save and delete, so coverage is computed there without reading item files.
+"""
+import pandas as pd
+
+import modules.search as search
+import modules.storage as storage
+from modules.normalize import normalize_text
+
+# NFKC 之后全角“；，”已折叠为半角
+KNOWLEDGE_SEPARATORS = r"[;,、\n\r\t|]+"
+_STRIP_CHARS = " 。.:·-—_\"'“”‘’"
+_EMPTY_POINTS = {"", "nan", "none", "null", "无", "-"}
+KNOWLEDGE_PAGE_SIZE = 50
+
+
+def normalize_points(values: pd.Series, prenormalized: bool = False) -> pd.Series:
+    """Normalized single knowledge points (normalize_text, trimmed punctuation); None when empty."""
+    s = (values if prenormalized else normalize_text(values)).str.strip(_STRIP_CHARS)
+    return s.astype(object).where(~s.str.lower().isin(_EMPTY_POINTS), None)
+
+
+def split_points(values: pd.Series, prenormalized: bool = False) -> pd.Series:
+    """One row per (item, knowledge point), indexed like values; empty cells and duplicates are dropped.
+
+    prenormalized=True means values already went through normalize_text (the parse shadow column).
+    """
+    s = (values if prenormalized else normalize_text(values)).str.split(KNOWLEDGE_SEPARATORS, regex=True).explode()
+    s = normalize_points(s.fillna("").str.strip(), prenormalized=True).dropna()
+    return s[~s.reset_index().duplicated().to_numpy()]
+
+
+def _filters(colleges: list[str] | None, levels: list[str] | None,
+             exercise_types: list[str] | None) -> tuple[str, list]:
+    where, args = [], []
+    if colleges is not None:
+        dirs = sorted({p.name for c in colleges for p in storage._dirnames_for_college(c)})
+        where.append(f"items.college_dir IN ({','.join('?' * len(dirs))})")
+        args.extend(dirs)
+    if levels is not None:
+        where.append(f"items.level IN ({','.join('?' * len(levels))})")
+        args.extend(levels)
+    if exercise_types is not None:
+        where.append(f"items.exercise_type IN ({','.join('?' * len(exercise_types))})")
+        args.extend(exercise_types)
+    return (" AND ".join(where) if where else "1=1"), args
+
+
+def coverage(colleges: list[str] | None = None, levels: list[str] | None = None,
+             exercise_types: list[str] | None = None) -> pd.DataFrame:
+    """Items per knowledge point × college × level: columns point, college, level, items."""
+    clause, args = _filters(colleges, levels, exercise_types)
+    with search._connect() as conn:
+        rows = conn.execute(
+            "SELECT k.point, items.college_dir, items.level, COUNT(*) FROM item_knowledge k "
+            f"JOIN items ON items.id = k.item_id WHERE {clause} "
+            "GROUP BY k.point, items.college_dir, items.level", args).fetchall()
+    df = pd.DataFrame(rows, columns=["point", "college_dir", "level", "items"])
+    display = {c: storage.get_college_display(c) for c in df["college_dir"].unique()}
+    df.insert(1, "college", df["college_dir"].map(display))
+    return df.drop(columns=["college_dir"]).sort_values(["items", "point"], ascending=[False, True], ignore_index=True)
+
+
+def point_totals(colleges: list[str] | None = None, levels: list[str] | None = None,
+                 exercise_types: list[str] | None = None, limit: int | None = None) -> pd.DataFrame:
+    """Per knowledge point: items and the number of colleges covering it, most items first."""
+    clause, args = _filters(colleges, levels, exercise_types)
+    sql = ("SELECT k.point, COUNT(*) AS items, COUNT(DISTINCT items.college_dir) AS colleges FROM item_knowledge k "
+           f"JOIN items ON items.id = k.item_id WHERE {clause} GROUP BY k.point ORDER BY items DESC, k.point")
+    if limit:
+        sql += f" LIMIT {int(limit)}"
+    with search._connect() as conn:
+        rows = conn.execute(sql, args).fetchall()
+    return pd.DataFrame(rows, columns=["point", "items", "colleges"])
+
+
+def labelled_ratio(colleges: list[str] | None = None, levels: list[str] | None = None,
+                   exercise_types: list[str] | None = None) -> pd.DataFrame:
+    """Per college × level: items, items with at least one knowledge point, distinct points."""
+    clause, args = _filters(colleges, levels, exercise_types)
+    with search._connect() as conn:
+        rows = conn.execute(
+            "SELECT items.college_dir, items.level, COUNT(*), "
+            "SUM(EXISTS (SELECT 1 FROM item_knowledge k WHERE k.item_id = items.id)), "
+            "(SELECT COUNT(DISTINCT k.point) FROM item_knowledge k JOIN items i2 ON i2.id = k.item_id "
+            " WHERE i2.college_dir = items.college_dir AND i2.level IS items.level) "
+            f"FROM items WHERE {clause} GROUP BY items.college_dir, items.level", args).fetchall()
+    df = pd.DataFrame(rows, columns=["college_dir", "level", "items", "labelled", "points"])
+    df.insert(0, "college", df["college_dir"].map(lambda c: storage.get_college_display(c)))
+    df["labelled_pct"] = (df["labelled"] / df["items"].where(df["items"] > 0) * 100).round(2).fillna(0.0)
+    return df.drop(columns=["college_dir"])
+
+
+def items_for_point(point: str, colleges: list[str] | None = None, page: int = 1,
+                    page_size: int = KNOWLEDGE_PAGE_SIZE) -> tuple[list[dict], int]:
+    """Items tagged with a (normalized) knowledge point, one page at a time; returns (rows, total)."""
+    key = normalize_points(pd.Series([point])).iloc[0]
+    if key is None:
+        return [], 0
+    clause, args = _filters(colleges, None, None)
+    args = [key] + args
+    with search._connect() as conn:
+        total = conn.execute(
+            f"SELECT COUNT(*) FROM item_knowledge k JOIN items ON items.id = k.item_id WHERE k.point = ? AND {clause}",
+            args).fetchone()[0]
+        cur = conn.execute(
+            "SELECT items.src, items.row, items.college_dir, items.level, items.exercise_type, items_fts.stem, "
+            "items_fts.question, items_fts.knowledge FROM item_knowledge k JOIN items ON items.id = k.item_id "
+            f"JOIN items_fts ON items_fts.rowid = items.id WHERE k.point = ? AND {clause} "
+            "ORDER BY items.id LIMIT ? OFFSET ?",
+            args + [int(page_size), max(0, (int(page) - 1) * int(page_size))])
+        rows = [{"college": storage.get_college_display(c), "level": lv, "exercise_type": et,
+                 "stem": stem or question, "knowledge": kn, "path": src, "row": row}
+                for src, row, c, lv, et, stem, question, kn in cur.fetchall()]
+    return rows, int(total)
@@ -0,0 +1,173 @@
+import datetime as dt
+import logging
+import sqlite3
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+LOGIN_DIR = Path("storage_logins")
+LOGIN_DB = LOGIN_DIR / "logins.db"
+LOGIN_PAGE_SIZE = 50
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS login_events (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    ts TEXT NOT NULL,
+    day TEXT NOT NULL,
+    college TEXT NOT NULL,
+    username TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_login_events_college_ts ON login_events(college, ts);
+CREATE INDEX IF NOT EXISTS idx_login_events_ts ON login_events(ts);
+CREATE TABLE IF NOT EXISTS login_user_period (
+    period TEXT NOT NULL,
+    bucket TEXT NOT NULL,
+    college TEXT NOT NULL,
+    username TEXT NOT NULL,
+    events INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (period, bucket, college, username)
+);
+CREATE TABLE IF NOT EXISTS login_rollup (
+    period TEXT NOT NULL,
+    bucket TEXT NOT NULL,
+    college TEXT NOT NULL,
+    users INTEGER NOT NULL DEFAULT 0,
+    events INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (period, bucket, college)
+);
+CREATE TABLE IF NOT EXISTS legacy_imports (
+    path TEXT PRIMARY KEY,
+    lines INTEGER NOT NULL
+);
+"""
+
+_init_lock = threading.Lock()
+_initialized: set[str] = set()
+
+
+def _week_bucket(day: dt.date) -> str:
+    y, w, _ = day.isocalendar()
+    return f"{y}-W{w:02d}"
+
+
+@contextmanager
+def _connect():
+    LOGIN_DB.parent.mkdir(parents=True, exist_ok=True)
+    conn = sqlite3.connect(LOGIN_DB, timeout=10)
+    try:
+        key = str(LOGIN_DB.resolve())
+        if key not in _initialized:
+            with _init_lock:
+                if key not in _initialized:
+                    conn.execute("PRAGMA journal_mode=WAL")
+                    conn.executescript(_SCHEMA)
+                    _import_legacy_logs(conn)
+                    conn.commit()
+                    _initialized.add(key)
+        yield conn
+    finally:
+        conn.close()
+
+
+def _insert_event(conn, ts: dt.datetime, college: str, username: str):
+    day = ts.date()
+    conn.execute("INSERT INTO login_events(ts, day, college, username) VALUES (?, ?, ?, ?)",
+                 (ts.isoformat(), day.isoformat(), college, username))
+    # 维护日/周活跃用户汇总：首次出现的用户才计入 users
+    for period, bucket in (("day", day.isoformat()), ("week", _week_bucket(day))):
+        cur = conn.execute(
+            "INSERT OR IGNORE INTO login_user_period(period, bucket, college, username, events) VALUES (?, ?, ?, ?, 0)",
+            (period, bucket, college, username))
+        new_user = cur.rowcount
+        conn.execute("UPDATE login_user_period SET events = events + 1 WHERE period=? AND bucket=? AND college=? AND username=?",
+                     (period, bucket, college, username))
+        conn.execute(
+            "INSERT INTO login_rollup(period, bucket, college, users, events) VALUES (?, ?, ?, ?, 1) "
+            "ON CONFLICT(period, bucket, college) DO UPDATE SET users = users + excluded.users, events = events + 1",
+            (period, bucket, college, new_user))
+
+
+def _import_legacy_logs(conn):
+    """Import per-day text logs (<college>/<date>.log); only lines not imported before are added."""
+    if not LOGIN_DIR.exists():
+        return
+    for d in sorted(p for p in LOGIN_DIR.iterdir() if p.is_dir()):
+        for f in sorted(d.glob("*.log")):
+            row = conn.execute("SELECT lines FROM legacy_imports WHERE path=?", (str(f),)).fetchone()
+            done = row[0] if row else 0
+            try:
+                with open(f, "r", encoding="utf-8") as fh:
+                    lines = [ln.rstrip("\n") for ln in fh]
+            except Exception:
+                continue
+            for ln in lines[done:]:
+                ts_text, _, username = ln.partition("\t")
+                try:
+                    ts = dt.datetime.fromisoformat(ts_text.strip())
+                except ValueError:
+                    continue
+                _insert_event(conn, ts, d.name, username.strip())
+            conn.execute("INSERT OR REPLACE INTO legacy_imports(path, lines) VALUES (?, ?)", (str(f), len(lines)))
+
+
+def record_login(username: str, college: str, ts: dt.datetime | None = None) -> None:
+    try:
+        with _connect() as conn:
+            _insert_event(conn, ts or dt.datetime.now(), college, username)
+            conn.commit()
+    except Exception:
+        # 登录记录失败不应影响登录本身，但需留下日志以便排查
+        logger.exception("记录登录失败：%s@%s", username, college)
+
+
+def query_logins(college: str | None = None, username: str | None = None, page: int = 1,
+                 page_size: int = LOGIN_PAGE_SIZE) -> tuple[list[dict], int]:
+    """Newest-first login events, one page at a time; returns (rows, total)."""
+    where, args = [], []
+    if college:
+        where.append("college = ?")
+        args.append(college)
+    if username:
+        where.append("username = ?")
+        args.append(username)
+    clause = f"WHERE {' AND '.join(where)}" if where else ""
+    with _connect() as conn:
+        total = conn.execute(f"SELECT COUNT(*) FROM login_events {clause}", args).fetchone()[0]
+        cur = conn.execute(
+            f"SELECT ts, college, username FROM login_events {clause} ORDER BY ts DESC, id DESC LIMIT ? OFFSET ?",
+            args + [int(page_size), max(0, (int(page) - 1) * int(page_size))])
+        rows = [{"time": ts, "college": c, "username": u} for ts, c, u in cur.fetchall()]
+    return rows, int(total)
+
+
+def active_users(period: str = "day", college: str | None = None, limit: int = 30) -> list[dict]:
+    """Precomputed active-user rollup for the latest `limit` days or ISO weeks (oldest first).
+
+    Without a college, distinct users are counted across all colleges.
+    """
+    if period not in ("day", "week"):
+        raise ValueError(f"unknown period: {period}")
+    with _connect() as conn:
+        if college:
+            cur = conn.execute(
+                "SELECT bucket, users, events FROM login_rollup WHERE period=? AND college=? ORDER BY bucket DESC LIMIT ?",
+                (period, college, int(limit)))
+        else:
+            cur = conn.execute(
+                "SELECT bucket, COUNT(DISTINCT username), SUM(events) FROM login_user_period WHERE period=? "
+                "GROUP BY bucket ORDER BY bucket DESC LIMIT ?",
+                (period, int(limit)))
+        rows = [{"bucket": b, "users": int(u), "events": int(e)} for b, u, e in cur.fetchall()]
+    return rows[::-1]
+
+
+def login_days(college: str) -> list[dict]:
+    """Per-day event lists in the shape of the former text-log reader (oldest day first)."""
+    with _connect() as conn:
+        cur = conn.execute("SELECT day, ts, username FROM login_events WHERE college=? ORDER BY ts", (college,))
+        days: dict[str, list[str]] = {}
+        for day, ts, u in cur.fetchall():
+            days.setdefault(day, []).append(f"{ts}\t{u}")
+    return [{"date": d, "events": ev} for d, ev in days.items()]
@@ -0,0 +1,151 @@
+"""Vectorized text normalization shared by parsing, quality checks and n-gram hashing.
+
+Each text column is normalized once per parse, column-wise: Unicode NFKC (which also folds
+full-width letters, digits, punctuation and the ideographic space to half-width),
+zero-width characters removed, runs of whitespace collapsed, and "nan"/"None" leftovers
+of missing cells turned into "". The results ride along the parsed frame as shadow columns
+(_norm_<col>); consumers read them through normalized(), which falls back to normalizing
+on the fly for frames loaded from storage. Shadow columns are never written to disk.
+"""
+import unicodedata
+
+import numpy as np
+import pandas as pd
+
+SHADOW_PREFIX = "_norm_"
+NORMALIZED_COLUMNS = ("type", "question", "stem", "options", "answer", "analysis", "knowledge")
+_NULL_STRINGS = frozenset({"nan", "none", "null", "<na>"})
+# 整列拼接时的单元格分隔符
+_SEP = "\x1f"
+# NFKC 下保持不变、也不参与组合的非 ASCII 码位（中文正文的绝大部分字符）；
+# 只含这些字符与 ASCII 的单元格折叠全角后无需再做 NFKC
+NFKC_STABLE_RANGES = (
+    (0x00B7, 0x00B7), (0x00D7, 0x00D7), (0x00F7, 0x00F7), (0x2013, 0x2014), (0x2018, 0x2019),
+    (0x201C, 0x201D), (0x2190, 0x2193), (0x221A, 0x221A), (0x3001, 0x3003), (0x3008, 0x3011),
+    (0x4E00, 0x9FFF),
+)
+# BMP 码位的字符类别表（位标记），整列按码位查表分类
+_STABLE, _SPACE, _ZERO_WIDTH = 1, 2, 4
+
+
+def _char_classes() -> np.ndarray:
+    table = np.zeros(0x10000, dtype=np.uint8)
+    table[:0x80] = _STABLE
+    for lo, hi in NFKC_STABLE_RANGES:
+        table[lo:hi + 1] = _STABLE
+    # str.isspace() 为真的码位，单元格分隔符除外
+    spaces = [cp for cp in range(0x3001) if chr(cp).isspace() and cp != ord(_SEP)]
+    table[spaces] |= _SPACE
+    # 零宽字符、BOM、软连字符与 NUL：直接删除
+    table[[0x00, 0x00AD, *range(0x200B, 0x2010), *range(0x2060, 0x2065), 0xFEFF]] = _ZERO_WIDTH
+    return table
+
+
+_CLASSES = _char_classes()
+
+
+def _classify(cps: np.ndarray) -> np.ndarray:
+    # BMP 以外的码位折到 U+FFFF（类别为 0），一律按“需 NFKC”处理
+    return _CLASSES[np.minimum(cps, 0xFFFF)]
+
+
+def _codepoints(text: str) -> np.ndarray:
+    return np.frombuffer(text.encode("utf-32-le"), dtype=np.uint32).copy()
+
+
+def _nfkc(cps: np.ndarray) -> np.ndarray:
+    """NFKC over a separator-joined column of code points.
+
+    Full-width ASCII variants (U+FF01–FF5E) and U+3000 are folded with numpy, which is what
+    NFKC does to them; only cells that still hold other non-stable code points go through
+    unicodedata.normalize.
+    """
+    wide = (cps >= 0xFF01) & (cps <= 0xFF5E)
+    cps[wide] -= 0xFEE0
+    cps[cps == 0x3000] = 0x20
+    unstable = (_classify(cps) & _STABLE) == 0
+    if not unstable.any():
+        return cps
+    cells = cps.tobytes().decode("utf-32-le").split(_SEP)
+    doc = np.cumsum(cps == ord(_SEP))
+    for i in np.unique(doc[unstable]).tolist():
+        cells[i] = unicodedata.normalize("NFKC", cells[i])
+    return _codepoints(_SEP.join(cells))
+
+
+def _collapse_whitespace(cps: np.ndarray) -> np.ndarray:
+    """Drop zero-width characters, trim each cell, and turn each inner whitespace run into
+    one newline (if the run has one) or one space."""
+    cls = _classify(cps)
+    if (cls & _ZERO_WIDTH).any():
+        keep = (cls & _ZERO_WIDTH) == 0
+        cps, cls = cps[keep], cls[keep]
+    ws = (cls & _SPACE) != 0
+    if not ws.any():
+        return cps
+    n = len(cps)
+    prev_ws = np.concatenate(([False], ws[:-1]))
+    next_ws = np.concatenate((ws[1:], [False]))
+    starts = np.flatnonzero(ws & ~prev_ws)
+    ends = np.flatnonzero(ws & ~next_ws)
+    sep = ord(_SEP)
+    inner = (starts > 0) & (ends < n - 1)
+    inner[inner] &= (cps[starts[inner] - 1] != sep) & (cps[ends[inner] + 1] != sep)
+    run_has_nl = np.add.reduceat((cps == 0x0A) & ws, starts) > 0
+    keep = ~ws
+    keep[starts[inner]] = True
+    cps[starts] = np.where(run_has_nl, 0x0A, 0x20)
+    return cps[keep]
+
+
+def _normalize_cells(texts: list[str]) -> list[str]:
+    big = _SEP.join(texts)
+    if big.count(_SEP) != len(texts) - 1:
+        # 单元格内本身含分隔符（控制字符）时按空白处理
+        big = _SEP.join(t.replace(_SEP, " ") for t in texts)
+    cps = _collapse_whitespace(_nfkc(_codepoints(big)))
+    return cps.tobytes().decode("utf-32-le").split(_SEP)
+
+
+def normalize_text(values: pd.Series) -> pd.Series:
+    """Normalized copy of a text column ("" for missing), indexed like values.
+
+    NFKC, zero-width characters removed, each cell trimmed; line breaks are kept (a whitespace
+    run holding one becomes a single newline) since they separate options and knowledge
+    points, other whitespace runs become one space. The whole column is processed as one
+    code-point array rather than cell by cell.
+    """
+    s = values.astype("string")
+    cells = _normalize_cells(s.fillna("").tolist()) if len(s) else []
+    cells = ["" if len(t) < 5 and t.lower() in _NULL_STRINGS else t for t in cells]
+    return pd.Series(cells, index=values.index, dtype=object)
+
+
+def shadow_name(col: str) -> str:
+    return SHADOW_PREFIX + col
+
+
+def is_shadow(col) -> bool:
+    return isinstance(col, str) and col.startswith(SHADOW_PREFIX)
+
+
+def add_shadow_columns(df: pd.DataFrame, cols=NORMALIZED_COLUMNS, refresh: bool = False) -> pd.DataFrame:
+    """df with _norm_<col> added for each present col (existing shadows kept unless refresh)."""
+    new = {shadow_name(c): normalize_text(df[c]) for c in cols
+           if c in df.columns and (refresh or shadow_name(c) not in df.columns)}
+    return df.assign(**new) if new else df
+
+
+def drop_shadow_columns(df: pd.DataFrame) -> pd.DataFrame:
+    shadows = [c for c in df.columns if is_shadow(c)]
+    return df.drop(columns=shadows) if shadows else df
+
+
+def normalized(df: pd.DataFrame, col: str) -> pd.Series:
+    """The normalized col of df: its shadow column when present, else computed now ("" if absent)."""
+    name = shadow_name(col)
+    if name in df.columns:
+        return df[name]
+    if col in df.columns:
+        return normalize_text(df[col])
+    return pd.Series([""] * len(df), index=df.index, dtype=str)
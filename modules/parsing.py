@@ -1,8 +1,11 @@
 import pandas as pd
-from io import BytesIO, StringIO
+from io import BytesIO
 from typing import Tuple, List, Dict, Optional, Any
 import re
+import numpy as np
 from modules.quality import assess_qa, assess_exercises, summarize_quality, _parse_options_text, _normalize_type
+from modules.normalize import add_shadow_columns, is_shadow, normalized
+from modules.tracing import span
 
 KEYWORDS_SHEET = ["选择", "填空", "问答", "判断", "简答", "案例", "论述", "习题", "计算", "名词解释"]
 
@@ -46,6 +49,16 @@ def _match_columns(df: pd.DataFrame) -> Dict[str, str]:
     
     return matched
 
+def _read_csv_bytes(data: bytes, encoding: str, errors: str = "strict") -> pd.DataFrame:
+    # Robust CSV reading: standard C parser first, delimiter sniffing as fallback
+    try:
+        return pd.read_csv(BytesIO(data), dtype=str, encoding=encoding, encoding_errors=errors)
+    except UnicodeDecodeError:
+        raise
+    except Exception:
+        return pd.read_csv(BytesIO(data), sep=None, engine="python", dtype=str, encoding=encoding, encoding_errors=errors)
+
+
 def _read_file(uploaded_file) -> Dict[str, pd.DataFrame]:
     name = uploaded_file.name.lower()
     if name.endswith((".xlsx", ".xls")):
@@ -58,24 +71,13 @@ def _read_file(uploaded_file) -> Dict[str, pd.DataFrame]:
     elif name.endswith(".csv"):
         try:
             data = uploaded_file.getvalue() if hasattr(uploaded_file, "getvalue") else uploaded_file.read()
-            # Try to detect encoding
-            encoding = "utf-8"
+            # Parse straight from the bytes: decoding into one big str (and StringIO copying it
+            # again) used to dominate peak memory for large uploads.
+            # UTF-8 first (strict), then GB18030 with replacement, as before.
             try:
-                text = data.decode("utf-8")
+                df = _read_csv_bytes(data, "utf-8")
             except UnicodeDecodeError:
-                text = data.decode("gb18030", errors="replace")
-                encoding = "gb18030"
-            
-            # Robust CSV reading
-            # 1. Try standard read
-            try:
-                df = pd.read_csv(StringIO(text), dtype=str)
-                # Heuristic: if all data is in one column, maybe delimiter issue
-                if len(df.columns) == 1 and "," in text:
-                     pass
-            except:
-                 # Fallback
-                 df = pd.read_csv(StringIO(text), sep=None, engine='python', dtype=str)
+                df = _read_csv_bytes(data, "gb18030", errors="replace")
             
             # Trim column names
             df.columns = df.columns.astype(str).str.strip()
@@ -110,39 +112,33 @@ def _detect_exercise_level_from_sheet(sheet_names: List[str]) -> str:
         return "本科"
     return "本科"
 
+_ANSWER_PREFIX_RE = r"^(?:答案|Answer|Correct Answer)[:：\s\t]*"
+# 选择题答案形如 "A: 描述" / "A. 描述" 时只保留选项字母
+_CHOICE_ANSWER_RE = r"^([A-F])\s*[:\.]\s*.*$"
+
+
+def _clean_answers(answers: pd.Series, types: pd.Series) -> pd.Series:
+    """Clean a whole answer column at once: drop 答案/Answer prefixes, reduce choice answers to the letter."""
+    s = answers.astype("string").str.strip()
+    s = s.mask(s.str.lower() == "nan", "").fillna("")
+    s = s.str.replace(_ANSWER_PREFIX_RE, "", regex=True, flags=re.IGNORECASE).str.strip()
+    is_selection = (types.astype("string").str.strip() == "选择题").fillna(False).to_numpy()
+    if is_selection.any():
+        letter = s.str.extract(_CHOICE_ANSWER_RE, flags=re.IGNORECASE)[0]
+        letter = letter.fillna(s.where(s.str.fullmatch(r"[A-F]", case=False).fillna(False))).str.upper()
+        s = s.mask(is_selection & letter.notna().to_numpy(), letter)
+    return s.astype(object)
+
+
 def _clean_answer_string(val, type_context: str | None = None) -> str:
     """Clean the answer string. Handle 'A: Description' for choice questions."""
-    s = str(val).strip()
-    if s.lower() == "nan" or s == "": return ""
-    
-    # 1. Remove generic prefixes like "答案", "Answer:"
-    # Use NON-GREEDY match for the prefix part
-    s = re.sub(r"^(答案|Answer|Correct Answer)[:：\s\t]*", "", s, flags=re.IGNORECASE).strip()
-    
-    # 2. Logic for Choice Questions (Selection)
-    # If type is Selection, we want to extract just the option letter if standard format
-    is_selection = type_context == "选择题"
-    
-    if is_selection:
-        # Patter: Starts with Single Letter (A-F), followed by dot/colon/space?
-        # Check if it looks like "A: xxx" or "A. xxx" or "A xxx"
-        match = re.match(r"^([A-F])\s*[:\.]\s*(.*)$", s, re.IGNORECASE)
-        if match:
-             # It matches "A: content". Return just "A" as standard answer for system?
-             # OR should we keep it? 
-             # PRD Requirement check: Usually answer for choice is just "A".
-             # If the user put "A: Description", usually "A" is the key.
-             return match.group(1).upper()
-        
-        # Also check pure letter
-        if re.match(r"^[A-F]$", s, re.IGNORECASE):
-            return s.upper()
+    return _clean_answers(pd.Series([val], dtype=object), pd.Series([type_context], dtype=object)).iloc[0]
 
-    return s
 
 def _normalize_qa(df: pd.DataFrame) -> Tuple[pd.DataFrame, List[str]]:
     warnings = []
-    mapping = _match_columns(df)
+    with span("match_columns"):
+        mapping = _match_columns(df)
     
     q_col = mapping.get("stem") # Re-use stem mapping as question
     if not q_col:
@@ -174,7 +170,8 @@ def _normalize_qa(df: pd.DataFrame) -> Tuple[pd.DataFrame, List[str]]:
 
 def _normalize_exercises(df: pd.DataFrame, default_type_from_sheet: Optional[str] = None) -> Tuple[pd.DataFrame, List[str]]:
     warnings = []
-    mapping = _match_columns(df)
+    with span("match_columns"):
+        mapping = _match_columns(df)
     
     # 1. Handle Options: Separate columns (A, B, C...) vs Single Column
     options_col_source = mapping.get("options")
@@ -184,19 +181,28 @@ def _normalize_exercises(df: pd.DataFrame, default_type_from_sheet: Optional[str
     if not options_col_source:
         option_candidates = [c for c in df.columns if str(c).strip().lower() in ["a", "b", "c", "d", "e", "f"] or str(c).strip().startswith("选项")]
         if option_candidates:
-            def join_options(row):
+            option_cols = sorted(option_candidates) # sort to keep A,B,C order
+            labels = []
+            for c in option_cols:
+                label = str(c).strip()
+                # Clean label "选项A" -> "A"
+                if label.startswith("选项") and len(label) > 2:
+                    label = label.replace("选项", "").strip()
+                # If label is just A, B, C.. use it
+                labels.append(label)
+            def join_options(values):
                 parts = []
-                for c in sorted(option_candidates): # sort to keep A,B,C order
-                    val = str(row.get(c, "")).strip()
+                for label, val in zip(labels, values):
+                    val = str(val).strip()
                     if val and val.lower() != "nan":
-                        label = str(c).strip()
-                        # Clean label "选项A" -> "A"
-                        if label.startswith("选项") and len(label) > 2:
-                            label = label.replace("选项", "").strip()
-                        # If label is just A, B, C.. use it
                         parts.append(f"{label}: {val}")
                 return "\n".join(parts)
-            final_options_col = df.apply(join_options, axis=1)
+            # Column-wise zip instead of apply(axis=1): no per-row Series copies
+            with span("join_options", rows=len(df)):
+                final_options_col = pd.Series(
+                    [join_options(vals) for vals in zip(*(df[c].tolist() for c in option_cols))],
+                    index=df.index,
+                )
     else:
         final_options_col = df[options_col_source]
 
@@ -229,13 +235,8 @@ def _normalize_exercises(df: pd.DataFrame, default_type_from_sheet: Optional[str
 
     # 4. Clean Answer
     if not out["answer"].empty:
-        # Use vectorized apply with type context if possible, or straight map if type is uniform
-        # Since type might vary per row (rarely if sheet-based), we do row-wise
-        def clean_wrapper(row):
-            t = str(row.get("type", "")).strip()
-            return _clean_answer_string(row.get("answer", ""), type_context=t)
-        
-        out["answer"] = out.apply(clean_wrapper, axis=1)
+        with span("clean_answer", rows=len(out)):
+            out["answer"] = _clean_answers(out["answer"], out["type"])
 
     # 5. Mandatory Checks
     required = ["stem", "answer"]
@@ -252,7 +253,9 @@ def _normalize_exercises(df: pd.DataFrame, default_type_from_sheet: Optional[str
     return out, warnings
 
 def parse_uploaded_file(uploaded_file, upload_type: str, exercise_type: str | None = None, exercise_level: str | None = None):
-    sheets = _read_file(uploaded_file)
+    with span("read_file") as rec:
+        sheets = _read_file(uploaded_file)
+        rec["rows"] = sum(len(x) for x in sheets.values())
     
     # Global Level Detection (default for file)
     global_detected_level = _detect_exercise_level_from_sheet(list(sheets.keys())) if not exercise_level else exercise_level
@@ -271,7 +274,8 @@ def parse_uploaded_file(uploaded_file, upload_type: str, exercise_type: str | No
         
         # If user explicitly selected "问答对" mode, treat all as QA
         if is_qa_mode:
-            nf, w = _normalize_qa(df)
+            with span(f"normalize[{name}]", rows=len(df)):
+                nf, w = _normalize_qa(df)
             if not nf.empty:
                 normalized_frames.append(nf)
             warnings_all.extend([f"[{name}] {x}" for x in w])
@@ -279,7 +283,8 @@ def parse_uploaded_file(uploaded_file, upload_type: str, exercise_type: str | No
             
         effective_sheet_type = exercise_type or sheet_detected_type
         
-        nf, w = _normalize_exercises(df, default_type_from_sheet=effective_sheet_type)
+        with span(f"normalize[{name}]", rows=len(df)):
+            nf, w = _normalize_exercises(df, default_type_from_sheet=effective_sheet_type)
         if not nf.empty:
             # Apply level if missing
             if "level" not in nf.columns or nf["level"].isna().all():
@@ -289,34 +294,31 @@ def parse_uploaded_file(uploaded_file, upload_type: str, exercise_type: str | No
         warnings_all.extend([f"[{name}] {x}" for x in w])
 
     if normalized_frames:
-        result = pd.concat(normalized_frames, ignore_index=True)
+        with span("concat"):
+            result = pd.concat(normalized_frames, ignore_index=True)
     else:
         result = pd.DataFrame()
 
+    # Normalization stage: each text column is normalized once (NFKC, full-width folding,
+    # whitespace / zero-width cleanup); type inference and quality checks read the shadows.
+    if not result.empty:
+        with span("normalize_text", rows=len(result)):
+            result = add_shadow_columns(result)
+
     # Final cleanup and type inference for rows that still lack type
     mixed_types = None
     if not result.empty and is_qa_mode is False:
-        
-        def infer_row_type(row):
-            t = str(row.get("type", "")).strip()
-            if t and t.lower() != "nan" and t != "": return _normalize_type(t)
-            
-            # Content-based inference
-            opts = str(row.get("options", "")).strip()
-            ans = str(row.get("answer", "")).strip().lower()
-            
-            if opts and opts.lower() != "nan" and opts != "": return "选择题"
-            
-            judge_keys = {"true", "false", "t", "f", "是", "否", "对", "错"}
-            if ans in judge_keys: return "判断题"
-            
-            if len(ans) <= 12 and len(ans) > 0: return "填空题"
-            return "简答题" 
-            
-        # Only apply inference where type is missing
-        # NOTE: if we filled it from sheet, it is likely filled. 
-        # But we run this to normalize the string (e.g. "Selection" -> "选择题")
-        result["type"] = result.apply(infer_row_type, axis=1)
+        # Explicit types are mapped to the canonical names (e.g. "Selection" -> "选择题");
+        # missing ones are inferred from the content.
+        with span("infer_type", rows=len(result)):
+            t, opts, ans = normalized(result, "type"), normalized(result, "options"), normalized(result, "answer").str.lower()
+            canonical = t.map({v: _normalize_type(v) for v in t.unique() if v})
+            judge_keys = ["true", "false", "t", "f", "是", "否", "对", "错"]
+            inferred = np.select(
+                [(opts != "").to_numpy(), ans.isin(judge_keys).to_numpy(), ans.str.len().between(1, 12).to_numpy()],
+                ["选择题", "判断题", "填空题"], "简答题")
+            result["type"] = canonical.where(t != "", pd.Series(inferred, index=result.index)).astype(object)
+            result = add_shadow_columns(result, ["type"], refresh=True)
         
         # Stats for mixed types
         counts = result["type"].value_counts().to_dict()
@@ -324,12 +326,14 @@ def parse_uploaded_file(uploaded_file, upload_type: str, exercise_type: str | No
             mixed_types = counts
             warnings_all.append("检测到混合题型/Multi-type detected: " + ", ".join([f"{k}:{v}" for k,v in counts.items()]))
 
-    columns = list(result.columns) if not result.empty else []
+    columns = [c for c in result.columns if not is_shadow(c)] if not result.empty else []
     
     quality_summary = None
     if not result.empty:
-        assessed = assess_qa(result) if is_qa_mode else assess_exercises(result)
-        quality_summary = summarize_quality(assessed)
+        with span("assess_quality", rows=len(result)):
+            assessed = assess_qa(result) if is_qa_mode else assess_exercises(result)
+        with span("summarize_quality"):
+            quality_summary = summarize_quality(assessed)
         result = assessed # Update result to include quality columns
 
     meta = {
@@ -352,18 +356,21 @@ def split_dataset_by_type(df: pd.DataFrame, meta: dict) -> List[Tuple[dict, pd.D
     """
     Split a parsed DataFrame into multiple DataFrames based on the 'type' column.
     Returns a list of (metadata, dataframe) tuples.
+
+    Partitions come from a single groupby pass (in order of first appearance) and are
+    not copied; callers must not modify them in place.
     """
     if df.empty or "type" not in df.columns:
         return [(meta, df)]
     
-    unique_types = df["type"].unique()
-    if len(unique_types) <= 1:
+    if df["type"].nunique(dropna=False) <= 1:
         return [(meta, df)]
         
+    groups = df.groupby("type", sort=False, dropna=True)
+        
     results = []
     base_filename = meta.get("filename", "upload")
-    for t in unique_types:
-        sub_df = df[df["type"] == t].copy()
+    for t, sub_df in groups:
         if sub_df.empty:
             continue
             
@@ -378,6 +385,7 @@ def split_dataset_by_type(df: pd.DataFrame, meta: dict) -> List[Tuple[dict, pd.D
              
         new_meta["type"] = "习题库" # Default content type
         new_meta["detected_type"] = "习题库" 
+        new_meta["exercise_type"] = str(t)
         new_meta["total"] = len(sub_df)
         
         # Re-assess quality for this slice specifically
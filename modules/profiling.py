@@ -0,0 +1,144 @@
+import cProfile
+import datetime as dt
+import json
+import os
+import pstats
+import re
+import time
+from pathlib import Path
+
+from modules.tracing import LOG_DIR
+
+PROFILE_DIR = LOG_DIR / "profiles"
+PROFILE_INDEX = "reruns.jsonl"
+PROFILE_ENV = "APP_PROFILE"
+# 仅保留最近的报告文件，索引保留更多行用于分支统计
+MAX_REPORTS = int(os.environ.get("APP_PROFILE_MAX_REPORTS", 200))
+MAX_INDEX_LINES = 5000
+TOP_N = 30
+
+
+def profiling_enabled(toggle: bool = False) -> bool:
+    return toggle or os.environ.get(PROFILE_ENV, "").strip().lower() in ("1", "true", "yes", "on")
+
+
+def _slug(text: str) -> str:
+    return re.sub(r"[^\w]+", "_", text).strip("_") or "rerun"
+
+
+def _short_path(path: str) -> str:
+    parts = Path(path).parts
+    return "/".join(parts[-2:]) if len(parts) > 1 else path
+
+
+class RerunProfile:
+    """cProfile + wall clock around one script rerun."""
+
+    def __init__(self, branch: str, user: str | None = None):
+        self.branch = branch
+        self.user = user
+        self.profiler = cProfile.Profile()
+        self.t0 = time.perf_counter()
+        self.profiler.enable()
+
+    def _top_functions(self, stats: pstats.Stats, key: str) -> list[dict]:
+        idx = {"cumulative": 3, "tottime": 2}[key]
+        rows = sorted(stats.stats.items(), key=lambda kv: kv[1][idx], reverse=True)[:TOP_N]
+        out = []
+        for (filename, line, func), (cc, nc, tt, ct, _) in rows:
+            out.append({
+                "function": f"{_short_path(filename)}:{line}({func})",
+                "calls": nc,
+                "tottime_ms": round(tt * 1000, 3),
+                "cumtime_ms": round(ct * 1000, 3),
+            })
+        return out
+
+    def finish(self) -> dict:
+        self.profiler.disable()
+        wall_ms = round((time.perf_counter() - self.t0) * 1000, 3)
+        stats = pstats.Stats(self.profiler)
+        now = dt.datetime.now()
+        report = {
+            "ts": now.isoformat(timespec="seconds"),
+            "branch": self.branch,
+            "user": self.user,
+            "wall_ms": wall_ms,
+            "top_cumulative": self._top_functions(stats, "cumulative"),
+            "top_tottime": self._top_functions(stats, "tottime"),
+        }
+        PROFILE_DIR.mkdir(parents=True, exist_ok=True)
+        name = f"{now.strftime('%Y%m%d-%H%M%S-%f')}_{_slug(self.branch)}.json"
+        with open(PROFILE_DIR / name, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=1)
+        entry = {"ts": report["ts"], "branch": self.branch, "user": self.user, "wall_ms": wall_ms, "report": name}
+        with open(PROFILE_DIR / PROFILE_INDEX, "a", encoding="utf-8") as f:
+            f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+        _rotate()
+        return entry
+
+
+def _rotate():
+    reports = sorted(p for p in PROFILE_DIR.glob("*.json"))
+    for p in reports[:-MAX_REPORTS] if len(reports) > MAX_REPORTS else []:
+        try:
+            p.unlink()
+        except OSError:
+            pass
+    index = PROFILE_DIR / PROFILE_INDEX
+    try:
+        lines = index.read_text(encoding="utf-8").splitlines()
+    except OSError:
+        return
+    if len(lines) > MAX_INDEX_LINES * 2:
+        tmp = index.with_suffix(".tmp")
+        tmp.write_text("\n".join(lines[-MAX_INDEX_LINES:]) + "\n", encoding="utf-8")
+        os.replace(tmp, index)
+
+
+def load_rerun_index() -> list[dict]:
+    index = PROFILE_DIR / PROFILE_INDEX
+    if not index.exists():
+        return []
+    items = []
+    with open(index, "r", encoding="utf-8") as f:
+        for ln in f:
+            try:
+                items.append(json.loads(ln))
+            except ValueError:
+                continue
+    return items
+
+
+def list_slowest_reruns(n: int = 20) -> list[dict]:
+    items = load_rerun_index()
+    for it in items:
+        it["has_report"] = (PROFILE_DIR / it.get("report", "")).is_file()
+    return sorted(items, key=lambda x: -float(x.get("wall_ms", 0)))[:n]
+
+
+def branch_summary() -> list[dict]:
+    groups: dict[str, list[float]] = {}
+    for it in load_rerun_index():
+        groups.setdefault(it.get("branch", "-"), []).append(float(it.get("wall_ms", 0)))
+    rows = []
+    for branch, vals in groups.items():
+        vals.sort()
+        p95 = vals[min(len(vals) - 1, int(round(0.95 * (len(vals) - 1))))]
+        rows.append({
+            "branch": branch,
+            "reruns": len(vals),
+            "total_ms": round(sum(vals), 1),
+            "mean_ms": round(sum(vals) / len(vals), 1),
+            "p95_ms": round(p95, 1),
+            "max_ms": round(vals[-1], 1),
+        })
+    return sorted(rows, key=lambda r: -r["total_ms"])
+
+
+def load_profile_report(name: str) -> dict | None:
+    p = PROFILE_DIR / Path(name).name
+    if not p.is_file():
+        return None
+    with open(p, "r", encoding="utf-8") as f:
+        return json.load(f)
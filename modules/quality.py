@@ -1,20 +1,50 @@
 import re
+import numpy as np
 import pandas as pd
 
+from modules.normalize import normalized
+
+# 入库门槛：Error 行占比超过该值时需强制入库
+QUALITY_ERROR_RATIO_THRESHOLD = 0.05
+# 解析/质检规则变更时递增，使已缓存的解析结果失效
+RULES_VERSION = "2"
+# Error 代码 → 预览中需要标红的列（问答对与习题的代码互不重叠）
+ERROR_HIGHLIGHT_COLUMNS = {
+    "Q_EMPTY": "question", "Q_GARBLED": "question",
+    "A_EMPTY": "answer", "A_GARBLED": "answer",
+    "STEM_EMPTY": "stem", "STEM_GARBLED": "stem",
+    "OPT_EMPTY": "options", "OPT_GARBLED": "options",
+    "ANS_EMPTY": "answer", "ANS_GARBLED": "answer", "ANS_NOT_IN_OPTS": "answer", "ANS_INVALID": "answer",
+    "KN_EMPTY": "knowledge", "KN_GARBLED": "knowledge",
+}
+_ERROR_CODE_RE = r"(?:^|\|)Error:([A-Z_]+)"
+
 
 def _flag(level: str, code: str, msg: str) -> str:
     return f"{level}:{code}:{msg}"
 
 
+def _values(df: pd.DataFrame, col: str) -> list[str]:
+    # 规范化影子列（解析阶段已算好时直接复用）："" 表示缺失
+    return normalized(df, col).tolist()
+
+
+def _with_columns(df: pd.DataFrame, cols: pd.DataFrame) -> pd.DataFrame:
+    # 写时复制：assign 只追加新列，原有列与调用方共享数据
+    return df.assign(**{c: cols[c] for c in cols.columns})
+
+
 def assess_qa(df: pd.DataFrame) -> pd.DataFrame:
-    df = df.copy()
+    return _with_columns(df, qa_quality_columns(df))
+
+
+def qa_quality_columns(df: pd.DataFrame) -> pd.DataFrame:
+    """quality_score / quality_flags for QA rows, aligned to df.index (df itself is not copied)."""
     scores = []
     flags = []
-    for _, row in df.iterrows():
+    for q, a in zip(_values(df, "question"), _values(df, "answer")):
         s = 100
         f = []
-        q = str(row.get("question", "") or "").strip()
-        a = str(row.get("answer", "") or "").strip()
         if not q:
             s -= 50
             f.append(_flag("Error", "Q_EMPTY", "问题为空"))
@@ -39,9 +69,7 @@ def assess_qa(df: pd.DataFrame) -> pd.DataFrame:
         #     f.append(_flag("Error", "A_GARBLED", "答案疑似乱码"))
         scores.append(max(0, s))
         flags.append("|".join(f))
-    df["quality_score"] = scores
-    df["quality_flags"] = flags
-    return df
+    return pd.DataFrame({"quality_score": scores, "quality_flags": flags}, index=df.index)
 
 
 def _parse_options_text(text: str) -> set:
@@ -94,16 +122,21 @@ def _normalize_type(t: str) -> str:
 
 
 def assess_exercises(df: pd.DataFrame) -> pd.DataFrame:
-    df = df.copy()
+    return _with_columns(df, exercise_quality_columns(df))
+
+
+def exercise_quality_columns(df: pd.DataFrame) -> pd.DataFrame:
+    """quality_score / quality_flags for exercise rows, aligned to df.index (df itself is not copied)."""
     scores = []
     flags = []
-    for _, row in df.iterrows():
+    types = normalized(df, "type")
+    # 题型归一按取值去重后计算，而非逐行
+    types = types.map({v: _normalize_type(v) for v in types.unique()}).tolist()
+    rows = zip(types, _values(df, "stem"), _values(df, "answer"), _values(df, "options"),
+               _values(df, "analysis"), _values(df, "knowledge"))
+    for t, stem, ans, opts_text, analysis, knowledge in rows:
         s = 100
         f = []
-        t = _normalize_type(row.get("type", ""))
-        stem = str(row.get("stem", "") or "").strip()
-        ans = str(row.get("answer", "") or "").strip()
-        opts_text = row.get("options", None)
         if not stem:
             s -= 50
             f.append(_flag("Error", "STEM_EMPTY", "题干为空"))
@@ -150,11 +183,9 @@ def assess_exercises(df: pd.DataFrame) -> pd.DataFrame:
                 f.append(_flag("Error", "ANS_SHORT", "填空题答案过短"))
         else:
             # 简答/论述/案例
-            analysis = str(row.get("analysis", "") or "")
-            if analysis and analysis.strip() and analysis.strip() == ans:
+            if analysis and analysis == ans:
                 s -= 10
                 f.append(_flag("Info", "AN_EQ_ANS", "解析与答案相同"))
-        knowledge = str(row.get("knowledge", "") or "").strip()
         if not knowledge:
             s -= 20
             f.append(_flag("Error", "KN_EMPTY", "知识点缺失"))
@@ -163,9 +194,7 @@ def assess_exercises(df: pd.DataFrame) -> pd.DataFrame:
         #     f.append(_flag("Error", "KN_GARBLED", "知识点疑似乱码"))
         scores.append(max(0, s))
         flags.append("|".join(f))
-    df["quality_score"] = scores
-    df["quality_flags"] = flags
-    return df
+    return pd.DataFrame({"quality_score": scores, "quality_flags": flags}, index=df.index)
 
 
 def summarize_quality(df: pd.DataFrame) -> dict:
@@ -200,6 +229,24 @@ def summarize_quality(df: pd.DataFrame) -> dict:
         "errors": err_map,
         "warns": warn_map,
     }
+
+
+def error_cell_mask(df: pd.DataFrame, flags) -> pd.DataFrame:
+    """Boolean frame shaped like df, True where the row's Error flags point at that column.
+
+    flags is aligned with df by position (e.g. the quality_flags of the same page slice).
+    """
+    mask = np.zeros(df.shape, dtype=bool)
+    col_pos = {c: i for i, c in enumerate(df.columns)}
+    targets = {code: col_pos[col] for code, col in ERROR_HIGHLIGHT_COLUMNS.items() if col in col_pos}
+    if len(df) and targets:
+        codes = pd.Series(np.asarray(flags, dtype=object)).fillna("").astype(str).str.extractall(_ERROR_CODE_RE)[0]
+        cols = codes.map(targets).dropna()
+        if not cols.empty:
+            mask[cols.index.get_level_values(0).to_numpy(), cols.to_numpy(dtype=int)] = True
+    return pd.DataFrame(mask, index=df.index, columns=df.columns)
+
+
 def _is_garbled(text: str) -> bool:
     if not text:
         return False
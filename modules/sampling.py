@@ -0,0 +1,204 @@
+import hashlib
+import json
+import os
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from modules.cache import BASE_CACHE, corpus_version
+from modules.quality import assess_qa, assess_exercises
+from modules.storage import list_parsed_datasets, iter_csv_chunks
+
+SAMPLE_DIR = BASE_CACHE / "samples"
+SAMPLE_SIZE = 20
+# 按块读取已入库文件，内存只保留每个分层的候选行
+SAMPLE_CHUNK_ROWS = int(os.environ.get("SAMPLE_CHUNK_ROWS", 5000))
+# 可用的分层维度 → 抽样结果中的列名
+STRATA_COLUMNS = {"college": "_college", "level": "_level", "type": "_type", "flag": "_flag"}
+DEFAULT_STRATA = ("college", "level", "type")
+_KEY = "_sample_key"
+
+
+def _seed_int(*parts) -> int:
+    h = hashlib.sha256("\x1f".join(str(p) for p in parts).encode("utf-8")).digest()
+    return int.from_bytes(h[:8], "little")
+
+
+def make_sample_id(params: dict) -> str:
+    """Stable id for a sampling request: same params (incl. seed and corpus version) → same id."""
+    raw = json.dumps(params, ensure_ascii=False, sort_keys=True, default=str)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()[:12]
+
+
+def flag_class(flags) -> np.ndarray:
+    """Collapse quality_flags strings to Error / Warn / OK."""
+    s = pd.Series(np.asarray(flags, dtype=object)).fillna("").astype(str)
+    return np.where(s.str.contains(r"(?:^|\|)Error:"), "Error",
+                    np.where(s.str.contains(r"(?:^|\|)Warn:"), "Warn", "OK"))
+
+
+def allocate(sizes: dict, n: int) -> dict:
+    """Split n across strata proportionally to their sizes (largest remainder).
+
+    Every non-empty stratum gets at least one row when there are no more strata than n.
+    """
+    keys = sorted((k for k, v in sizes.items() if v > 0), key=str)
+    total = sum(sizes[k] for k in keys)
+    alloc = {k: 0 for k in sizes}
+    if total == 0 or n <= 0:
+        return alloc
+    if total <= n:
+        alloc.update({k: sizes[k] for k in keys})
+        return alloc
+    quota = {k: n * sizes[k] / total for k in keys}
+    floor = 1 if len(keys) <= n else 0
+    for k in keys:
+        alloc[k] = min(sizes[k], max(floor, int(quota[k])))
+    while sum(alloc.values()) > n:
+        k = max((k for k in keys if alloc[k] > 1), key=lambda k: (alloc[k] - quota[k], str(k)))
+        alloc[k] -= 1
+    while sum(alloc.values()) < n:
+        k = max((k for k in keys if alloc[k] < sizes[k]), key=lambda k: (quota[k] - alloc[k], str(k)))
+        alloc[k] += 1
+    return alloc
+
+
+class StratifiedReservoir:
+    """Seeded reservoir per stratum: keeps the `capacity` rows with the smallest random keys.
+
+    The m smallest keys of a stratum are a uniform sample of it, so any allocation up to
+    `capacity` can be served after a single pass.
+    """
+
+    def __init__(self, capacity: int, strata: list[str]):
+        self.capacity = capacity
+        self.strata = list(strata)
+        self.sizes: dict = {}
+        self._parts: dict = {}
+
+    def offer(self, chunk: pd.DataFrame, keys: np.ndarray):
+        if chunk.empty:
+            return
+        chunk = chunk.assign(**{_KEY: keys})
+        groups = chunk.groupby(self.strata, sort=False, dropna=False, observed=True) if self.strata else [((), chunk)]
+        for stratum, part in groups:
+            stratum = stratum if isinstance(stratum, tuple) else (stratum,)
+            self.sizes[stratum] = self.sizes.get(stratum, 0) + len(part)
+            cur = self._parts.get(stratum)
+            merged = part if cur is None else pd.concat([cur, part])
+            self._parts[stratum] = merged.nsmallest(self.capacity, _KEY)
+
+    def result(self, n: int) -> pd.DataFrame:
+        alloc = allocate(self.sizes, n)
+        parts = [self._parts[k].nsmallest(m, _KEY) for k, m in sorted(alloc.items(), key=lambda kv: str(kv[0])) if m]
+        if not parts:
+            return pd.DataFrame()
+        return pd.concat(parts).drop(columns=[_KEY])
+
+
+def sample_frame(df: pd.DataFrame, n: int = SAMPLE_SIZE, seed: int = 0, by: list[str] | None = None) -> pd.DataFrame:
+    """Seeded, stratified sample of an in-memory frame; the same seed always returns the same rows."""
+    if df is None or df.empty:
+        return df
+    by = [c for c in (by or []) if c in df.columns]
+    rng = np.random.default_rng(_seed_int(seed, "frame", len(df)))
+    res = StratifiedReservoir(n, by)
+    res.offer(df, rng.random(len(df)))
+    return res.result(n)
+
+
+def _assess_chunk(chunk: pd.DataFrame, kind: str) -> np.ndarray:
+    assessed = assess_qa(chunk) if kind == "qa" else assess_exercises(chunk)
+    return flag_class(assessed["quality_flags"])
+
+
+def _sample_paths(sample_id: str) -> tuple[Path, Path]:
+    return SAMPLE_DIR / f"{sample_id}.json", SAMPLE_DIR / f"{sample_id}.csv"
+
+
+def load_sample(sample_id: str) -> tuple[dict, pd.DataFrame] | None:
+    """Return (meta, rows) of a previously drawn sample, or None."""
+    meta_path, rows_path = _sample_paths(Path(sample_id).name)
+    if not meta_path.exists() or not rows_path.exists():
+        return None
+    try:
+        with open(meta_path, "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        return meta, pd.read_csv(rows_path, encoding="utf-8", dtype=str, keep_default_na=False)
+    except Exception:
+        return None
+
+
+def _store_sample(sample_id: str, meta: dict, rows: pd.DataFrame):
+    SAMPLE_DIR.mkdir(parents=True, exist_ok=True)
+    meta_path, rows_path = _sample_paths(sample_id)
+    tmp = rows_path.with_suffix(".csv.tmp")
+    rows.to_csv(tmp, index=False, encoding="utf-8")
+    os.replace(tmp, rows_path)
+    tmp = meta_path.with_suffix(".json.tmp")
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(meta, f, ensure_ascii=False)
+    os.replace(tmp, meta_path)
+
+
+def draw_corpus_sample(colleges: list[str], n: int = SAMPLE_SIZE, seed: int = 0,
+                       strata: tuple[str, ...] = DEFAULT_STRATA,
+                       levels: list[str] | None = None, types: list[str] | None = None) -> tuple[str, pd.DataFrame]:
+    """Stratified reservoir sample across the stored corpus of the given colleges.
+
+    Files are streamed in chunks; memory stays at O(n × strata + chunk). The result is
+    persisted under its sample id, so reruns (and other reviewers) get the same rows until
+    the corpus changes. Rows carry _college/_level/_type(/_flag) plus _source and _row.
+    """
+    strata = tuple(s for s in STRATA_COLUMNS if s in strata)
+    params = {
+        "colleges": sorted(colleges), "n": n, "seed": seed, "strata": list(strata),
+        "levels": sorted(levels) if levels else None, "types": sorted(types) if types else None,
+        "corpus": corpus_version(colleges),
+    }
+    sample_id = make_sample_id(params)
+    cached = load_sample(sample_id)
+    if cached is not None:
+        return sample_id, cached[1]
+
+    res = StratifiedReservoir(n, [STRATA_COLUMNS[s] for s in strata])
+    scanned = 0
+    for code in sorted(colleges):
+        for it in sorted(list_parsed_datasets(code), key=lambda x: x["path"]):
+            level = it.get("level") or "-"
+            if levels and level not in levels:
+                continue
+            # 分区题型不在所选范围内的文件整体跳过（混合 / 未分类按行过滤）
+            kind = "问答对" if it["type"] == "qa" else it.get("exercise_type")
+            if types and kind and kind not in types and kind not in ("混合", "未分类"):
+                continue
+            rng = np.random.default_rng(_seed_int(seed, it["path"]))
+            for chunk in iter_csv_chunks(it["path"], SAMPLE_CHUNK_ROWS):
+                if chunk.empty:
+                    continue
+                keys = rng.random(len(chunk))
+                if it["type"] == "qa":
+                    kinds = np.full(len(chunk), "问答对", dtype=object)
+                else:
+                    kinds = chunk["type"].fillna("-").astype(str).to_numpy() if "type" in chunk.columns else np.full(len(chunk), "-", dtype=object)
+                if types:
+                    keep = np.isin(kinds, types)
+                    chunk, keys, kinds = chunk[keep], keys[keep], kinds[keep]
+                    if chunk.empty:
+                        continue
+                chunk = chunk.assign(_college=code, _level=level, _type=kinds,
+                                     _source=it["path"], _row=chunk.index.to_numpy())
+                if "flag" in strata:
+                    chunk["_flag"] = _assess_chunk(chunk, it["type"])
+                scanned += len(chunk)
+                res.offer(chunk, keys)
+
+    rows = res.result(n)
+    meta = dict(params, id=sample_id, created=time.time(), scanned=scanned,
+                strata_sizes={"|".join(map(str, k)): v for k, v in res.sizes.items()})
+    _store_sample(sample_id, meta, rows)
+    # 与之后命中缓存时读取的内容保持一致
+    stored = load_sample(sample_id)
+    return sample_id, (stored[1] if stored is not None else rows)
@@ -0,0 +1,321 @@
+"""Persistent full-text index over every stored item (SQLite FTS5, trigram tokenizer).
+
+The same database keeps the knowledge-point postings (modules.knowledge), so both are
+maintained in one transaction per file.
+
+Saving a parsed file re-indexes it and deleting one drops its rows; files rewritten outside
+those paths (compaction, compression, layout migration, manual edits) are picked up by
+sync_index, which only re-reads files whose size or mtime changed.
+
+Terms of three or more characters use the trigram index; shorter terms (common for Chinese
+keywords) use a second, contentless FTS5 table over the overlapping character bigrams of
+the same fields, so neither path scans the corpus.
+"""
+import sqlite3
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+
+import pandas as pd
+
+import modules.storage as storage
+from modules.tracing import span
+
+SEARCH_DIRNAME = "_search"
+SEARCH_DB_NAME = "index.db"
+SEARCH_FIELDS = ("stem", "question", "answer", "analysis", "knowledge")
+SEARCH_PAGE_SIZE = 20
+# trigram 分词器只能用索引匹配不少于 3 个字符的词，更短的词走二元组索引
+MIN_MATCH_CHARS = 3
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS sources (
+    src TEXT PRIMARY KEY,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS items (
+    id INTEGER PRIMARY KEY,
+    src TEXT NOT NULL,
+    row INTEGER NOT NULL,
+    college_dir TEXT,
+    kind TEXT NOT NULL,
+    level TEXT,
+    exercise_type TEXT,
+    date TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_items_src ON items(src);
+CREATE VIRTUAL TABLE IF NOT EXISTS items_fts USING fts5(
+    stem, question, answer, analysis, knowledge, tokenize='trigram'
+);
+CREATE VIRTUAL TABLE IF NOT EXISTS items_bigram USING fts5(
+    grams, content='', prefix='1', tokenize='unicode61 remove_diacritics 0'
+);
+CREATE TABLE IF NOT EXISTS item_knowledge (
+    point TEXT NOT NULL,
+    item_id INTEGER NOT NULL,
+    PRIMARY KEY (point, item_id)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS idx_item_knowledge_item ON item_knowledge(item_id);
+"""
+# 索引结构或知识点规范化规则变化时递增：旧索引的来源记录被清空，由下次 sync_index 全部重建
+SCHEMA_VERSION = 3
+
+_init_lock = threading.Lock()
+_initialized: set[str] = set()
+_available: bool | None = None
+
+
+def search_available() -> bool:
+    """Whether this SQLite build has FTS5 with the trigram tokenizer (SQLite >= 3.34)."""
+    global _available
+    if _available is None:
+        conn = sqlite3.connect(":memory:")
+        try:
+            conn.execute("CREATE VIRTUAL TABLE t USING fts5(x, tokenize='trigram')")
+            _available = True
+        except sqlite3.OperationalError:
+            _available = False
+        finally:
+            conn.close()
+    return _available
+
+
+def search_db() -> Path:
+    return storage.BASE / SEARCH_DIRNAME / SEARCH_DB_NAME
+
+
+@contextmanager
+def _connect():
+    db = search_db()
+    db.parent.mkdir(parents=True, exist_ok=True)
+    conn = sqlite3.connect(db, timeout=10)
+    try:
+        key = str(db.resolve())
+        if key not in _initialized:
+            with _init_lock:
+                if key not in _initialized:
+                    conn.execute("PRAGMA journal_mode=WAL")
+                    conn.executescript(_SCHEMA)
+                    if conn.execute("PRAGMA user_version").fetchone()[0] < SCHEMA_VERSION:
+                        # 结构或分词规则变更：清空全部索引数据，由下次同步按新规则重建
+                        _clear_index(conn)
+                        conn.execute(f"PRAGMA user_version={SCHEMA_VERSION}")
+                    conn.commit()
+                    _initialized.add(key)
+        yield conn
+    finally:
+        conn.close()
+
+
+def _clear_index(conn: sqlite3.Connection):
+    conn.executescript("INSERT INTO items_bigram(items_bigram) VALUES ('delete-all'); "
+                       "DELETE FROM items_fts; DELETE FROM item_knowledge; DELETE FROM items; DELETE FROM sources;")
+
+
+def _texts(df: pd.DataFrame, col: str) -> list:
+    if col not in df.columns:
+        return [None] * len(df)
+    return [None if pd.isna(v) or v == "" else str(v) for v in df[col].tolist()]
+
+
+def _bigrams(texts) -> str:
+    # 相邻两字的二元组，另加末字单字：单字词按前缀查询也能命中文本末尾
+    out = []
+    for t in texts:
+        if t:
+            out.extend(map("".join, zip(t, t[1:])))
+            out.append(t[-1])
+    return " ".join(out)
+
+
+def _read_items(it: dict, df: pd.DataFrame | None = None) -> tuple[pd.DataFrame, dict]:
+    st = Path(it["path"]).stat()
+    it = dict(it, college=it["college_dir"])
+    columns = list(SEARCH_FIELDS) + ["type", "level", "date"]
+    df = storage._read_parsed(it, columns) if df is None else storage._frame_as_read(df, it, columns)
+    return df.reset_index(drop=True), {"size": st.st_size, "mtime_ns": st.st_mtime_ns}
+
+
+def _delete_source(conn, src: str) -> int:
+    # 无内容表删除时须提供原词元：由 items_fts 中保存的原文重新生成
+    cur = conn.execute(
+        f"SELECT rowid, {', '.join(SEARCH_FIELDS)} FROM items_fts WHERE rowid IN (SELECT id FROM items WHERE src=?)", (src,))
+    conn.executemany("INSERT INTO items_bigram(items_bigram, rowid, grams) VALUES ('delete', ?, ?)",
+                     ((rid, _bigrams(texts)) for rid, *texts in cur.fetchall()))
+    conn.execute("DELETE FROM items_fts WHERE rowid IN (SELECT id FROM items WHERE src=?)", (src,))
+    conn.execute("DELETE FROM item_knowledge WHERE item_id IN (SELECT id FROM items WHERE src=?)", (src,))
+    n = conn.execute("DELETE FROM items WHERE src=?", (src,)).rowcount
+    conn.execute("DELETE FROM sources WHERE src=?", (src,))
+    return n
+
+
+def _insert_source(conn, it: dict, df: pd.DataFrame, stat: dict) -> None:
+    src = storage.relpath(it["path"])
+    _delete_source(conn, src)
+    start = conn.execute("SELECT COALESCE(MAX(id), 0) FROM items").fetchone()[0] + 1
+    ids = range(start, start + len(df))
+    if it["type"] == "qa":
+        etypes = [storage.QA_PARTITION] * len(df)
+    else:
+        etypes = _texts(df, "type") if "type" in df.columns else [it.get("exercise_type")] * len(df)
+    levels = _texts(df, "level") if "level" in df.columns else [it["level"]] * len(df)
+    dates = _texts(df, "date") if "date" in df.columns else [it["date"]] * len(df)
+    conn.executemany(
+        "INSERT INTO items(id, src, row, college_dir, kind, level, exercise_type, date) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+        zip(ids, [src] * len(df), range(len(df)), [it["college_dir"]] * len(df), [it["type"]] * len(df),
+            levels, etypes, dates))
+    texts = list(zip(*(_texts(df, c) for c in SEARCH_FIELDS)))
+    conn.executemany(
+        "INSERT INTO items_fts(rowid, stem, question, answer, analysis, knowledge) VALUES (?, ?, ?, ?, ?, ?)",
+        ((i, *t) for i, t in zip(ids, texts)))
+    conn.executemany("INSERT INTO items_bigram(rowid, grams) VALUES (?, ?)",
+                     ((i, _bigrams(t)) for i, t in zip(ids, texts)))
+    # 知识点倒排：多值单元格拆分、规范化后逐个登记
+    from modules.knowledge import split_points
+    if "knowledge" in df.columns:
+        points = split_points(df["knowledge"])
+        conn.executemany("INSERT OR IGNORE INTO item_knowledge(point, item_id) VALUES (?, ?)",
+                         zip(points.tolist(), (start + points.index.to_numpy()).tolist()))
+    conn.execute("INSERT OR REPLACE INTO sources(src, size, mtime_ns) VALUES (?, ?, ?)",
+                 (src, stat["size"], stat["mtime_ns"]))
+
+
+def index_file(path, df: pd.DataFrame | None = None) -> int:
+    """(Re)index one parsed file under storage.BASE; returns the number of items indexed.
+
+    df is the file's content already parsed by the writer (see storage._write_parsed); otherwise the file is read.
+    """
+    if not search_available() or storage.relpath(path) is None:
+        return 0
+    it = storage.parsed_item(path)
+    df, stat = _read_items(it, df)
+    with _connect() as conn:
+        conn.execute("BEGIN IMMEDIATE")
+        _insert_source(conn, it, df, stat)
+        conn.commit()
+    return len(df)
+
+
+def remove_file(path) -> int:
+    """Drop the items of a deleted parsed file from the index."""
+    src = storage.relpath(path)
+    if not search_available() or src is None:
+        return 0
+    with _connect() as conn:
+        n = _delete_source(conn, src)
+        conn.commit()
+    return n
+
+
+def sync_index(rebuild: bool = False) -> dict:
+    """Reconcile the index with the parsed files on disk; only new or changed files are read.
+
+    Returns {indexed, removed, files, skipped}; skipped lists {path, error} as merge_parsed does.
+    """
+    result = {"indexed": 0, "removed": 0, "files": 0, "skipped": []}
+    if not search_available():
+        return result
+    with span("sync_index") as rec, _connect() as conn:
+        if rebuild:
+            _clear_index(conn)
+        known = {src: (size, mtime) for src, size, mtime in conn.execute("SELECT src, size, mtime_ns FROM sources")}
+        on_disk = set()
+        todo = []
+        for it in storage.list_all_parsed():
+            src = storage.relpath(it["path"])
+            try:
+                st = Path(it["path"]).stat()
+            except OSError:
+                continue
+            on_disk.add(src)
+            if known.get(src) != (st.st_size, st.st_mtime_ns):
+                todo.append(it)
+        gone = [src for src in known if src not in on_disk]
+        for src in gone:
+            result["removed"] += _delete_source(conn, src)
+        for it in todo:
+            try:
+                df, stat = _read_items(it)
+            except Exception as e:
+                result["skipped"].append({"path": it["path"], "error": f"{type(e).__name__}: {e}"})
+                continue
+            _insert_source(conn, it, df, stat)
+            result["indexed"] += len(df)
+            result["files"] += 1
+        conn.commit()
+        rec["rows"] = result["indexed"]
+    return result
+
+
+def _match_expr(terms: list[str], prefix: bool = False) -> str:
+    # 每个词作为短语匹配（转义双引号），多个词之间为 AND；单字词在二元组索引中按前缀匹配
+    return " ".join('"' + t.replace('"', '""') + '"' + (" *" if prefix and len(t) == 1 else "") for t in terms)
+
+
+def _like_pattern(term: str) -> str:
+    return "%" + term.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%"
+
+
+def search(query: str, colleges: list[str] | None = None, exercise_types: list[str] | None = None,
+           page: int = 1, page_size: int = SEARCH_PAGE_SIZE) -> tuple[list[dict], int]:
+    """Items whose stem/question/answer/analysis/knowledge contain every whitespace-separated term.
+
+    Terms of three or more characters go through the trigram index (ranked by bm25); shorter
+    terms go through the bigram index, and only short terms containing punctuation fall back
+    to LIKE. colleges are codes; exercise_types are 题型 values (QA items
+    are "问答对"). Returns (rows of the requested page, total matches).
+    """
+    terms = [t for t in (query or "").split() if t]
+    if not terms or not search_available():
+        return [], 0
+    long_terms = [t for t in terms if len(t) >= MIN_MATCH_CHARS]
+    short_terms = [t for t in terms if len(t) < MIN_MATCH_CHARS and t.isalnum()]
+    where, args = [], []
+    if long_terms:
+        where.append("items_fts MATCH ?")
+        args.append(_match_expr(long_terms))
+    if short_terms:
+        where.append("items.id IN (SELECT rowid FROM items_bigram WHERE items_bigram MATCH ?)")
+        args.append(_match_expr(short_terms, prefix=True))
+    for t in terms:
+        if len(t) >= MIN_MATCH_CHARS or t in short_terms:
+            continue
+        where.append("(" + " OR ".join(f"items_fts.{c} LIKE ? ESCAPE '\\'" for c in SEARCH_FIELDS) + ")")
+        args.extend([_like_pattern(t)] * len(SEARCH_FIELDS))
+    if colleges is not None:
+        dirs = sorted({p.name for c in colleges for p in storage._dirnames_for_college(c)})
+        where.append(f"items.college_dir IN ({','.join('?' * len(dirs))})")
+        args.extend(dirs)
+    if exercise_types is not None:
+        where.append(f"items.exercise_type IN ({','.join('?' * len(exercise_types))})")
+        args.extend(exercise_types)
+    clause = " AND ".join(where)
+    order = "items_fts.rank, items.id" if long_terms else "items.id"
+    with span("search") as rec, _connect() as conn:
+        total = conn.execute(
+            f"SELECT COUNT(*) FROM items_fts JOIN items ON items.id = items_fts.rowid WHERE {clause}", args).fetchone()[0]
+        cur = conn.execute(
+            f"SELECT items.id, items.src, items.row, items.college_dir, items.kind, items.level, items.exercise_type, "
+            f"items.date, {', '.join('items_fts.' + c for c in SEARCH_FIELDS)} "
+            f"FROM items_fts JOIN items ON items.id = items_fts.rowid WHERE {clause} ORDER BY {order} LIMIT ? OFFSET ?",
+            args + [int(page_size), max(0, (int(page) - 1) * int(page_size))])
+        rows = []
+        display = {}
+        for rid, src, row, cdir, kind, level, etype, date, *texts in cur.fetchall():
+            if cdir not in display:
+                display[cdir] = storage.get_college_display(cdir)
+            rows.append(dict(zip(SEARCH_FIELDS, texts), id=rid, path=src, file=storage.plain_name(Path(src).name),
+                             row=row, college=display[cdir], type=kind, level=level, exercise_type=etype, date=date))
+        rec["rows"] = len(rows)
+    return rows, int(total)
+
+
+def index_stats() -> dict:
+    """Indexed item and file counts."""
+    if not search_available():
+        return {"items": 0, "files": 0}
+    with _connect() as conn:
+        items = conn.execute("SELECT COUNT(*) FROM items").fetchone()[0]
+        files = conn.execute("SELECT COUNT(*) FROM sources").fetchone()[0]
+    return {"items": int(items), "files": int(files)}
@@ -0,0 +1,494 @@
+"""Offline "similar items" engine: character n-gram TF-IDF over stems, cosine top-k by sparse products.
+
+Each parsed file under storage.BASE keeps its raw n-gram count matrix (hashed features, so
+files are vectorized independently) and a small item table under <storage>/_similar. Saving
+a file writes its matrix, deleting one drops it; IDF weights are derived from the stored
+counts when the matrices are loaded, so uploads never rewrite other files' data.
+"""
+import hashlib
+import json
+import os
+import re
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+import modules.storage as storage
+from modules.normalize import add_shadow_columns, normalize_text, normalized
+from modules.tracing import span
+
+SIMILARITY_DIRNAME = "_similar"
+SIMILARITY_MANIFEST = "manifest.json"
+# 向量化规则（文本规范化、n-gram、哈希）变更时递增，旧矩阵在下次同步时重新计算
+VECTOR_VERSION = 2
+NGRAM_RANGE = (2, 3)
+FEATURE_BITS = 20
+N_FEATURES = 2 ** FEATURE_BITS
+# 出现在超过该比例条目中的 n-gram（如“下列”“的是”）不参与相似度；语料过小时不裁剪
+MAX_DF = 0.2
+MAX_DF_MIN_ITEMS = 100
+SIMILAR_TOP_K = 5
+# 知识点建议：取近邻题目的知识点按相似度加权投票；最近邻低于 SUGGEST_MIN_SCORE 时不给建议
+SUGGEST_NEIGHBORS = 5
+SUGGEST_MIN_SCORE = 0.3
+# 建议时召回候选所用的 n-gram 数（按 TF-IDF 权重取前若干个）
+SUGGEST_QUERY_TERMS = 12
+# 批量查询时每次与全库相乘的查询行数，限制相似度矩阵的内存
+QUERY_CHUNK = 256
+META_COLUMNS = ("src", "row", "college_dir", "level", "exercise_type", "date", "stem", "answer", "knowledge")
+_WS = re.compile(r"\s+")
+_HASH_MULT = np.uint64(0x9E3779B97F4A7C15)
+_lock = threading.Lock()
+_cache: dict = {}
+
+
+def similarity_available() -> bool:
+    try:
+        import scipy.sparse  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+
+def similarity_dir() -> Path:
+    return storage.BASE / SIMILARITY_DIRNAME
+
+
+@contextmanager
+def _locked():
+    with _lock, storage._file_lock(similarity_dir() / ".lock"):
+        yield
+
+
+def _fold(norm: pd.Series) -> list[str]:
+    # 在 normalize_text 结果上再去空白、转小写，作为 n-gram 的输入
+    return norm.str.lower().str.replace(_WS, "", regex=True).tolist()
+
+
+def _normalize(texts) -> list[str]:
+    return _fold(normalize_text(pd.Series(list(texts), dtype=object)))
+
+
+def vectorize(texts, prenormalized: bool = False) -> "scipy.sparse.csr_matrix":
+    """Hashed character n-gram counts (one row per text), computed over all texts at once.
+
+    prenormalized=True means texts already went through normalize_text (e.g. parse shadow columns).
+    """
+    from scipy import sparse
+
+    norm = _fold(pd.Series(list(texts), dtype=str)) if prenormalized else _normalize(texts)
+    n = len(norm)
+    if not n:
+        return sparse.csr_matrix((0, N_FEATURES), dtype=np.float32)
+    # 全部文本拼成一个码点数组（以 0 分隔），按位移一次性算出所有 n-gram 的哈希
+    cps = np.frombuffer("\x00".join(norm).encode("utf-32-le"), dtype=np.uint32).astype(np.uint64)
+    doc = np.cumsum(cps == 0)
+    rows, cols = [], []
+    for k in range(NGRAM_RANGE[0], NGRAM_RANGE[1] + 1):
+        if len(cps) < k:
+            continue
+        m = len(cps) - k + 1
+        h = np.full(m, k, dtype=np.uint64)
+        for j in range(k):
+            h = h * np.uint64(0x110001) + cps[j:j + m]
+        valid = (cps[:m] != 0) & (doc[:m] == doc[k - 1:k - 1 + m])
+        rows.append(doc[:m][valid])
+        cols.append(((h[valid] * _HASH_MULT) >> np.uint64(64 - FEATURE_BITS)).astype(np.int64))
+    if not rows:
+        return sparse.csr_matrix((n, N_FEATURES), dtype=np.float32)
+    r = np.concatenate(rows)
+    c = np.concatenate(cols)
+    out = sparse.csr_matrix((np.ones(len(r), dtype=np.float32), (r, c)), shape=(n, N_FEATURES))
+    out.sum_duplicates()
+    return out
+
+
+def _item_texts(df: pd.DataFrame) -> pd.Series:
+    stem = df["stem"] if "stem" in df.columns else pd.Series([None] * len(df), index=df.index)
+    if "question" in df.columns:
+        stem = stem.where(stem.notna() & (stem.astype(str) != ""), df["question"])
+    return stem
+
+
+def _item_norm_texts(df: pd.DataFrame) -> pd.Series:
+    """Normalized stems (questions for QA rows), reusing the parse shadow columns when present."""
+    stem = normalized(df, "stem")
+    if "question" in df.columns:
+        stem = stem.where(stem != "", normalized(df, "question"))
+    return stem
+
+
+def _source_key(src: str) -> str:
+    return hashlib.sha1(src.encode("utf-8")).hexdigest()[:16]
+
+
+def _empty_manifest() -> dict:
+    return {"version": VECTOR_VERSION, "sources": {}}
+
+
+def load_manifest() -> dict:
+    p = similarity_dir() / SIMILARITY_MANIFEST
+    if not p.exists():
+        return _empty_manifest()
+    try:
+        with open(p, "r", encoding="utf-8") as f:
+            m = json.load(f)
+    except Exception:
+        return _empty_manifest()
+    return m if m.get("version") == VECTOR_VERSION else _empty_manifest()
+
+
+def _read_source(it: dict, df: pd.DataFrame | None = None) -> tuple[pd.DataFrame, "scipy.sparse.csr_matrix", dict]:
+    st = Path(it["path"]).stat()
+    part = dict(it, college=it["college_dir"])
+    columns = ["stem", "question", "answer", "knowledge", "type", "level", "date"]
+    df = storage._read_parsed(part, columns) if df is None else storage._frame_as_read(df, part, columns)
+    texts = _item_texts(df)
+    n = len(df)
+
+    def _col(name: str, default=None) -> list:
+        values = df[name].tolist() if name in df.columns else [default] * n
+        return [None if v is None or pd.isna(v) else str(v) for v in values]
+
+    if it["type"] == "qa":
+        etype = [storage.QA_PARTITION] * n
+    else:
+        etype = _col("type", it.get("exercise_type"))
+    meta = pd.DataFrame({
+        "src": [storage.relpath(it["path"])] * n,
+        "row": np.arange(n, dtype=np.int64),
+        "college_dir": [it["college_dir"]] * n,
+        "level": _col("level", it["level"]),
+        "exercise_type": etype,
+        "date": _col("date", it["date"]),
+        "stem": [None if pd.isna(v) else str(v) for v in texts.tolist()],
+        "answer": _col("answer"),
+        "knowledge": _col("knowledge"),
+    })
+    return meta, vectorize(_item_norm_texts(df), prenormalized=True), {"size": st.st_size, "mtime_ns": st.st_mtime_ns}
+
+
+def _write_source(m: dict, src: str, meta: pd.DataFrame, counts, stat: dict) -> None:
+    from scipy import sparse
+
+    d = similarity_dir()
+    d.mkdir(parents=True, exist_ok=True)
+    key = _source_key(src)
+    tmp = d / f".{key}.npz.tmp"
+    with open(tmp, "wb") as f:
+        sparse.save_npz(f, counts.tocsr())
+    os.replace(tmp, d / f"{key}.npz")
+    tmp = d / f".{key}.parquet.tmp"
+    meta.to_parquet(tmp, index=False)
+    os.replace(tmp, d / f"{key}.parquet")
+    m["sources"][src] = dict(stat, key=key, rows=len(meta))
+
+
+def _drop_source(m: dict, src: str) -> bool:
+    info = m["sources"].pop(src, None)
+    if info is None:
+        return False
+    for suffix in (".npz", ".parquet"):
+        try:
+            (similarity_dir() / f"{info['key']}{suffix}").unlink()
+        except OSError:
+            pass
+    return True
+
+
+def index_file(path, df: pd.DataFrame | None = None) -> int:
+    """(Re)vectorize one parsed file under storage.BASE; returns the number of items.
+
+    df is the file's content already parsed by the writer (see storage._write_parsed); otherwise the file is read.
+    """
+    src = storage.relpath(path)
+    if not similarity_available() or src is None:
+        return 0
+    meta, counts, stat = _read_source(storage.parsed_item(path), df)
+    with _locked():
+        m = load_manifest()
+        _write_source(m, src, meta, counts, stat)
+        storage._write_json_atomic(similarity_dir() / SIMILARITY_MANIFEST, m)
+    return len(meta)
+
+
+def remove_file(path) -> bool:
+    """Drop a deleted parsed file's matrix."""
+    src = storage.relpath(path)
+    if not similarity_available() or src is None:
+        return False
+    with _locked():
+        m = load_manifest()
+        if not _drop_source(m, src):
+            return False
+        storage._write_json_atomic(similarity_dir() / SIMILARITY_MANIFEST, m)
+    return True
+
+
+def sync_similarity(rebuild: bool = False) -> dict:
+    """Reconcile the stored matrices with the parsed files on disk; only new or changed files are read.
+
+    Returns {indexed, removed, files, skipped}; skipped lists {path, error} as merge_parsed does.
+    """
+    result = {"indexed": 0, "removed": 0, "files": 0, "skipped": []}
+    if not similarity_available():
+        return result
+    with span("sync_similarity") as rec, _locked():
+        m = load_manifest()
+        if rebuild:
+            for src in list(m["sources"]):
+                _drop_source(m, src)
+        on_disk = set()
+        for it in storage.list_all_parsed():
+            src = storage.relpath(it["path"])
+            try:
+                st = Path(it["path"]).stat()
+            except OSError:
+                continue
+            on_disk.add(src)
+            info = m["sources"].get(src)
+            if info and (info["size"], info["mtime_ns"]) == (st.st_size, st.st_mtime_ns):
+                continue
+            try:
+                meta, counts, stat = _read_source(it)
+            except Exception as e:
+                result["skipped"].append({"path": it["path"], "error": f"{type(e).__name__}: {e}"})
+                continue
+            _write_source(m, src, meta, counts, stat)
+            result["indexed"] += len(meta)
+            result["files"] += 1
+        for src in [s for s in m["sources"] if s not in on_disk]:
+            result["removed"] += m["sources"][src]["rows"]
+            _drop_source(m, src)
+        storage._write_json_atomic(similarity_dir() / SIMILARITY_MANIFEST, m)
+        rec["rows"] = result["indexed"]
+    return result
+
+
+def _signature() -> tuple | None:
+    try:
+        st = (similarity_dir() / SIMILARITY_MANIFEST).stat()
+    except OSError:
+        return None
+    return str(similarity_dir().resolve()), st.st_size, st.st_mtime_ns
+
+
+def load_matrix() -> dict:
+    """TF-IDF matrix of the whole corpus: {X (rows L2-normalized), XT, idf, meta}, cached until the manifest changes."""
+    from scipy import sparse
+
+    sig = _signature()
+    with _lock:
+        if _cache.get("sig") == sig and sig is not None:
+            return _cache["data"]
+        m = load_manifest()
+        mats, metas = [], []
+        for src, info in sorted(m["sources"].items()):
+            try:
+                mats.append(sparse.load_npz(similarity_dir() / f"{info['key']}.npz"))
+                metas.append(pd.read_parquet(similarity_dir() / f"{info['key']}.parquet"))
+            except OSError:
+                continue
+        with span(f"load_similarity[{len(mats)} files]") as rec:
+            if mats:
+                counts = sparse.vstack(mats, format="csr")
+                meta = pd.concat(metas, ignore_index=True)
+            else:
+                counts = sparse.csr_matrix((0, N_FEATURES), dtype=np.float32)
+                meta = pd.DataFrame(columns=list(META_COLUMNS))
+            n = counts.shape[0]
+            df_counts = np.bincount(counts.indices, minlength=N_FEATURES)
+            idf = (np.log((1 + n) / (1 + df_counts)) + 1).astype(np.float32)
+            if n >= MAX_DF_MIN_ITEMS:
+                idf[df_counts > MAX_DF * n] = 0
+            X = _weight(counts, idf)
+            data = {"X": X, "XT": X.T.tocsr(), "idf": idf, "meta": meta}
+            rec["rows"] = n
+        _cache.update(sig=sig, data=data)
+        return data
+
+
+def _weight(counts, idf: np.ndarray):
+    # 次线性词频 × IDF，行 L2 归一化后点积即余弦相似度
+    from scipy import sparse
+
+    x = counts.astype(np.float32, copy=True)
+    x.data = (1 + np.log(x.data)) * idf[x.indices]
+    norms = np.sqrt(np.asarray(x.multiply(x).sum(axis=1)).ravel())
+    norms[norms == 0] = 1
+    x = sparse.diags(1 / norms) @ x
+    x.eliminate_zeros()
+    return x.tocsr()
+
+
+def _prune_terms(q, max_terms: int | None, present: np.ndarray | None = None):
+    # 每个查询只保留权重最高的若干 n-gram：低 IDF 的常见片段倒排最长，去掉后乘积大幅变小；
+    # 候选中不存在的 n-gram（IDF 最高却无贡献）先行剔除
+    if not max_terms:
+        return q
+    q = q.tocsr(copy=True)
+    if present is not None:
+        q.data[~present[q.indices]] = 0
+        q.eliminate_zeros()
+    for i in range(q.shape[0]):
+        lo, hi = q.indptr[i], q.indptr[i + 1]
+        if hi - lo > max_terms:
+            row = q.data[lo:hi]
+            row[np.argpartition(row, hi - lo - max_terms)[:hi - lo - max_terms]] = 0
+    q.eliminate_zeros()
+    return q
+
+
+def _top_k(q, XT, k: int, mask: np.ndarray | None = None) -> tuple[np.ndarray, np.ndarray]:
+    n_q = q.shape[0]
+    idx = np.full((n_q, k), -1, dtype=np.int64)
+    scores = np.zeros((n_q, k), dtype=np.float32)
+    if not XT.shape[1] or not n_q:
+        return idx, scores
+    for start in range(0, n_q, QUERY_CHUNK):
+        sims = (q[start:start + QUERY_CHUNK] @ XT).tocsr()
+        for i in range(sims.shape[0]):
+            lo, hi = sims.indptr[i], sims.indptr[i + 1]
+            cand, val = sims.indices[lo:hi], sims.data[lo:hi]
+            if mask is not None:
+                keep = mask[cand]
+                cand, val = cand[keep], val[keep]
+            if not len(cand):
+                continue
+            take = min(k, len(cand))
+            part = np.argpartition(-val, take - 1)[:take]
+            order = part[np.argsort(-val[part], kind="stable")]
+            idx[start + i, :take] = cand[order]
+            scores[start + i, :take] = val[order]
+    return idx, scores
+
+
+def top_k(texts, k: int = SIMILAR_TOP_K, mask: np.ndarray | None = None) -> tuple[np.ndarray, np.ndarray]:
+    """Cosine top-k neighbours of each text in the stored corpus, in one batched pass.
+
+    mask (bool per corpus row) restricts the candidates. Returns (indices, scores), both of
+    shape (len(texts), k) and best first; missing neighbours are -1 with score 0.
+    """
+    data = load_matrix()
+    return _top_k(_weight(vectorize(texts), data["idf"]), data["XT"], k, mask)
+
+
+def similar_items(text: str, k: int = SIMILAR_TOP_K, exclude: tuple[str, int] | None = None,
+                  exclude_colleges: list[str] | None = None) -> list[dict]:
+    """Stored items most similar to text, best first, each with its cosine score.
+
+    exclude is a (src, row) item to leave out (the item being reviewed); exclude_colleges
+    are college codes whose items are skipped.
+    """
+    if not similarity_available() or not str(text or "").strip():
+        return []
+    meta = load_matrix()["meta"]
+    mask = None
+    if exclude is not None or exclude_colleges:
+        mask = np.ones(len(meta), dtype=bool)
+        if exclude is not None:
+            mask &= ~((meta["src"] == exclude[0]) & (meta["row"] == int(exclude[1]))).to_numpy()
+        if exclude_colleges:
+            dirs = {p.name for c in exclude_colleges for p in storage._dirnames_for_college(c)}
+            mask &= ~meta["college_dir"].isin(dirs).to_numpy()
+    idx, scores = top_k([text], k, mask)
+    rows = []
+    for i, s in zip(idx[0], scores[0]):
+        if i < 0 or s <= 0:
+            continue
+        r = meta.iloc[int(i)].to_dict()
+        r.update(score=round(float(s), 4), college=storage.get_college_display(r["college_dir"]),
+                 file=storage.plain_name(Path(r["src"]).name))
+        rows.append(r)
+    return rows
+
+
+def _is_blank(values: pd.Series) -> pd.Series:
+    return normalize_text(values) == ""
+
+
+def missing_knowledge(df: pd.DataFrame) -> pd.Series:
+    """Rows whose knowledge is empty (NaN and "nan" strings included)."""
+    return normalized(df, "knowledge") == ""
+
+
+def suggest_knowledge(df: pd.DataFrame, k: int = SUGGEST_NEIGHBORS, min_score: float = SUGGEST_MIN_SCORE) -> pd.DataFrame:
+    """Knowledge-point suggestions for the rows of df whose knowledge is empty, in one batched pass.
+
+    Neighbours are the stored items that have knowledge plus the labelled rows of df itself;
+    their knowledge labels are voted on, weighted by cosine similarity. Returns a frame indexed
+    like the suggested rows: suggested_knowledge, confidence (vote share), similarity (best
+    neighbour with that label) and neighbour (its stem). Rows whose best neighbour scores below
+    min_score get no suggestion.
+    """
+    from scipy import sparse
+
+    columns = ["suggested_knowledge", "confidence", "similarity", "neighbour"]
+    if df is None or df.empty or not similarity_available():
+        return pd.DataFrame(columns=columns)
+    texts = _item_texts(df)
+    ntexts = _item_norm_texts(df)
+    empty = missing_knowledge(df).to_numpy()
+    has_text = (ntexts != "").to_numpy()
+    targets = empty & has_text
+    if not targets.any():
+        return pd.DataFrame(columns=columns)
+    with span("suggest_knowledge", rows=int(targets.sum())) as rec:
+        data = load_matrix()
+        meta = data["meta"]
+        labelled = ~_is_blank(meta["knowledge"]).to_numpy() if len(meta) else np.zeros(0, dtype=bool)
+        own = ~empty & has_text
+        # 候选池：库中已有知识点的条目 + 本次上传中已填写知识点的行
+        pool = sparse.vstack([data["X"][np.flatnonzero(labelled)],
+                              _weight(vectorize(ntexts[own], prenormalized=True), data["idf"])], format="csr")
+        labels = np.concatenate([meta["knowledge"].to_numpy(dtype=object)[labelled],
+                                 normalized(df, "knowledge")[own].to_numpy(dtype=object)])
+        stems = np.concatenate([meta["stem"].to_numpy(dtype=object)[labelled], texts[own].to_numpy(dtype=object)])
+        # 相同题干只查询一次
+        norm = np.array(_fold(ntexts[targets]), dtype=object)
+        uniq, inverse = np.unique(norm, return_inverse=True)
+        q = _weight(vectorize(uniq.tolist(), prenormalized=True), data["idf"])
+        # 用裁剪后的查询召回 2k 个候选，再按完整向量的余弦重新打分
+        present = np.zeros(N_FEATURES, dtype=bool)
+        present[pool.indices] = True
+        idx, _ = _top_k(_prune_terms(q, SUGGEST_QUERY_TERMS, present), pool.T.tocsr(), 2 * k)
+        rows, cols = np.nonzero(idx >= 0)
+        exact = np.zeros(idx.shape, dtype=np.float32)
+        exact[rows, cols] = np.asarray(q[rows].multiply(pool[idx[rows, cols]]).sum(axis=1)).ravel()
+        order = np.argsort(-exact, axis=1, kind="stable")[:, :k]
+        idx = np.take_along_axis(idx, order, axis=1)
+        scores = np.take_along_axis(exact, order, axis=1)
+        picks = []
+        for nb, sc in zip(idx, scores):
+            votes, best = {}, {}
+            for j, s in zip(nb, sc):
+                if j < 0 or s <= 0:
+                    continue
+                lab = labels[j]
+                votes[lab] = votes.get(lab, 0.0) + float(s)
+                if lab not in best:
+                    best[lab] = (float(s), stems[j])
+            if not votes:
+                picks.append((None, 0.0, 0.0, None))
+                continue
+            lab = max(votes, key=votes.get)
+            picks.append((lab, votes[lab] / sum(votes.values()), *best[lab]))
+        out = pd.DataFrame([picks[i] for i in inverse], columns=columns, index=df.index[targets])
+        out = out[out["similarity"] >= min_score]
+        out[["confidence", "similarity"]] = out[["confidence", "similarity"]].round(3)
+        rec["rows"] = len(out)
+    return out
+
+
+def apply_knowledge_suggestions(df: pd.DataFrame, suggestions: pd.DataFrame) -> pd.DataFrame:
+    """Copy of df with the suggested knowledge filled into the suggested (empty) rows."""
+    if suggestions is None or suggestions.empty:
+        return df
+    kn = df["knowledge"] if "knowledge" in df.columns else pd.Series([None] * len(df), index=df.index)
+    filled = kn.astype(object).copy()
+    filled.loc[suggestions.index] = suggestions["suggested_knowledge"]
+    # 同步刷新知识点影子列，重新质检时读到补全后的值
+    return add_shadow_columns(df.assign(knowledge=filled), ["knowledge"], refresh=True)
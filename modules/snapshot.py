@@ -0,0 +1,334 @@
+"""Consolidated corpus snapshot: one Parquet dataset per (type, level) under <storage>/_corpus.
+
+Saving a parsed file appends a segment, deleting one writes a tombstone, and compaction
+rewrites a dataset into a single segment. Readers get the same frame as merge_parsed.
+"""
+import json
+import os
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+
+import pandas as pd
+
+import modules.storage as storage
+from modules.dtypes import apply_dtype_policy, concat_frames
+from modules.tracing import span
+
+SNAPSHOT_DIRNAME = "_corpus"
+SNAPSHOT_MANIFEST = "manifest.json"
+# 数据集内分段数超过该值时自动压实
+COMPACT_SEGMENTS = int(os.environ.get("SNAPSHOT_COMPACT_SEGMENTS", 64))
+DATASET_KEYS = ("qa", "ex_ug", "ex_grad")
+SOURCE_COLUMN = "_source"
+_lock = threading.Lock()
+
+
+def snapshot_available() -> bool:
+    try:
+        import pyarrow.parquet  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+
+def snapshot_dir() -> Path:
+    return storage.BASE / SNAPSHOT_DIRNAME
+
+
+def dataset_key(tkey: str, level: str | None) -> str:
+    if tkey == "qa":
+        return "qa"
+    return "ex_grad" if level == "研究生" else "ex_ug"
+
+
+def dataset_keys(levels: list[str] | None = None, types: list[str] | None = None) -> list[str]:
+    """Datasets matching list_all_parsed's filters (a level filter excludes QA)."""
+    keys = []
+    for key in DATASET_KEYS:
+        tkey, level = ("qa", None) if key == "qa" else ("ex", "研究生" if key == "ex_grad" else "本科")
+        if types is not None and tkey not in types:
+            continue
+        if levels is not None and level not in levels:
+            continue
+        keys.append(key)
+    return keys
+
+
+@contextmanager
+def _locked():
+    """Serialize manifest updates across threads and processes."""
+    with _lock, storage._file_lock(snapshot_dir() / ".lock"):
+        yield
+
+
+def _empty_manifest() -> dict:
+    return {"next_seq": 1, "datasets": {}, "sources": {}}
+
+
+def load_manifest() -> dict:
+    p = snapshot_dir() / SNAPSHOT_MANIFEST
+    if not p.exists():
+        return _empty_manifest()
+    try:
+        with open(p, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except Exception:
+        return _empty_manifest()
+
+
+def _save_manifest(m: dict) -> None:
+    storage._write_json_atomic(snapshot_dir() / SNAPSHOT_MANIFEST, m)
+
+
+def _dataset(m: dict, key: str) -> dict:
+    return m["datasets"].setdefault(key, {"segments": [], "tombstones": {}})
+
+
+def _write_segment(m: dict, key: str, frame: pd.DataFrame, sources: list[str]) -> dict:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    seq = m["next_seq"]
+    m["next_seq"] = seq + 1
+    d = snapshot_dir() / key
+    d.mkdir(parents=True, exist_ok=True)
+    name = f"{seq:08d}.parquet"
+    tmp = d / f".{name}.tmp"
+    pq.write_table(pa.Table.from_pandas(frame, preserve_index=False), tmp)
+    os.replace(tmp, d / name)
+    return {"file": f"{key}/{name}", "seq": seq, "rows": len(frame), "sources": sources}
+
+
+def _tombstone(m: dict, src: str) -> bool:
+    info = m["sources"].pop(src, None)
+    if info is None:
+        return False
+    # 序号小于 next_seq 的分段中该来源的行全部失效（覆盖写入后新分段序号更大，不受影响）
+    _dataset(m, info["key"])["tombstones"][src] = m["next_seq"]
+    return True
+
+
+def _read_source(it: dict, df: pd.DataFrame | None = None) -> tuple[pd.DataFrame, dict]:
+    p = Path(it["path"])
+    st = p.stat()
+    # 学院列保存目录名，读取时再映射为显示名；刚写入的文件直接使用写入方已解析的数据表
+    it = dict(it, college=it["college_dir"])
+    df = storage._read_parsed(it, None) if df is None else storage._frame_as_read(df, it, None)
+    df = df.assign(**{SOURCE_COLUMN: storage._partition_column(storage.relpath(p), len(df))})
+    return df, {"size": st.st_size, "mtime_ns": st.st_mtime_ns}
+
+
+def _add_source(m: dict, it: dict, df: pd.DataFrame, stat: dict) -> str:
+    src = storage.relpath(it["path"])
+    key = dataset_key(it["type"], it["level"])
+    _tombstone(m, src)
+    seg = _write_segment(m, key, df, [src])
+    _dataset(m, key)["segments"].append(seg)
+    m["sources"][src] = dict(stat, key=key, seq=seg["seq"])
+    return key
+
+
+def append_parsed(path, df: pd.DataFrame | None = None) -> None:
+    """Add a freshly written parsed CSV under storage.BASE to the snapshot (replacing older rows of the same file).
+
+    df is the file's content already parsed by the writer (see storage._write_parsed); otherwise the file is read.
+    """
+    if not snapshot_available() or storage.relpath(path) is None:
+        return
+    it = storage.parsed_item(path)
+    df, stat = _read_source(it, df)
+    with _locked():
+        m = load_manifest()
+        key = _add_source(m, it, df, stat)
+        _save_manifest(m)
+        if len(m["datasets"][key]["segments"]) > COMPACT_SEGMENTS:
+            _compact(m, [key])
+
+
+def tombstone_path(path) -> bool:
+    """Hide the rows of a deleted parsed file; the data is dropped at the next compaction."""
+    if not snapshot_available():
+        return False
+    src = storage.relpath(path)
+    if src is None:
+        return False
+    with _locked():
+        m = load_manifest()
+        if not _tombstone(m, src):
+            return False
+        _save_manifest(m)
+    return True
+
+
+def sync_snapshot(max_workers: int | None = None) -> list[dict]:
+    """Reconcile the snapshot with the parsed files on disk; only new or changed files are read.
+
+    Returns the files that could not be read, as merge_parsed does.
+    """
+    from concurrent.futures import ThreadPoolExecutor
+
+    items = storage.list_all_parsed()
+    m = load_manifest()
+    on_disk = {}
+    todo = []
+    for it in items:
+        src = storage.relpath(it["path"])
+        on_disk[src] = it
+        info = m["sources"].get(src)
+        try:
+            st = Path(it["path"]).stat()
+        except OSError:
+            continue
+        if info is None or info.get("size") != st.st_size or info.get("mtime_ns") != st.st_mtime_ns:
+            todo.append(it)
+    gone = [src for src in m["sources"] if src not in on_disk]
+    if not todo and not gone:
+        return []
+
+    def _load(it: dict):
+        try:
+            return it, _read_source(it), None
+        except Exception as e:
+            return it, None, {"path": it["path"], "error": f"{type(e).__name__}: {e}"}
+
+    workers = max(1, min(max_workers or storage.MERGE_WORKERS, len(todo) or 1))
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        loaded = list(pool.map(_load, todo))
+    with _locked():
+        m = load_manifest()
+        for src in gone:
+            _tombstone(m, src)
+        keys = set()
+        for it, res, _ in loaded:
+            if res is not None:
+                keys.add(_add_source(m, it, *res))
+            else:
+                # 文件被改写为不可读内容：旧行同样失效，与直接读取文件的结果一致
+                _tombstone(m, storage.relpath(it["path"]))
+        _save_manifest(m)
+        crowded = [k for k in keys if len(m["datasets"][k]["segments"]) > COMPACT_SEGMENTS]
+        if crowded:
+            _compact(m, crowded)
+    return [err for _, _, err in loaded if err is not None]
+
+
+def _hidden(ds: dict, seg: dict) -> list[str]:
+    return [s for s in seg["sources"] if ds["tombstones"].get(s, 0) > seg["seq"]]
+
+
+def _read_segment(seg: dict, hidden: list[str], columns: list[str] | None = None,
+                  college_dirs: list[str] | None = None, exercise_types: list[str] | None = None,
+                  dates: list[str] | None = None) -> pd.DataFrame:
+    import pyarrow.parquet as pq
+
+    path = snapshot_dir() / seg["file"]
+    names = set(pq.read_schema(path).names)
+    filters = []
+    if hidden:
+        filters.append((SOURCE_COLUMN, "not in", hidden))
+    if college_dirs is not None:
+        filters.append(("college", "in", college_dirs))
+    if exercise_types is not None and "type" in names:
+        filters.append(("type", "in", exercise_types))
+    if dates is not None:
+        filters.append(("date", "in", dates))
+    if columns is not None:
+        columns = [c for c in columns if c in names]
+    return pq.read_table(path, columns=columns, filters=filters or None).to_pandas()
+
+
+def _compact(m: dict, keys: list[str]) -> dict:
+    """Rewrite each dataset into one segment without tombstoned rows; caller holds the lock."""
+    stats = {}
+    for key in keys:
+        ds = _dataset(m, key)
+        old = list(ds["segments"])
+        frames = [_read_segment(seg, _hidden(ds, seg)) for seg in old]
+        frames = [f for f in frames if not f.empty]
+        live = sorted(s for s, info in m["sources"].items() if info["key"] == key)
+        ds["tombstones"] = {}
+        if frames:
+            ds["segments"] = [_write_segment(m, key, concat_frames(frames), live)]
+        else:
+            ds["segments"] = []
+        for s in live:
+            m["sources"][s]["seq"] = ds["segments"][0]["seq"] if ds["segments"] else 0
+        stats[key] = {"segments_before": len(old), "rows": sum(len(f) for f in frames)}
+        _save_manifest(m)
+        for seg in old:
+            try:
+                (snapshot_dir() / seg["file"]).unlink()
+            except OSError:
+                pass
+    return stats
+
+
+def compact_snapshot(keys: list[str] | None = None) -> dict:
+    """Compact the given datasets (default: all); returns {key: {segments_before, rows}}."""
+    if not snapshot_available():
+        return {}
+    with _locked():
+        m = load_manifest()
+        with span("compact_snapshot"):
+            return _compact(m, [k for k in (keys or DATASET_KEYS) if k in m["datasets"]])
+
+
+def rebuild_snapshot() -> list[dict]:
+    """Drop the snapshot and rebuild it from the parsed files; returns unreadable files."""
+    import shutil
+
+    with _lock:
+        shutil.rmtree(snapshot_dir(), ignore_errors=True)
+    skipped = sync_snapshot()
+    compact_snapshot()
+    return skipped
+
+
+def load_corpus(columns: list[str] | None = None, colleges: list[str] | None = None,
+                levels: list[str] | None = None, types: list[str] | None = None,
+                exercise_types: list[str] | None = None,
+                dates: list[str] | None = None, sync: bool = True) -> tuple[pd.DataFrame | None, list[dict]]:
+    """Same contract as storage.merge_parsed, served from the snapshot (synced first).
+
+    sync=False skips the sync for callers that have just run sync_snapshot themselves.
+    Falls back to merge_parsed when pyarrow is not installed.
+    """
+    if not snapshot_available():
+        return storage.merge_parsed(columns, colleges, levels, types,
+                                    exercise_types=exercise_types, dates=dates)
+    skipped = sync_snapshot() if sync else []
+    college_dirs = None
+    if colleges is not None:
+        college_dirs = sorted({p.name for c in colleges for p in storage._dirnames_for_college(c)})
+    wanted = None if columns is None else list(dict.fromkeys(list(columns) + ["college"]))
+    frames = []
+    with span("load_corpus") as rec:
+        for _ in range(2):
+            m = load_manifest()
+            try:
+                frames = []
+                for key in dataset_keys(levels, types):
+                    if key == "qa" and exercise_types is not None and storage.QA_PARTITION not in exercise_types:
+                        continue
+                    ds = m["datasets"].get(key)
+                    for seg in (ds or {}).get("segments", []):
+                        frames.append(_read_segment(seg, _hidden(ds, seg), wanted, college_dirs,
+                                                    exercise_types, dates))
+                break
+            except FileNotFoundError:
+                # 读取期间分段被压实替换：重新加载清单再读一次
+                continue
+        frames = [f for f in frames if not f.empty]
+        if not frames:
+            return None, skipped
+        df = concat_frames(frames)
+        df = df.drop(columns=[SOURCE_COLUMN], errors="ignore")
+        if columns is not None and "college" not in columns:
+            df = df.drop(columns=["college"])
+        elif "college" in df.columns:
+            # 目录名映射为显示名（代码目录与中文名目录会合并为同一类别）
+            display = {c: storage.get_college_display(c) for c in df["college"].cat.categories}
+            df["college"] = df["college"].map(display).astype("category")
+        rec["rows"] = len(df)
+    return apply_dtype_policy(df), skipped
@@ -0,0 +1,101 @@
+import pandas as pd
+
+from modules.quality import assess_qa, assess_exercises, summarize_quality
+from modules.snapshot import load_corpus, snapshot_available, sync_snapshot
+from modules.storage import get_targets, get_college_display
+
+# 汇总统计只读取学院分组、级别统计与质检用到的列
+QA_COLUMNS = ["college", "question", "answer"]
+EX_COLUMNS = ["college", "level", "type", "stem", "answer", "options", "analysis", "knowledge"]
+
+
+def _status(count: int, target: int) -> str:
+    if target == 0:
+        return "未设定"
+    return "达标" if count >= target else "未达标"
+
+
+def _by_college(df: pd.DataFrame | None) -> dict:
+    if df is None:
+        return {}
+    return {college: g for college, g in df.groupby("college", observed=True)}
+
+
+def summarize_colleges(codes: list[str], level_filter: str = "全部") -> list[dict]:
+    """汇总统计各学院的行：语料只同步、读取一次，质检后按学院分组。"""
+    if not codes:
+        return []
+    if snapshot_available():
+        sync_snapshot()
+    qa_all, _ = load_corpus(QA_COLUMNS, colleges=codes, types=["qa"], sync=False)
+    ex_all, _ = load_corpus(EX_COLUMNS, colleges=codes, types=["ex"], sync=False)
+    # 质检逐行进行，整体评估一次再分组与按学院分别评估结果相同
+    qa_groups = _by_college(None if qa_all is None else assess_qa(qa_all))
+    ex_groups = _by_college(None if ex_all is None else assess_exercises(ex_all))
+    rows = []
+    for code in codes:
+        display = get_college_display(code)
+        rows.append(_summarize(code, qa_groups.get(display), ex_groups.get(display), level_filter))
+    return rows
+
+
+def summarize_college(code: str, level_filter: str = "全部") -> dict:
+    """汇总统计中单个学院的一行：数量、目标达成状态与动态质量评估。"""
+    return summarize_colleges([code], level_filter)[0]
+
+
+def _summarize(code: str, qa_all: pd.DataFrame | None, ex_all: pd.DataFrame | None, level_filter: str) -> dict:
+    qa_count = 0 if qa_all is None else len(qa_all)
+    # 统计级别：本科与研究生（取文件中的 level 列，缺失时由文件名推断）
+    ex_grad_count = 0
+    ex_ug_count = 0
+    if ex_all is not None:
+        is_grad = ex_all["level"].astype(str) == "研究生"
+        ex_grad_count = int(is_grad.sum())
+        ex_ug_count = len(ex_all) - ex_grad_count
+        if level_filter != "全部":
+            ex_all = ex_all[is_grad] if level_filter == "研究生" else ex_all[~is_grad]
+    ex_count = 0 if ex_all is None else len(ex_all)
+    tgt = get_targets(code)
+    qa_t = int(tgt.get("qa", 0))
+    ex_t = int(tgt.get("ex", 0))
+    ex_ug_t = int(tgt.get("levels", {}).get("ug", {}).get("ex", 0))
+    ex_grad_t = int(tgt.get("levels", {}).get("grad", {}).get("ex", 0))
+    # 质量汇总（动态评估，不写入文件）
+    qa_summary = {"score_avg": 0, "error_row_ratio": 0.0}
+    ex_summary = {"score_avg": 0, "error_row_ratio": 0.0}
+    qa_rows = 0
+    ex_rows = 0
+    if qa_count:
+        qa_rows = len(qa_all)
+        qa_summary = summarize_quality(qa_all)
+    if ex_count:
+        ex_rows = len(ex_all)
+        ex_summary = summarize_quality(ex_all)
+    total_rows = qa_rows + ex_rows
+    overall_error_ratio = 0.0
+    overall_score = 0.0
+    if total_rows > 0:
+        overall_error_ratio = (
+            qa_summary.get("error_row_ratio", 0.0) * qa_rows + ex_summary.get("error_row_ratio", 0.0) * ex_rows
+        ) / total_rows
+        overall_score = (
+            qa_summary.get("score_avg", 0.0) * qa_rows + ex_summary.get("score_avg", 0.0) * ex_rows
+        ) / total_rows
+    return {
+        "学院": get_college_display(code),
+        "问答对": qa_count,
+        "问答对目标": qa_t,
+        "问答对状态": _status(qa_count, qa_t),
+        "习题": ex_count,
+        "习题目标": ex_t,
+        "习题状态": _status(ex_ug_count + ex_grad_count, ex_t),
+        "本科习题": ex_ug_count,
+        "本科目标": ex_ug_t,
+        "本科状态": _status(ex_ug_count, ex_ug_t),
+        "研究生习题": ex_grad_count,
+        "研究生目标": ex_grad_t,
+        "研究生状态": _status(ex_grad_count, ex_grad_t),
+        "质量均分": round(overall_score, 2),
+        "红色问题比例": round(overall_error_ratio * 100, 2),
+    }
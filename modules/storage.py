@@ -1,13 +1,57 @@
 from pathlib import Path
 import pandas as pd
 import datetime as dt
+import gzip
+import hashlib
+import io
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+import numpy as np
 import yaml
 
+from modules.dtypes import apply_dtype_policy, concat_frames
+from modules.normalize import drop_shadow_columns
+from modules.parsing import split_dataset_by_type
+from modules.tracing import span, record_spans
+
+logger = logging.getLogger(__name__)
+
 BASE = Path("storage")
 BASE_TEST = Path("storage_tests")
 TARGETS_PATH = Path("config/targets.yaml")
 BASE_LOGINS = Path("storage_logins")
 KNOWN_COLLEGES = ["economy", "finance", "intl", "west", "tax", "mgmt"]
+# 原始文件按内容寻址存储：<root>/_blobs/<sha[:2]>/<sha>[.gz|.zst]，日期目录下的清单记录文件名指针
+BLOBS_DIRNAME = "_blobs"
+RAW_MANIFEST = "_raw_manifest.json"
+RAW_COMPRESSION = os.environ.get("RAW_COMPRESSION", "gzip").lower()  # none / gzip / zstd
+RAW_COMPRESSION_LEVEL = int(os.environ.get("RAW_COMPRESSION_LEVEL", 6))
+# 解析结果 CSV 的压缩：<name>.csv[.gz|.zst]，读取时按后缀流式解压
+PARSED_COMPRESSION = os.environ.get("PARSED_COMPRESSION", "gzip").lower()  # none / gzip / zstd
+PARSED_COMPRESSION_LEVEL = int(os.environ.get("PARSED_COMPRESSION_LEVEL", 3))
+PARSED_SUFFIXES = (".csv", ".csv.gz", ".csv.zst")
+_manifest_lock = threading.Lock()
+_college_mapping_cache: dict = {}
+# 拆分后的分区并发写入的线程数
+SAVE_WORKERS = int(os.environ.get("SAVE_WORKERS", 4))
+# 合并全部解析结果时并发读取文件的线程数
+MERGE_WORKERS = int(os.environ.get("MERGE_WORKERS", 4))
+# 解析结果按 Hive 风格分区存放：parsed/college=<代码>/level=<级别>/type=<题型>/date=<日期>/<文件>
+PARSED_DIRNAME = "parsed"
+PARTITION_KEYS = ("college", "level", "type", "date")
+NULL_PARTITION = "__HIVE_DEFAULT_PARTITION__"
+QA_PARTITION = "问答对"
+# 合并后的小文件：每个 college/level/type 分区一个 Parquet 文件，放在 date=__HIVE_DEFAULT_PARTITION__ 下，
+# 行的来源文件与上传日期保存在溯源列中；当前生效的合并文件登记在 parsed/_compaction.json
+COMPACTION_MANIFEST = "_compaction.json"
+PROVENANCE_SOURCE = "_source_file"
+PROVENANCE_DATE = "_upload_date"
 
 
 def _today():
@@ -39,92 +83,638 @@ def _primary_dir_for_college(college: str, is_test: bool = False) -> Path:
     # 始终以学院代码为主目录，避免中文名变化导致路径分裂
     return (BASE_TEST if is_test else BASE) / college
 
-def archive_raw_file(uploaded_file, college: str, is_test: bool = False) -> Path:
-    root = _primary_dir_for_college(college, is_test)
-    d = root / _today()
-    d.mkdir(parents=True, exist_ok=True)
-    raw_path = d / _safe_filename(uploaded_file.name)
-    with open(raw_path, "wb") as f:
-        f.write(uploaded_file.getbuffer())
-    return raw_path
+def _codec(setting: str) -> str:
+    if setting == "zstd":
+        try:
+            import zstandard  # noqa: F401
+            return "zstd"
+        except ImportError:
+            return "gzip"
+    return setting if setting in ("gzip", "none") else "gzip"
 
 
-def save_parsed_dataset(df: pd.DataFrame, meta: dict, college: str, is_test: bool = False) -> Path:
-    if df is None or df.empty:
+def _blob_codec() -> str:
+    return _codec(RAW_COMPRESSION)
+
+
+def _parsed_codec() -> str:
+    return _codec(PARSED_COMPRESSION)
+
+
+def _compress(data: bytes, codec: str, level: int | None = None) -> bytes:
+    level = RAW_COMPRESSION_LEVEL if level is None else level
+    if codec == "gzip":
+        # mtime=0：相同内容压缩结果一致
+        return gzip.compress(data, compresslevel=level, mtime=0)
+    if codec == "zstd":
+        import zstandard
+        return zstandard.ZstdCompressor(level=level).compress(data)
+    return data
+
+
+def _csv_compression(codec: str, level: int):
+    if codec == "gzip":
+        return {"method": "gzip", "compresslevel": level, "mtime": 0}
+    if codec == "zstd":
+        return {"method": "zstd", "level": level}
+    return None
+
+
+def plain_name(name: str) -> str:
+    """File name without a compression suffix (x_parsed_qa.csv.gz → x_parsed_qa.csv)."""
+    for suffix in (".gz", ".zst"):
+        if name.endswith(suffix):
+            return name[: -len(suffix)]
+    return name
+
+
+def _is_parsed_csv(name: str) -> bool:
+    return name.endswith(PARSED_SUFFIXES)
+
+
+def _blob_suffix(codec: str) -> str:
+    return {"gzip": ".gz", "zstd": ".zst"}.get(codec, "")
+
+
+def _find_blob(blobs: Path, digest: str) -> Path | None:
+    d = blobs / digest[:2]
+    for suffix in ("", ".gz", ".zst"):
+        p = d / f"{digest}{suffix}"
+        if p.exists():
+            return p
+    return None
+
+
+def _put_blob(base: Path, data: bytes, digest: str | None = None) -> tuple[Path, bool]:
+    """Store data under <base>/_blobs by content hash; returns (blob path, whether it was written)."""
+    digest = digest or hashlib.sha256(data).hexdigest()
+    blobs = base / BLOBS_DIRNAME
+    blob = _find_blob(blobs, digest)
+    if blob is not None:
+        return blob, False
+    # xlsx 等 zip 容器本身已压缩，再压缩几乎不减小体积，只增加读写耗时
+    codec = "none" if data[:4] == b"PK\x03\x04" else _blob_codec()
+    blob = blobs / digest[:2] / f"{digest}{_blob_suffix(codec)}"
+    blob.parent.mkdir(parents=True, exist_ok=True)
+    tmp = blob.with_name(f".{blob.name}.tmp")
+    with open(tmp, "wb") as f:
+        f.write(_compress(data, codec))
+    os.replace(tmp, blob)
+    return blob, True
+
+
+@contextmanager
+def _file_lock(path: Path):
+    """Exclusive lock on a lock file, across processes where flock exists (CLI ingest runs several)."""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, "a") as fh:
+        try:
+            import fcntl
+            fcntl.flock(fh, fcntl.LOCK_EX)
+        except ImportError:
+            pass
+        yield
+
+
+def relpath(path) -> str | None:
+    """Path relative to BASE (posix), or None for files outside the corpus root."""
+    try:
+        return Path(path).resolve().relative_to(BASE.resolve()).as_posix()
+    except ValueError:
         return None
-    root = _primary_dir_for_college(college, is_test)
-    d = root / _today()
-    d.mkdir(parents=True, exist_ok=True)
+
+
+def _write_json_atomic(path: Path, data) -> None:
+    tmp = path.with_name(f".{path.name}.tmp")
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False, indent=1)
+    os.replace(tmp, path)
+
+
+def _write_bytes_atomic(path: Path, data: bytes) -> None:
+    # 写入同目录下的独立临时文件再替换：读取方不会看到写了一半的文件，并发写入方互不干扰；
+    # 临时文件以点开头、以 .tmp 结尾，不会被当作解析结果列出
+    fd, tmp = tempfile.mkstemp(prefix=f".{path.name}.", suffix=".tmp", dir=path.parent)
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(tmp, path)
+    except BaseException:
+        Path(tmp).unlink(missing_ok=True)
+        raise
+
+
+def _load_raw_manifest(day_dir: Path) -> list[dict]:
+    p = day_dir / RAW_MANIFEST
+    if not p.exists():
+        return []
+    try:
+        with open(p, "r", encoding="utf-8") as f:
+            return json.load(f) or []
+    except Exception:
+        return []
+
+
+def archive_raw_file(uploaded_file, college: str, is_test: bool = False) -> Path:
+    """Store the upload once per content hash and record a name pointer for <college>/<today>.
+
+    Returns the blob path; identical re-uploads write nothing.
+    """
+    base = BASE_TEST if is_test else BASE
+    d = _primary_dir_for_college(college, is_test) / _today()
+    with span("archive_raw_file") as rec:
+        data = bytes(uploaded_file.getbuffer())
+        digest = hashlib.sha256(data).hexdigest()
+        rec["bytes"] = len(data)
+        blob, rec["blob_written"] = _put_blob(base, data, digest)
+        name = _safe_filename(uploaded_file.name)
+        # CLI 入库以多进程并发写同一天的清单：进程间文件锁保护读改写
+        with _manifest_lock, _file_lock(d / ".manifest.lock"):
+            entries = _load_raw_manifest(d)
+            if not any(e.get("name") == name and e.get("sha256") == digest for e in entries):
+                d.mkdir(parents=True, exist_ok=True)
+                entries.append({
+                    "name": name,
+                    "sha256": digest,
+                    "size": len(data),
+                    "blob": blob.relative_to(base).as_posix(),
+                    "uploaded_at": dt.datetime.now().isoformat(timespec="seconds"),
+                })
+                _write_json_atomic(d / RAW_MANIFEST, entries)
+    return blob
+
+
+def read_raw_bytes(path: str) -> bytes:
+    """Read an archived raw file, decompressing content-addressed blobs."""
+    p = Path(path)
+    if p.suffix == ".gz":
+        with gzip.open(p, "rb") as f:
+            return f.read()
+    if p.suffix == ".zst":
+        import zstandard
+        with open(p, "rb") as f:
+            return zstandard.ZstdDecompressor().stream_reader(f).read()
+    with open(p, "rb") as f:
+        return f.read()
+
+
+def _parsed_root(is_test: bool = False) -> Path:
+    return (BASE_TEST if is_test else BASE) / PARSED_DIRNAME
+
+
+def _exercise_type(meta: dict, df: pd.DataFrame | None) -> str:
+    if meta.get("type") == "问答对":
+        return QA_PARTITION
+    if meta.get("exercise_type"):
+        return meta["exercise_type"]
+    if df is None or "type" not in df.columns:
+        return "未分类"
+    values = df["type"].dropna().astype(str).unique()
+    if len(values) == 1:
+        return values[0]
+    return "混合" if len(values) else "未分类"
+
+
+def _partition_path(root: Path, college: str, level: str | None, etype: str, date: str) -> Path:
+    values = (college, level, etype, date)
+    return root.joinpath(*(f"{k}={_safe_dir(v) if v else NULL_PARTITION}" for k, v in zip(PARTITION_KEYS, values)))
+
+
+def _parsed_output(meta: dict, college: str, is_test: bool = False,
+                   df: pd.DataFrame | None = None) -> tuple[Path, str | None]:
     t = meta.get("type", "")
     tkey = "qa" if t == "问答对" else "ex"
     level = meta.get("level") if tkey == "ex" else None
     lvlkey = "ug" if level == "本科" else ("grad" if level == "研究生" else "ug")
-    fname = f"{Path(meta['filename']).stem}_parsed_{tkey}{('_' + lvlkey) if tkey=='ex' else ''}.csv"
-    out = d / fname
-    df_out = df.copy()
-    if level:
-        df_out["level"] = level
-    df_out.to_csv(out, index=False)
+    fname = f"{Path(meta['filename']).stem}_parsed_{tkey}{('_' + lvlkey) if tkey=='ex' else ''}.csv{_blob_suffix(_parsed_codec())}"
+    # 未指定级别的习题与旧版一致按本科归档
+    part_level = (level or "本科") if tkey == "ex" else None
+    d = _partition_path(_parsed_root(is_test), college, part_level, _exercise_type(meta, df), _today())
+    return d / fname, level
+
+
+def _write_parsed(df: pd.DataFrame, out: Path, level: str | None):
+    out.parent.mkdir(parents=True, exist_ok=True)
+    # assign 不修改调用方的 DataFrame（写时复制下也不会复制整表）；规范化影子列不落盘
+    df = drop_shadow_columns(df)
+    text = (df.assign(level=level) if level else df).to_csv(index=False)
+    _release_compacted(out)
+    _write_bytes_atomic(out, _compress(text.encode("utf-8"), _parsed_codec(), PARSED_COMPRESSION_LEVEL))
+    # 同名上传覆盖以其他压缩方式保存的旧文件
+    for suffix in PARSED_SUFFIXES:
+        other = out.with_name(plain_name(out.name)[: -len(".csv")] + suffix)
+        if other != out and other.exists():
+            other.unlink()
+    # 快照与索引共用内存中 CSV 文本的一次解析（与回读文件所得完全一致），不再各自回读、解压刚写入的文件
+    written = pd.read_csv(io.StringIO(text))
+    _snapshot_append(out, written)
+    _index_parsed(out, written)
+
+
+def _release_compacted(out: Path):
+    # 同名文件已被合并（如同日重新上传）：先把旧行移出合并文件，否则新文件会被合并清单遮蔽
+    from modules.compaction import release_source
+    release_source(out)
+
+
+def _snapshot_append(out: Path, df: pd.DataFrame):
+    # 合并语料快照（<storage>/_corpus）为派生数据：写入失败时由下次读取前的同步补齐
+    from modules.snapshot import append_parsed
+    try:
+        append_parsed(out, df)
+    except Exception:
+        logger.exception("语料快照追加失败，将在下次同步时补齐：%s", out)
+
+
+def _index_parsed(out: Path, df: pd.DataFrame):
+    # 全文索引（<storage>/_search）与相似题矩阵（<storage>/_similar）同为派生数据：
+    # 失败时由 search.sync_index / similarity.sync_similarity 补齐
+    from modules import search, similarity
+    for index_file in (search.index_file, similarity.index_file):
+        try:
+            index_file(out, df)
+        except Exception:
+            logger.exception("%s.index_file 失败，将在下次同步时补齐：%s", index_file.__module__, out)
+
+
+def save_parsed_dataset(df: pd.DataFrame, meta: dict, college: str, is_test: bool = False) -> Path:
+    if df is None or df.empty:
+        return None
+    out, level = _parsed_output(meta, college, is_test, df)
+    with span(f"save[{out.name}]", rows=len(df)):
+        _write_parsed(df, out, level)
     return out
 
 
-def list_history(college: str):
+def save_partitions(parts: list[tuple[dict, pd.DataFrame]], college: str, is_test: bool = False,
+                    max_workers: int | None = None) -> list[dict]:
+    """Write (meta, df) partitions concurrently; returns one summary per written partition.
+
+    Partitions that map to the same output file are written in order by one worker, so the
+    last one wins as with sequential save_parsed_dataset calls.
+    """
+    jobs: dict[Path, list] = {}
+    for meta, df in parts:
+        if df is None or df.empty:
+            continue
+        out, level = _parsed_output(meta, college, is_test, df)
+        jobs.setdefault(out, []).append((meta, df, level))
+
+    def _run(out: Path, items: list) -> list[dict]:
+        done = []
+        for meta, df, level in items:
+            t0 = time.perf_counter()
+            _write_parsed(df, out, level)
+            done.append({
+                "file": out.name,
+                "path": str(out),
+                "type": meta.get("type", "-"),
+                "exercise_type": meta.get("exercise_type"),
+                "level": level,
+                "rows": len(df),
+                "quality_summary": meta.get("quality_summary"),
+                "ms": round((time.perf_counter() - t0) * 1000, 3),
+            })
+        return done
+
+    workers = max(1, min(max_workers or SAVE_WORKERS, len(jobs) or 1))
+    if workers == 1:
+        results = [_run(out, items) for out, items in jobs.items()]
+    else:
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            results = list(pool.map(lambda kv: _run(*kv), jobs.items()))
+    summaries = [s for group in results for s in group]
+    # 工作线程不继承当前 trace，写入耗时在主线程补记为 span
+    record_spans([{"name": f"save[{s['file']}]", "depth": 0, "rows": s["rows"], "ms": s["ms"]} for s in summaries])
+    return summaries
+
+
+def save_split_dataset(df: pd.DataFrame, meta: dict, college: str, is_test: bool = False,
+                       max_workers: int | None = None) -> list[dict]:
+    """Split by exercise type in one groupby pass and persist the partitions concurrently."""
+    if df is None or df.empty:
+        return []
+    with span("split", rows=len(df)):
+        parts = split_dataset_by_type(df, meta)
+    with span("write_partitions", rows=len(df)):
+        return save_partitions(parts, college, is_test, max_workers)
+
+
+def _history_records(dirs: list[Path], base: Path) -> list[dict]:
     records = []
-    for d in _dirnames_for_college(college):
+    for d in dirs:
         if not d.exists():
             continue
         for day in sorted([p for p in d.iterdir() if p.is_dir()]):
+            legacy = set(_legacy_parsed_files(day))
             for f in day.iterdir():
+                if f.name.startswith((".", "_")):
+                    continue
+                it = _legacy_parsed_item(day, f) if f in legacy else {"type": None, "level": None}
                 records.append({
                     "date": day.name,
                     "file": f.name,
                     "path": str(f),
+                    "type": it["type"],
+                    "level": it["level"],
                 })
-    return records
-
-def list_history_tests(college: str):
-    records = []
-    for d in _dirnames_for_college_test(college):
-        if not d.exists():
-            continue
-        for day in sorted([p for p in d.iterdir() if p.is_dir()]):
-            for f in day.iterdir():
+            # 内容寻址的原始文件：按清单指针展示
+            for e in _load_raw_manifest(day):
+                blob = base / e.get("blob", "")
+                if not blob.is_file():
+                    continue
                 records.append({
                     "date": day.name,
-                    "file": f.name,
-                    "path": str(f),
+                    "file": e.get("name", blob.name),
+                    "path": str(blob),
+                    "type": None,
+                    "level": None,
+                    "raw": True,
                 })
     return records
 
 
-def merge_all_parsed() -> pd.DataFrame | None:
-    if not BASE.exists():
+def _partitioned_history(college: str, is_test: bool) -> list[dict]:
+    dirs = _dirnames_for_college_test(college) if is_test else _dirnames_for_college(college)
+    return [{"date": it["date"] or "已合并", "file": it["file"], "path": it["path"], "type": it["type"], "level": it["level"]}
+            for it in _iter_partitioned(_parsed_root(is_test), {d.name for d in dirs})]
+
+
+def list_history(college: str):
+    """Upload records of a college: type is "qa" / "ex" for parsed files (from the partition path), None for raw files."""
+    return _history_records(_dirnames_for_college(college), BASE) + _partitioned_history(college, False)
+
+def list_history_tests(college: str):
+    return _history_records(_dirnames_for_college_test(college), BASE_TEST) + _partitioned_history(college, True)
+
+
+def _legacy_parsed_files(day: Path) -> list[Path]:
+    return sorted(f for f in day.iterdir() if "_parsed_" in f.name and _is_parsed_csv(f.name))
+
+
+def _legacy_parsed_item(day: Path, f: Path) -> dict:
+    # 旧布局 <college>/<date>/<name>_parsed_<tkey>[_<lvl>].csv：类型与级别只能从文件名判断
+    tkey = "qa" if "_parsed_qa" in f.name else "ex"
+    level = None
+    if tkey == "ex":
+        if "_parsed_ex_grad" in f.name:
+            level = "研究生"
+        elif "_parsed_ex_ug" in f.name:
+            level = "本科"
+    return {
+        "date": day.name,
+        "file": f.name,
+        "path": str(f),
+        "type": tkey,
+        "level": level,
+        "exercise_type": None,
+        "college_dir": day.parent.name,
+    }
+
+
+def _partition_values(path: Path) -> dict | None:
+    dirs = path.parent.parts[-len(PARTITION_KEYS):]
+    if len(dirs) < len(PARTITION_KEYS):
         return None
-    frames = []
-    for college_dir in BASE.iterdir():
-        if not college_dir.is_dir():
+    values = {}
+    for key, part in zip(PARTITION_KEYS, dirs):
+        k, sep, v = part.partition("=")
+        if not sep or k != key:
+            return None
+        values[key] = None if v == NULL_PARTITION else v
+    return values
+
+
+def parsed_item(path) -> dict:
+    """Partition values of a parsed file (date/file/path/type/level/exercise_type/college_dir) in either layout."""
+    f = Path(path)
+    parts = _partition_values(f)
+    if parts is None:
+        return _legacy_parsed_item(f.parent, f)
+    tkey = "qa" if parts["type"] == QA_PARTITION else "ex"
+    return {
+        "date": parts["date"],
+        "file": f.name,
+        "path": str(f),
+        "type": tkey,
+        "level": parts["level"] if tkey == "ex" else None,
+        "exercise_type": parts["type"] if tkey == "ex" else None,
+        "college_dir": parts["college"],
+    }
+
+
+def _type_partition_ok(etype: str | None, types: list[str] | None, exercise_types: list[str] | None) -> bool:
+    tkey = "qa" if etype == QA_PARTITION else "ex"
+    if types is not None and tkey not in types:
+        return False
+    if exercise_types is None:
+        return True
+    if tkey == "qa":
+        return QA_PARTITION in exercise_types
+    # 混合 / 未分类 / 旧布局文件无法按目录裁剪，读取后按行过滤
+    return etype is None or etype in exercise_types or etype in ("混合", "未分类")
+
+
+def _partition_dirs(parent: Path, key: str):
+    if not parent.is_dir():
+        return
+    for d in sorted(p for p in parent.iterdir() if p.is_dir()):
+        k, sep, v = d.name.partition("=")
+        if sep and k == key:
+            yield d, (None if v == NULL_PARTITION else v)
+
+
+def load_compaction_manifest(root: Path) -> dict:
+    p = root / COMPACTION_MANIFEST
+    if p.exists():
+        try:
+            with open(p, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except Exception:
+            pass
+    return {"next_seq": 1, "parts": {}}
+
+
+def _iter_partitioned(root: Path, college_dirs=None, levels=None, types=None, exercise_types=None, dates=None):
+    """Walk parsed/college=/level=/type=/date=, descending only into partitions that match the filters.
+
+    A type partition with a compacted file yields that file (as registered in the compaction
+    manifest) instead of the CSVs it absorbed.
+    """
+    compacted = load_compaction_manifest(root)["parts"]
+    for cd, college in _partition_dirs(root, "college"):
+        if college_dirs is not None and college not in college_dirs:
             continue
-        for day in college_dir.iterdir():
-            if not day.is_dir():
+        for ld, level in _partition_dirs(cd, "level"):
+            if levels is not None and level not in levels:
                 continue
-            for f in day.glob("*_parsed_*.csv"):
-                try:
-                    df = pd.read_csv(f)
-                    # 显示学院中文名（若不可映射则使用目录名）
-                    df["college"] = get_college_display(college_dir.name)
-                    df["date"] = day.name
-                    # 从文件名推断级别（若列中不存在）
-                    name = f.name
-                    if "_parsed_ex_grad" in name and "level" not in df.columns:
-                        df["level"] = "研究生"
-                    elif "_parsed_ex_ug" in name and "level" not in df.columns:
-                        df["level"] = "本科"
-                    frames.append(df)
-                except Exception:
+            for td, etype in _partition_dirs(ld, "type"):
+                if not _type_partition_ok(etype, types, exercise_types):
                     continue
-    if frames:
-        return pd.concat(frames, ignore_index=True)
-    return None
+                entry = compacted.get(td.relative_to(root).as_posix())
+                covered = {s["path"] for s in entry["sources"]} if entry else set()
+                for dd, date in _partition_dirs(td, "date"):
+                    if date is None:
+                        # 只认清单登记的合并文件：写入中或待删除的旧合并文件不可见
+                        f = dd / entry["file"] if entry else None
+                        if f is not None and f.exists() and (dates is None or set(entry["dates"]) & set(dates)):
+                            yield parsed_item(f)
+                        continue
+                    if dates is not None and date not in dates:
+                        continue
+                    for f in sorted(f for f in dd.iterdir() if _is_parsed_csv(f.name)):
+                        if f.relative_to(root).as_posix() not in covered:
+                            yield parsed_item(f)
+
+
+def _iter_legacy(root: Path, college_dirs=None, levels=None, types=None, exercise_types=None, dates=None):
+    for college_dir in sorted(root.iterdir()):
+        if not college_dir.is_dir() or college_dir.name.startswith("_") or college_dir.name == PARSED_DIRNAME:
+            continue
+        if college_dirs is not None and college_dir.name not in college_dirs:
+            continue
+        for day in sorted(p for p in college_dir.iterdir() if p.is_dir()):
+            if dates is not None and day.name not in dates:
+                continue
+            for f in _legacy_parsed_files(day):
+                it = _legacy_parsed_item(day, f)
+                if levels is not None and (it["level"] or ("本科" if it["type"] == "ex" else None)) not in levels:
+                    continue
+                if not _type_partition_ok(QA_PARTITION if it["type"] == "qa" else None, types, exercise_types):
+                    continue
+                yield it
+
+
+def list_all_parsed(colleges: list[str] | None = None, levels: list[str] | None = None,
+                    types: list[str] | None = None, exercise_types: list[str] | None = None,
+                    dates: list[str] | None = None) -> list[dict]:
+    """Parsed files under BASE with their partition values, filtered before anything is read.
+
+    colleges are codes (their display-name directories are included); types are "qa"/"ex";
+    exercise_types are 题型 values (QA files match "问答对"); a level filter only matches
+    exercise files. Partitioned directories are pruned; legacy-layout files are filtered by name.
+    """
+    if not BASE.exists():
+        return []
+    college_dirs = None
+    if colleges is not None:
+        college_dirs = {p.name for c in colleges for p in _dirnames_for_college(c)}
+    filters = (college_dirs, levels, types, exercise_types, dates)
+    items = list(_iter_legacy(BASE, *filters)) + list(_iter_partitioned(_parsed_root(), *filters))
+    display = {}
+    for it in items:
+        # 显示学院中文名（若不可映射则使用目录名）
+        if it["college_dir"] not in display:
+            display[it["college_dir"]] = get_college_display(it["college_dir"])
+        it["college"] = display[it["college_dir"]]
+    return items
+
+
+def _partition_column(value: str, n: int) -> pd.Categorical:
+    return pd.Categorical.from_codes(np.zeros(n, dtype=np.int8), categories=[value])
+
+
+def _read_compacted(path: str, wanted: list[str] | None, exercise_types: list[str] | None,
+                    dates: list[str] | None) -> pd.DataFrame:
+    import pyarrow.parquet as pq
+
+    names = pq.read_schema(path).names
+    cols = None if wanted is None else [c for c in names if c in wanted or c == PROVENANCE_DATE]
+    filters = []
+    if exercise_types is not None and "type" in names:
+        filters.append(("type", "in", exercise_types))
+    if dates is not None:
+        filters.append((PROVENANCE_DATE, "in", dates))
+    return pq.read_table(path, columns=cols, filters=filters or None).to_pandas()
+
+
+def _read_parsed(it: dict, columns: list[str] | None, exercise_types: list[str] | None = None,
+                 dates: list[str] | None = None, policy: bool = True) -> pd.DataFrame:
+    """One parsed file as a frame with partition columns; policy=False leaves the dtype policy to the caller."""
+    # 目录分区无法确定题型（旧布局 / 混合）时按行过滤题型
+    row_filter = exercise_types is not None and it["type"] == "ex" and it.get("exercise_type") not in exercise_types
+    wanted = columns if columns is None or not row_filter else list(columns) + ["type"]
+    if it["path"].endswith(".parquet"):
+        df = _read_compacted(it["path"], wanted, exercise_types if row_filter else None, dates)
+    else:
+        usecols = None if wanted is None else (lambda c: c in wanted)
+        try:
+            enc = "utf-8"
+            df = pd.read_csv(it["path"], encoding=enc, usecols=usecols)
+        except UnicodeDecodeError:
+            enc = "gb18030"
+            df = pd.read_csv(it["path"], encoding=enc, usecols=usecols)
+        if columns is not None and df.columns.empty:
+            # 只投影分区列时仍需行数：读取首列后丢弃
+            df = pd.read_csv(it["path"], encoding=enc, usecols=[0])[[]]
+        if row_filter and "type" in df.columns:
+            df = df[df["type"].astype(str).isin(exercise_types)].reset_index(drop=True)
+    if row_filter and columns is not None and "type" not in columns:
+        df = df.drop(columns=["type"], errors="ignore")
+    return _attach_partitions(apply_dtype_policy(df) if policy else df, it, columns)
+
+
+def _frame_as_read(df: pd.DataFrame, it: dict, columns: list[str] | None) -> pd.DataFrame:
+    """_read_parsed(it, columns) for a file whose CSV content the caller has already parsed into df."""
+    if columns is not None:
+        df = df[[c for c in df.columns if c in columns]]
+    return _attach_partitions(apply_dtype_policy(df), it, columns)
+
+
+def _attach_partitions(df: pd.DataFrame, it: dict, columns: list[str] | None) -> pd.DataFrame:
+    parts = {"college": it["college"], "date": it["date"]}
+    # 级别取自分区（旧布局从文件名推断），仅在列中不存在时附加
+    if it["type"] == "ex" and "level" not in df.columns:
+        parts["level"] = it["level"] or "本科"
+    extra = {k: (df[PROVENANCE_DATE].astype("category") if v is None else _partition_column(v, len(df)))
+             for k, v in parts.items() if columns is None or k in columns}
+    # 合并文件的日期按行取自上传日期溯源列；溯源列仅在显式投影时保留
+    hidden = [c for c in (PROVENANCE_SOURCE, PROVENANCE_DATE) if c in df.columns and (columns is None or c not in columns)]
+    df = df.drop(columns=hidden)
+    return df.assign(**extra) if extra else df
+
+
+def merge_parsed(columns: list[str] | None = None, colleges: list[str] | None = None,
+                 levels: list[str] | None = None, types: list[str] | None = None,
+                 max_workers: int | None = None, exercise_types: list[str] | None = None,
+                 dates: list[str] | None = None) -> tuple[pd.DataFrame | None, list[dict]]:
+    """Read the matching parsed files concurrently and concatenate them.
+
+    Filters prune partitions before reading (see list_all_parsed). columns projects both
+    file and partition columns (college/date/level, attached as categoricals).
+    Returns (frame or None, skipped) where skipped lists {path, error}.
+    """
+    def _load(it: dict):
+        try:
+            # dtype 策略由 concat_frames 在合并后统一应用一次，不再逐文件转换
+            return _read_parsed(it, columns, exercise_types, dates, policy=False), None
+        except Exception as e:
+            return None, {"path": it["path"], "error": f"{type(e).__name__}: {e}", "missing": isinstance(e, FileNotFoundError)}
+
+    for attempt in range(2):
+        items = list_all_parsed(colleges, levels, types, exercise_types, dates)
+        if not items:
+            return None, []
+        workers = max(1, min(max_workers or MERGE_WORKERS, len(items)))
+        with span(f"merge_parsed[{len(items)} files]") as rec:
+            if workers == 1:
+                results = [_load(it) for it in items]
+            else:
+                with ThreadPoolExecutor(max_workers=workers) as pool:
+                    results = list(pool.map(_load, items))
+            # 读取期间小文件被合并后删除：按新的合并清单重新列出再读一次
+            if attempt == 0 and any(err is not None and err["missing"] for _, err in results):
+                continue
+            frames = [df for df, _ in results if df is not None]
+            skipped = [{"path": err["path"], "error": err["error"]} for _, err in results if err is not None]
+            merged = concat_frames(frames) if frames else None
+            rec["rows"] = 0 if merged is None else len(merged)
+        return merged, skipped
+
+
+def merge_all_parsed(**kwargs) -> pd.DataFrame | None:
+    """merge_parsed without the skipped-file report."""
+    return merge_parsed(**kwargs)[0]
 
 def list_parsed_datasets(college: str, is_test: bool = False):
     items = []
@@ -133,31 +723,110 @@ def list_parsed_datasets(college: str, is_test: bool = False):
         if not d.exists():
             continue
         for day in sorted([p for p in d.iterdir() if p.is_dir()]):
-            for f in day.glob("*_parsed_*.csv"):
-                tkey = "qa" if "_parsed_qa" in f.name else "ex"
-                level = None
-                if tkey == "ex":
-                    if "_parsed_ex_grad" in f.name:
-                        level = "研究生"
-                    elif "_parsed_ex_ug" in f.name:
-                        level = "本科"
-                items.append({
-                    "date": day.name,
-                    "file": f.name,
-                    "path": str(f),
-                    "type": tkey,
-                    "level": level,
-                })
+            for f in _legacy_parsed_files(day):
+                items.append(_legacy_parsed_item(day, f))
+    items.extend(_iter_partitioned(_parsed_root(is_test), {d.name for d in dirs}))
     return items
 
+
+def migrate_layout(is_test: bool = False, dry_run: bool = False) -> list[dict]:
+    """Move legacy <college>/<date>/*_parsed_*.csv files into the partitioned layout.
+
+    Display-name directories are merged into their college code. A destination that already
+    holds identical bytes makes the legacy file redundant; differing files get a numbered name.
+    Returns one {from, to, status} entry per file.
+    """
+    base = BASE_TEST if is_test else BASE
+    if not base.exists():
+        return []
+    by_dir = {}
+    for code, name in load_college_mapping().items():
+        by_dir.setdefault(_safe_dir(name), code)
+        by_dir[code] = code
+    moves = []
+    for it in _iter_legacy(base):
+        src = Path(it["path"])
+        code = by_dir.get(it["college_dir"], it["college_dir"])
+        if it["type"] == "qa":
+            etype, level = QA_PARTITION, None
+        else:
+            level = it["level"] or "本科"
+            try:
+                head = pd.read_csv(src, usecols=lambda c: c == "type", encoding="utf-8")
+            except UnicodeDecodeError:
+                head = pd.read_csv(src, usecols=lambda c: c == "type", encoding="gb18030")
+            except Exception:
+                head = pd.DataFrame()
+            etype = _exercise_type({}, head)
+        dest = _partition_path(_parsed_root(is_test), code, level, etype, it["date"]) / src.name
+        status = "moved"
+        if dest.exists():
+            if dest.read_bytes() == src.read_bytes():
+                status = "duplicate"
+            else:
+                stem = plain_name(src.name)[: -len(".csv")]
+                ext = src.name[len(stem):]
+                n = 2
+                while dest.with_name(f"{stem}_{n}{ext}").exists():
+                    n += 1
+                dest = dest.with_name(f"{stem}_{n}{ext}")
+                status = "renamed"
+        moves.append({"from": str(src), "to": str(dest), "status": status})
+        if dry_run:
+            continue
+        if status == "duplicate":
+            src.unlink()
+        else:
+            dest.parent.mkdir(parents=True, exist_ok=True)
+            os.replace(src, dest)
+    return moves
+
+def compress_parsed(is_test: bool = False, dry_run: bool = False) -> list[dict]:
+    """Rewrite stored parsed CSVs with the configured PARSED_COMPRESSION codec and level.
+
+    Files already using the codec are left alone. Returns {from, to, before, after} (bytes) per file.
+    """
+    base = BASE_TEST if is_test else BASE
+    if not base.exists():
+        return []
+    codec = _parsed_codec()
+    ext = ".csv" + _blob_suffix(codec)
+    items = list(_iter_legacy(base)) + list(_iter_partitioned(_parsed_root(is_test)))
+    out = []
+    for it in items:
+        src = Path(it["path"])
+        if not _is_parsed_csv(src.name) or src.name[len(plain_name(src.name)):] == _blob_suffix(codec):
+            continue
+        dest = src.with_name(plain_name(src.name)[: -len(".csv")] + ext)
+        data = read_raw_bytes(str(src))
+        packed = _compress(data, codec, PARSED_COMPRESSION_LEVEL)
+        out.append({"from": str(src), "to": str(dest), "before": src.stat().st_size, "after": len(packed)})
+        if dry_run:
+            continue
+        _write_bytes_atomic(dest, packed)
+        src.unlink()
+    return out
+
+
 def load_csv(path: str) -> pd.DataFrame:
+    # 读取时统一应用 dtype 策略：文本列用 pyarrow 字符串，题型/级别等低基数列用 category
+    return apply_dtype_policy(_read_table(path))
+
+
+def _read_table(path: str) -> pd.DataFrame:
     p = Path(path)
-    suffix = p.suffix.lower()
+    # 压缩的 CSV 按去掉压缩后缀的扩展名判断，pandas 按后缀流式解压
+    suffix = Path(plain_name(p.name)).suffix.lower()
     if suffix in [".xlsx", ".xls"]:
         try:
             return pd.read_excel(p, sheet_name=0, dtype=str)
         except Exception:
             return pd.DataFrame()
+    if suffix == ".parquet":
+        try:
+            return pd.read_parquet(p)
+        except Exception:
+            return pd.DataFrame()
     if suffix == ".csv":
         # Try UTF-8 first, then fallback to GB18030
         try:
@@ -171,15 +840,77 @@ def load_csv(path: str) -> pd.DataFrame:
             return pd.DataFrame()
     return pd.DataFrame()
 
+
+def iter_csv_chunks(path: str, chunksize: int = 5000):
+    """Yield a parsed CSV in row chunks with load_csv's encoding fallback, without loading it whole."""
+    if str(path).endswith(".parquet"):
+        yield from _iter_parquet_chunks(path, chunksize)
+        return
+    yielded = 0
+    for enc in ("utf-8", "gb18030"):
+        seen = 0
+        try:
+            with pd.read_csv(path, encoding=enc, chunksize=chunksize) as reader:
+                for chunk in reader:
+                    seen += len(chunk)
+                    # 编码回退重读时跳过已经产出的行
+                    if seen <= yielded:
+                        continue
+                    if seen - len(chunk) < yielded:
+                        chunk = chunk.iloc[yielded - (seen - len(chunk)):]
+                    yielded = seen
+                    yield chunk
+            return
+        except UnicodeDecodeError:
+            continue
+        except Exception:
+            return
+
+
+def _iter_parquet_chunks(path: str, chunksize: int):
+    import pyarrow.parquet as pq
+
+    start = 0
+    try:
+        for batch in pq.ParquetFile(path).iter_batches(batch_size=chunksize):
+            # 与 read_csv 分块一致：索引为文件内行号
+            chunk = batch.to_pandas()
+            chunk.index = pd.RangeIndex(start, start + len(chunk))
+            start += len(chunk)
+            yield chunk
+    except Exception:
+        return
+
+
 def delete_path(path: str) -> bool:
     p = Path(path)
     try:
-        if p.exists():
-            p.unlink()
-            return True
-        return False
+        if not p.exists():
+            return False
+        corpus_file = "_parsed_" in p.name and relpath(p) is not None
+        if corpus_file:
+            # 解析结果删除前先按内容哈希留存原字节（可由 versions.restore_deleted 恢复）；留存失败则不删除
+            from modules.versions import preserve_deleted
+            preserve_deleted(p)
+        p.unlink()
     except Exception:
+        logger.exception("删除失败：%s", p)
         return False
+    if corpus_file:
+        _unindex_deleted(p)
+    return True
+
+
+def _unindex_deleted(p: Path):
+    # 文件已删除：快照墓碑与索引移除同为派生数据，失败时由下次同步补齐
+    from modules.snapshot import tombstone_path
+    from modules import search, similarity
+    for what, remove in (("语料快照墓碑", tombstone_path), ("全文索引移除", search.remove_file),
+                         ("相似题矩阵移除", similarity.remove_file)):
+        try:
+            remove(p)
+        except Exception:
+            logger.exception("%s失败，将在下次同步时补齐：%s", what, p)
 
 def get_colleges(include_admin: bool = False):
     mapping = load_college_mapping()
@@ -223,33 +954,28 @@ def save_targets(college: str, qa: int, ex_ug: int, ex_grad: int, types: dict |
         yaml.safe_dump(data, f, allow_unicode=True)
 
 def log_login(username: str, college: str) -> None:
-    d = BASE_LOGINS / college
-    d.mkdir(parents=True, exist_ok=True)
-    p = d / f"{_today()}.log"
-    try:
-        with open(p, "a", encoding="utf-8") as f:
-            f.write(f"{dt.datetime.now().isoformat()}\t{username}\n")
-    except Exception:
-        pass
+    # 登录事件写入 SQLite 事件库（storage_logins/logins.db），同时维护日/周活跃汇总
+    from modules.logins import record_login
+    record_login(username, college)
 
 def list_logins(college: str):
-    d = BASE_LOGINS / college
-    items = []
-    if not d.exists():
-        return items
-    for f in sorted([p for p in d.iterdir() if p.is_file()]):
-        try:
-            with open(f, "r", encoding="utf-8") as fh:
-                lines = [ln.strip() for ln in fh.readlines()]
-        except Exception:
-            lines = []
-        items.append({"date": f.stem, "events": lines})
-    return items
+    from modules.logins import login_days
+    try:
+        return login_days(college)
+    except Exception:
+        return []
 
 def load_college_mapping() -> dict:
     p = Path("config/users.yaml")
-    mapping = {}
-    if p.exists():
+    try:
+        st = p.stat()
+    except OSError:
+        return {}
+    # 列表与路径解析频繁调用：按文件修改时间与大小缓存解析结果，用户配置保存后自动失效
+    key = (str(p.resolve()), st.st_mtime_ns, st.st_size)
+    cached = _college_mapping_cache.get(key)
+    if cached is None:
+        cached = {}
         try:
             with open(p, "r", encoding="utf-8") as f:
                 data = yaml.safe_load(f) or {}
@@ -259,10 +985,12 @@ def load_college_mapping() -> dict:
                 if not code and uname.startswith("user_"):
                     code = uname.split("_", 1)[1]
                 if code:
-                    mapping[code] = info.get("name", code)
+                    cached[code] = info.get("name", code)
         except Exception:
             pass
-    return mapping
+        _college_mapping_cache.clear()
+        _college_mapping_cache[key] = cached
+    return dict(cached)
 
 def get_college_display(code: str) -> str:
     m = load_college_mapping()
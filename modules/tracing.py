@@ -0,0 +1,112 @@
+import contextvars
+import datetime as dt
+import json
+import os
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+LOG_DIR = Path("logs")
+UPLOAD_LOG_DIR = LOG_DIR / "uploads"
+
+_current = contextvars.ContextVar("trace", default=None)
+
+
+def _rss_bytes() -> int:
+    """Current resident set size; falls back to peak RSS where /proc is unavailable."""
+    try:
+        with open("/proc/self/statm", "r") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except Exception:
+        pass
+    try:
+        import resource
+        return int(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss) * 1024
+    except Exception:
+        return 0
+
+
+class Tracer:
+    """Collects nested spans (monotonic timings, row counts, RSS deltas) for one operation."""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.spans: list[dict] = []
+        self._depth = 0
+        self._t0 = time.perf_counter()
+
+    @contextmanager
+    def span(self, name: str, rows: int | None = None):
+        rec = {"name": name, "depth": self._depth, "rows": rows,
+               "start_ms": round((time.perf_counter() - self._t0) * 1000, 3)}
+        self.spans.append(rec)
+        mem0 = _rss_bytes()
+        t0 = time.perf_counter()
+        self._depth += 1
+        try:
+            yield rec
+        finally:
+            self._depth -= 1
+            rec["ms"] = round((time.perf_counter() - t0) * 1000, 3)
+            rec["mem_delta_kb"] = round((_rss_bytes() - mem0) / 1024, 1)
+
+    def records(self) -> list[dict]:
+        return [dict(r) for r in self.spans]
+
+    def total_ms(self) -> float:
+        return round(sum(r.get("ms", 0.0) for r in self.spans if r["depth"] == 0), 3)
+
+
+@contextmanager
+def start_trace(name: str):
+    """Activate a tracer for the block; span() calls made inside (at any call depth) are recorded on it."""
+    tracer = Tracer(name)
+    token = _current.set(tracer)
+    try:
+        yield tracer
+    finally:
+        _current.reset(token)
+
+
+@contextmanager
+def span(name: str, rows: int | None = None):
+    """Record a stage on the active tracer; a no-op when no trace is active."""
+    tracer = _current.get()
+    if tracer is None:
+        yield {}
+        return
+    with tracer.span(name, rows) as rec:
+        yield rec
+
+
+def record_spans(records: list[dict]) -> None:
+    """Graft spans recorded by a separate tracer onto the active one, nested at the current depth."""
+    tracer = _current.get()
+    if tracer is None:
+        return
+    for r in records:
+        rec = dict(r)
+        rec["depth"] = int(r.get("depth", 0)) + tracer._depth
+        tracer.spans.append(rec)
+
+
+def log_upload(college: str, filename: str, rows: int, stages: dict[str, list[dict]], extra: dict | None = None) -> Path | None:
+    """Append one JSON line per upload under logs/uploads/<date>.jsonl."""
+    entry = {
+        "ts": dt.datetime.now().isoformat(timespec="seconds"),
+        "college": college,
+        "file": filename,
+        "rows": rows,
+        "total_ms": round(sum(r.get("ms", 0.0) for recs in stages.values() for r in recs if r.get("depth") == 0), 3),
+        "stages": stages,
+    }
+    if extra:
+        entry.update(extra)
+    try:
+        UPLOAD_LOG_DIR.mkdir(parents=True, exist_ok=True)
+        p = UPLOAD_LOG_DIR / f"{dt.date.today().isoformat()}.jsonl"
+        with open(p, "a", encoding="utf-8") as f:
+            f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+        return p
+    except Exception:
+        return None
@@ -1,6 +1,9 @@
+import numpy as np
 import streamlit as st
 import pandas as pd
-from modules.quality import assess_qa, assess_exercises
+from modules.quality import assess_qa, assess_exercises, error_cell_mask
+from modules.normalize import drop_shadow_columns
+from modules.sampling import sample_frame, make_sample_id, SAMPLE_SIZE
 from pathlib import Path
 
 def load_custom_css():
@@ -71,8 +74,33 @@ def render_overview(meta: dict):
             {"类别": "其他问题", "数量": sum(other.values()), "占比(%)": _pct(sum(other.values()))},
         ]
         st.dataframe(pd.DataFrame(rows), use_container_width=True)
+    if meta.get("perf"):
+        render_perf_details(meta["perf"], meta.get("parse_perf") if meta.get("parse_cached") else None)
 
 
+def _perf_table(spans: list[dict]):
+    total = sum(r.get("ms", 0.0) for r in spans if r.get("depth") == 0)
+    st.caption(f"总耗时 {round(total, 1)} ms")
+    rows = [
+        {
+            "阶段": "\u3000" * int(r.get("depth", 0)) + str(r.get("name", "")),
+            "耗时(ms)": r.get("ms"),
+            "占比(%)": round(r.get("ms", 0.0) / total * 100, 1) if total else 0.0,
+            "行数": r.get("rows"),
+            "内存变化(KB)": r.get("mem_delta_kb"),
+        }
+        for r in spans
+    ]
+    st.dataframe(pd.DataFrame(rows), use_container_width=True)
+
+
+def render_perf_details(spans: list[dict], cached_parse: list[dict] | None = None):
+    with st.expander("性能明细", expanded=False):
+        _perf_table(spans)
+        if cached_parse:
+            st.caption("解析结果来自缓存，以下为首次解析明细")
+            _perf_table(cached_parse)
+
 
 def render_warnings(warnings: list[str]):
     if warnings:
@@ -81,11 +109,74 @@ def render_warnings(warnings: list[str]):
                 st.warning(w)
 
 
+ERROR_CELL_STYLE = "background-color: #fdecea"
+
+
+def _highlight_errors(frame: pd.DataFrame, flags):
+    """Style a (page-sized) frame in one vectorized pass from its quality flags."""
+    mask = error_cell_mask(frame, flags)
+    styles = pd.DataFrame(np.where(mask.to_numpy(), ERROR_CELL_STYLE, ""), index=frame.index, columns=frame.columns)
+    return frame.style.apply(lambda _: styles, axis=None)
+
+
+def _ensure_assessed(frame: pd.DataFrame, meta: dict | None) -> pd.DataFrame:
+    # 解析结果已带质检列时直接复用，避免每次重运行重新质检
+    if "quality_flags" in frame.columns:
+        return frame
+    return assess_qa(frame) if meta and meta.get("type") == "问答对" else assess_exercises(frame)
+
+
+def _render_similar(df: pd.DataFrame, meta: dict | None, key_prefix: str):
+    from modules.similarity import similarity_available, similar_items, sync_similarity, SIMILAR_TOP_K
+    from modules.storage import relpath
+
+    text_col = "stem" if "stem" in df.columns else ("question" if "question" in df.columns else None)
+    if text_col is None:
+        st.info("无题干或问题列，无法查找相似题")
+        return
+    if not similarity_available():
+        st.info("未安装 scipy，无法计算相似题")
+        return
+    # 按需计算：勾选后才加载全库矩阵
+    synced_key = f"{key_prefix}-similar-synced"
+    if not st.checkbox("查找全库相似题", value=False, key=f"{key_prefix}-similar-on"):
+        st.session_state.pop(synced_key, None)
+        return
+    if not st.session_state.get(synced_key):
+        # 每次勾选只补齐一次未向量化的文件；换行号、条数引起的重运行直接查询（保存时已增量更新矩阵）
+        with st.spinner("正在同步全库相似题矩阵..."):
+            sync_similarity()
+        st.session_state[synced_key] = True
+    meta = meta or {}
+    c_row, c_k, c_other = st.columns([2, 2, 2])
+    with c_row:
+        row = int(st.number_input("行号", min_value=0, max_value=len(df) - 1, value=0, key=f"{key_prefix}-similar-row"))
+    with c_k:
+        k = st.slider("显示条数", 3, 20, SIMILAR_TOP_K, key=f"{key_prefix}-similar-k")
+    with c_other:
+        only_other = bool(meta.get("college")) and st.checkbox("仅显示其他学院", value=True, key=f"{key_prefix}-similar-other")
+    text = df[text_col].iloc[row]
+    st.write(f"**当前题干**：{text}")
+    src = relpath(meta["path"]) if meta.get("path") else None
+    hits = similar_items(text, k, exclude=(src, row) if src else None,
+                         exclude_colleges=[meta["college"]] if only_other else None)
+    if not hits:
+        st.info("未找到相似题")
+        return
+    view = pd.DataFrame(hits)[["score", "college", "level", "exercise_type", "stem", "answer", "knowledge", "file", "row"]]
+    st.dataframe(view.rename(columns={
+        "score": "相似度", "college": "学院", "level": "级别", "exercise_type": "题型", "stem": "题干",
+        "answer": "答案", "knowledge": "知识点", "file": "文件", "row": "行号",
+    }), use_container_width=True)
+
+
 def render_tabs(df: pd.DataFrame, meta: dict | None = None, key_prefix: str = ""):
     if df is None or df.empty:
         st.info("未识别到有效数据")
         return
-    tab1, tab2, tab3 = st.tabs(["顺序浏览 (预览/导出)", "随机抽检 (20条)", "类型统计"])
+    # 规范化影子列只供质检 / 向量化复用，不在预览与导出中出现
+    df = drop_shadow_columns(df)
+    tab1, tab2, tab3, tab4 = st.tabs(["顺序浏览 (预览/导出)", "随机抽检 (20条)", "类型统计", "相似题"])
     
     # --- Tab 1: Sequential Browsing (Main View) ---
     with tab1:
@@ -116,7 +207,7 @@ def render_tabs(df: pd.DataFrame, meta: dict | None = None, key_prefix: str = ""
         
         # Apply Issue Filter
         if only_issues and meta:
-            assessed = assess_qa(view) if meta.get("type") == "问答对" else assess_exercises(view)
+            assessed = _ensure_assessed(view, meta)
             view = assessed[assessed["quality_flags"].astype(str).str.contains("Error:|Warn:")]
             
             # Export Button (In Row 1, Col 3) - requires 'view' to be filtered first
@@ -156,23 +247,8 @@ def render_tabs(df: pd.DataFrame, meta: dict | None = None, key_prefix: str = ""
 
         # Render Table
         if only_issues and meta:
-             # Logic for styling issues (copied/adapted from previous implementation)
-            flags_map = view["quality_flags"].to_dict() # Map index -> flags
-            def _cell_style_safe(row):
-                 flags = str(flags_map.get(row.name, ""))
-                 cols = list(row.index)
-                 red_cols = set()
-                 if meta.get("type") == "问答对":
-                    if "Error:Q_EMPTY" in flags or "Error:Q_GARBLED" in flags: red_cols.add("question")
-                    if "Error:A_EMPTY" in flags or "Error:A_GARBLED" in flags: red_cols.add("answer")
-                 else:
-                    if "Error:STEM_EMPTY" in flags or "Error:STEM_GARBLED" in flags: red_cols.add("stem")
-                    if "Error:OPT_EMPTY" in flags or "Error:OPT_GARBLED" in flags: red_cols.add("options")
-                    if "Error:ANS_EMPTY" in flags or "Error:ANS_GARBLED" in flags or "Error:ANS_NOT_IN_OPTS" in flags or "Error:ANS_INVALID" in flags: red_cols.add("answer")
-                    if "Error:KN_EMPTY" in flags or "Error:KN_GARBLED" in flags: red_cols.add("knowledge")
-                 return ["background-color: #fdecea" if c in red_cols else "" for c in cols]
-
-            st.dataframe(view_slice.style.apply(_cell_style_safe, axis=1), use_container_width=use_width_t1)
+            flags = view["quality_flags"].iloc[int(start):int(end)]
+            st.dataframe(_highlight_errors(view_slice, flags), use_container_width=use_width_t1)
         else:
             st.dataframe(view_slice, use_container_width=use_width_t1)
 
@@ -185,28 +261,19 @@ def render_tabs(df: pd.DataFrame, meta: dict | None = None, key_prefix: str = ""
         with sel_col:
              show_cols = st.multiselect("显示列", cols, default=cols, key=f"{key_prefix}-t2-cols")
         
-        n = min(20, len(df))
-        sample_df = df.sample(n)
-        view_df = sample_df[show_cols] if show_cols else sample_df 
-        
-        assessed = assess_qa(sample_df) if meta and meta.get("type") == "问答对" else assess_exercises(sample_df)
+        seed_key = f"{key_prefix}-sample-seed"
+        c_seed, c_next = st.columns([4, 1])
+        with c_next:
+            if st.button("换一批", key=f"{key_prefix}-sample-next"):
+                st.session_state[seed_key] = int(st.session_state.get(seed_key, 0)) + 1
+        seed = int(st.session_state.get(seed_key, 0))
+        with c_seed:
+            st.caption(f"样本编号 {make_sample_id({'scope': key_prefix, 'rows': len(df), 'seed': seed})}（种子 {seed}，同一种子重新运行结果不变）")
+        sample_df = sample_frame(df, SAMPLE_SIZE, seed, by=["type"])
         
-        def _cell_style(row):
-            flags = str(row.get("quality_flags", ""))
-            cols_to_style = list(view_df.columns) 
-            red_cols = set()
-            if meta and meta.get("type") == "问答对":
-                if "Error:Q_EMPTY" in flags or "Error:Q_GARBLED" in flags: red_cols.add("question")
-                if "Error:A_EMPTY" in flags or "Error:A_GARBLED" in flags: red_cols.add("answer")
-            else:
-                if "Error:STEM_EMPTY" in flags or "Error:STEM_GARBLED" in flags: red_cols.add("stem")
-                if "Error:OPT_EMPTY" in flags or "Error:OPT_GARBLED" in flags: red_cols.add("options")
-                if "Error:ANS_EMPTY" in flags or "Error:ANS_GARBLED" in flags or "Error:ANS_NOT_IN_OPTS" in flags or "Error:ANS_INVALID" in flags: red_cols.add("answer")
-                if "Error:KN_EMPTY" in flags or "Error:KN_GARBLED" in flags: red_cols.add("knowledge")
-            return ["background-color: #fdecea" if c in red_cols else "" for c in cols_to_style]
-        
-        final_view = assessed[show_cols]
-        st.dataframe(final_view.style.apply(_cell_style, axis=1), use_container_width=use_width)
+        assessed = _ensure_assessed(sample_df, meta)
+        final_view = assessed[show_cols] if show_cols else assessed
+        st.dataframe(_highlight_errors(final_view, assessed["quality_flags"]), use_container_width=use_width)
     with tab3:
         t = None
         if meta:
@@ -246,6 +313,25 @@ def render_tabs(df: pd.DataFrame, meta: dict | None = None, key_prefix: str = ""
                 if "analysis" in df.columns:
                     non_empty = float((df["analysis"].astype(str).str.len() > 0).mean()) if len(df) else 0.0
                     st.metric("解析非空比例", round(non_empty*100, 2))
+    with tab4:
+        _render_similar(df, meta, key_prefix)
+
+
+def select_dataset(items: list[dict], key: str, label: str = "选择文件查看") -> dict | None:
+    """File picker over list_parsed_datasets() items; only the picked file is loaded by the caller."""
+    if not items:
+        st.info("暂无文件")
+        return None
+    by_path = {it["path"]: it for it in items}
+    def _fmt(path: str) -> str:
+        if not path:
+            return "（未选择，选择后加载预览）"
+        it = by_path[path]
+        kind = "问答对" if it.get("type") == "qa" else "习题库"
+        lev = f" · {it['level']}" if it.get("level") else ""
+        return f"{it['date']} - {it['file']}（{kind}{lev}）"
+    path = st.selectbox(label, [""] + list(by_path.keys()), format_func=_fmt, key=key)
+    return by_path.get(path) if path else None
 
 
 def render_history(records: list[dict]):
@@ -287,4 +373,3 @@ def style_sidebar_menu():
     # The CSS is now largely handled by assets/style.css, but we can inject specific overrides if needed here.
     # For now, we rely on the global CSS.
     pass
-
@@ -0,0 +1,290 @@
+"""Corpus versions: immutable manifests over content-hashed row blocks under <storage>/_versions.
+
+A block is one parsed file's rows as Parquet, named by the sha256 of the CSV bytes, so
+identical content is stored once. A version manifest maps every parsed file to its block;
+creating one only hashes files whose size or mtime changed since the previous version.
+"""
+import datetime as dt
+import hashlib
+import json
+import threading
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+from pathlib import Path
+
+import pandas as pd
+
+import modules.storage as storage
+from modules.dtypes import apply_dtype_policy, concat_frames
+from modules.snapshot import dataset_key, dataset_keys
+from modules.tracing import span
+
+VERSIONS_DIRNAME = "_versions"
+DELETED_LOG = "deleted.jsonl"
+_lock = threading.Lock()
+
+
+def versions_dir() -> Path:
+    return storage.BASE / VERSIONS_DIRNAME
+
+
+def _block_path(digest: str) -> Path:
+    return versions_dir() / "blocks" / digest[:2] / f"{digest}.parquet"
+
+
+def _manifest_path(vid: str) -> Path:
+    return versions_dir() / "manifests" / f"{vid}.json"
+
+
+def _frame_from_bytes(data: bytes) -> pd.DataFrame:
+    if data[:4] == b"PAR1":
+        # 合并后的 Parquet 文件
+        return pd.read_parquet(BytesIO(data))
+    try:
+        return pd.read_csv(BytesIO(data), encoding="utf-8")
+    except UnicodeDecodeError:
+        return pd.read_csv(BytesIO(data), encoding="gb18030")
+
+
+def _store_block(data: bytes) -> tuple[str, int, bool]:
+    """Write the rows of a parsed CSV as a block unless one with the same content exists."""
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    digest = hashlib.sha256(data).hexdigest()
+    p = _block_path(digest)
+    if p.exists():
+        return digest, pq.ParquetFile(p).metadata.num_rows, False
+    df = apply_dtype_policy(_frame_from_bytes(data))
+    p.parent.mkdir(parents=True, exist_ok=True)
+    tmp = p.with_name(f".{p.name}.tmp")
+    pq.write_table(pa.Table.from_pandas(df, preserve_index=False), tmp)
+    tmp.replace(p)
+    return digest, len(df), True
+
+
+def load_version_manifest(vid: str) -> dict | None:
+    p = _manifest_path(vid)
+    if not p.exists():
+        return None
+    with open(p, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def list_versions() -> list[dict]:
+    """Version summaries (no per-file entries), oldest first."""
+    d = versions_dir() / "manifests"
+    out = []
+    for p in sorted(d.glob("v*.json")) if d.exists() else []:
+        try:
+            with open(p, "r", encoding="utf-8") as f:
+                m = json.load(f)
+        except Exception:
+            continue
+        out.append({k: v for k, v in m.items() if k != "sources"})
+    return out
+
+
+def create_version(note: str = "", max_workers: int | None = None) -> dict:
+    """Record the current parsed corpus as a new immutable version.
+
+    Files unchanged since the previous version reuse its block entries, so the cost is
+    proportional to the changed files. Returns the version summary plus skipped files.
+    """
+    items = storage.list_all_parsed()
+    with _lock, storage._file_lock(versions_dir() / ".lock"), span("create_version") as rec:
+        existing = list_versions()
+        parent = load_version_manifest(existing[-1]["id"]) if existing else None
+        prev = parent["sources"] if parent else {}
+        sources, todo = {}, []
+        for it in items:
+            src = storage.relpath(it["path"])
+            try:
+                st = Path(it["path"]).stat()
+            except OSError:
+                continue
+            old = prev.get(src)
+            if old and old["size"] == st.st_size and old["mtime_ns"] == st.st_mtime_ns:
+                sources[src] = old
+            else:
+                todo.append((src, it, st))
+
+        def _capture(job):
+            src, it, st = job
+            try:
+                # 按解压后的内容寻址：压缩方式变化不产生新数据块
+                digest, rows, written = _store_block(storage.read_raw_bytes(it["path"]))
+            except Exception as e:
+                return src, None, {"path": it["path"], "error": f"{type(e).__name__}: {e}"}
+            return src, {
+                "block": digest,
+                "rows": rows,
+                "key": dataset_key(it["type"], it["level"]),
+                "college_dir": it["college_dir"],
+                "date": it["date"],
+                "level": it["level"],
+                "size": st.st_size,
+                "mtime_ns": st.st_mtime_ns,
+                "written": written,
+            }, None
+
+        workers = max(1, min(max_workers or storage.MERGE_WORKERS, len(todo) or 1))
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            captured = list(pool.map(_capture, todo))
+        new_blocks = 0
+        skipped = []
+        for src, entry, err in captured:
+            if entry is None:
+                skipped.append(err)
+                continue
+            new_blocks += entry.pop("written")
+            sources[src] = entry
+        seq = (existing[-1]["seq"] + 1) if existing else 1
+        manifest = {
+            "id": f"v{seq:04d}",
+            "seq": seq,
+            "parent": parent["id"] if parent else None,
+            "created": dt.datetime.now().isoformat(timespec="seconds"),
+            "note": note,
+            "files": len(sources),
+            "rows": sum(e["rows"] for e in sources.values()),
+            "changed_files": len(todo),
+            "new_blocks": new_blocks,
+            "sources": dict(sorted(sources.items())),
+        }
+        p = _manifest_path(manifest["id"])
+        p.parent.mkdir(parents=True, exist_ok=True)
+        # 版本清单只创建不修改
+        with open(p, "x", encoding="utf-8") as f:
+            json.dump(manifest, f, ensure_ascii=False, indent=1)
+        rec["rows"] = len(todo)
+    summary = {k: v for k, v in manifest.items() if k != "sources"}
+    summary["skipped"] = skipped
+    return summary
+
+
+def _read_block(src: str, e: dict, columns: list[str] | None) -> pd.DataFrame:
+    import pyarrow.parquet as pq
+
+    p = _block_path(e["block"])
+    cols = None
+    if columns is not None:
+        names = set(pq.read_schema(p).names)
+        cols = [c for c in list(columns) + [storage.PROVENANCE_DATE] if c in names]
+    df = pq.read_table(p, columns=cols).to_pandas()
+    if cols == []:
+        df = pd.DataFrame(index=pd.RangeIndex(e["rows"]))
+    it = {"college": storage.get_college_display(e["college_dir"]), "date": e["date"],
+          "type": "qa" if e["key"] == "qa" else "ex", "level": e["level"]}
+    return storage._attach_partitions(df, it, columns)
+
+
+def load_version(vid: str, columns: list[str] | None = None, colleges: list[str] | None = None,
+                 levels: list[str] | None = None, types: list[str] | None = None,
+                 max_workers: int | None = None) -> pd.DataFrame | None:
+    """The corpus as recorded in a version, with the same columns and filters as merge_parsed."""
+    m = load_version_manifest(vid)
+    if m is None:
+        raise KeyError(vid)
+    keys = set(dataset_keys(levels, types))
+    dirs = None if colleges is None else {p.name for c in colleges for p in storage._dirnames_for_college(c)}
+    picked = [(s, e) for s, e in m["sources"].items()
+              if e["key"] in keys and (dirs is None or e["college_dir"] in dirs)]
+    if not picked:
+        return None
+    workers = max(1, min(max_workers or storage.MERGE_WORKERS, len(picked)))
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        frames = list(pool.map(lambda se: _read_block(*se, columns), picked))
+    return concat_frames(frames)
+
+
+def _row_hashes(digest: str) -> Counter:
+    import pyarrow.parquet as pq
+
+    df = pq.read_table(_block_path(digest)).to_pandas()
+    return Counter(pd.util.hash_pandas_object(df.astype(object), index=False).tolist())
+
+
+def diff_versions(a: str, b: str) -> dict:
+    """Files added / removed / changed from version a to b, with row-level counts for changed files."""
+    ma, mb = load_version_manifest(a), load_version_manifest(b)
+    if ma is None or mb is None:
+        raise KeyError(a if ma is None else b)
+    sa, sb = ma["sources"], mb["sources"]
+    added = sorted(set(sb) - set(sa))
+    removed = sorted(set(sa) - set(sb))
+    changed = []
+    for src in sorted(set(sa) & set(sb)):
+        if sa[src]["block"] == sb[src]["block"]:
+            continue
+        ha, hb = _row_hashes(sa[src]["block"]), _row_hashes(sb[src]["block"])
+        changed.append({"path": src, "rows_added": sum((hb - ha).values()), "rows_removed": sum((ha - hb).values())})
+    return {
+        "from": a,
+        "to": b,
+        "added": added,
+        "removed": removed,
+        "changed": changed,
+        "rows_added": sum(sb[s]["rows"] for s in added) + sum(c["rows_added"] for c in changed),
+        "rows_removed": sum(sa[s]["rows"] for s in removed) + sum(c["rows_removed"] for c in changed),
+    }
+
+
+def version_export_frames(vid: str, colleges: list[str] | None = None) -> dict[str, pd.DataFrame]:
+    """qa / ug / grad frames of a version, shaped like the admin export (no date column)."""
+    out = {}
+    for kind, kw in (("qa", {"types": ["qa"]}), ("ug", {"levels": ["本科"]}), ("grad", {"levels": ["研究生"]})):
+        df = load_version(vid, colleges=colleges, **kw)
+        out[kind] = pd.DataFrame() if df is None else df.drop(columns=["date"])
+    return out
+
+
+def export_version(vid: str, out_dir, colleges: list[str] | None = None) -> list[Path]:
+    """Write a version's qa/ug/grad CSVs plus its manifest into out_dir."""
+    out_dir = Path(out_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    written = []
+    for kind, frame in version_export_frames(vid, colleges).items():
+        p = out_dir / f"{vid}_{kind}.csv"
+        frame.to_csv(p, index=False)
+        written.append(p)
+    p = out_dir / f"{vid}_manifest.json"
+    p.write_text(json.dumps(load_version_manifest(vid), ensure_ascii=False, indent=1), encoding="utf-8")
+    written.append(p)
+    return written
+
+
+def preserve_deleted(path) -> dict | None:
+    """Keep the exact bytes of a parsed file that is about to be deleted (content-addressed blob + log entry)."""
+    src = storage.relpath(path)
+    if src is None:
+        return None
+    data = Path(path).read_bytes()
+    blob, _ = storage._put_blob(storage.BASE, data)
+    entry = {
+        "path": src,
+        "blob": blob.relative_to(storage.BASE).as_posix(),
+        "size": len(data),
+        "deleted_at": dt.datetime.now().isoformat(timespec="seconds"),
+    }
+    with _lock, storage._file_lock(versions_dir() / ".lock"):
+        with open(versions_dir() / DELETED_LOG, "a", encoding="utf-8") as f:
+            f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+    return entry
+
+
+def list_deleted() -> list[dict]:
+    p = versions_dir() / DELETED_LOG
+    if not p.exists():
+        return []
+    with open(p, "r", encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def restore_deleted(entry: dict) -> Path:
+    """Write a preserved file back to its original location."""
+    target = storage.BASE / entry["path"]
+    target.parent.mkdir(parents=True, exist_ok=True)
+    target.write_bytes(storage.read_raw_bytes(str(storage.BASE / entry["blob"])))
+    return target
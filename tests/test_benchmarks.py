@@ -0,0 +1,50 @@
+import unittest
+import tempfile
+from pathlib import Path
+
+from benchmarks.corpus import generate_exercises, generate_workbook, as_upload, populate_storage, use_storage_root, parse_size
+from modules.parsing import parse_uploaded_file
+
+
+class TestSyntheticCorpus(unittest.TestCase):
+    def test_generate_exercises_shape(self):
+        df = generate_exercises(200, seed=1)
+        self.assertEqual(len(df), 200)
+        for col in ["题型", "题干", "A", "F", "答案", "解析", "知识点"]:
+            self.assertIn(col, df.columns)
+        self.assertGreater(df["题型"].nunique(), 3)
+        self.assertTrue(generate_exercises(50, seed=1).equals(generate_exercises(50, seed=1)))
+
+    def test_workbook_parses_as_multi_sheet(self):
+        meta, df, _ = parse_uploaded_file(as_upload(generate_workbook(120, seed=2), "bank.xlsx"), "习题库")
+        self.assertGreater(len(meta["sheets"]), 1)
+        self.assertEqual(meta["total"], 120)
+        self.assertIn("选择题", set(df["type"]))
+
+    def test_populate_storage(self):
+        from modules.storage import list_parsed_datasets
+        with tempfile.TemporaryDirectory() as tmp:
+            written = populate_storage(Path(tmp), 60, ["economy", "finance"], files_per_college=2)
+            self.assertEqual(written, 60)
+            with use_storage_root(Path(tmp)):
+                self.assertTrue(list_parsed_datasets("economy"))
+
+    def test_parse_size(self):
+        self.assertEqual(parse_size("100k"), 100_000)
+        self.assertEqual(parse_size("1M"), 1_000_000)
+        self.assertEqual(parse_size("250"), 250)
+        self.assertEqual(parse_size("500k"), 500_000)
+
+    def test_memory_measure_small(self):
+        from benchmarks.corpus import generate_csv
+        from benchmarks.memory import measure, REPO_ROOT
+        with tempfile.TemporaryDirectory() as tmp:
+            csv_path = Path(tmp) / "bank.csv"
+            csv_path.write_bytes(generate_csv(300, 2))
+            res = measure(REPO_ROOT, csv_path)
+        self.assertEqual(res["rows"], 300)
+        self.assertGreaterEqual(res["peak_mb"], res["baseline_mb"])
+
+
+if __name__ == "__main__":
+    unittest.main()
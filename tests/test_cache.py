@@ -0,0 +1,91 @@
+import unittest
+import tempfile
+from io import BytesIO
+from pathlib import Path
+from unittest import mock
+
+import modules.cache as cache
+
+
+class TestExportCache(unittest.TestCase):
+    def setUp(self):
+        self._tmp = tempfile.TemporaryDirectory()
+        self._orig_dir = cache.EXPORT_CACHE_DIR
+        cache.EXPORT_CACHE_DIR = Path(self._tmp.name) / "exports"
+
+    def tearDown(self):
+        cache.EXPORT_CACHE_DIR = self._orig_dir
+        self._tmp.cleanup()
+
+    def test_corpus_version_stable(self):
+        self.assertEqual(cache.corpus_version(["economy", "finance"]), cache.corpus_version(["finance", "economy"]))
+        self.assertNotEqual(cache.corpus_version(["economy"]), cache.corpus_version(["finance"]))
+
+    def test_store_and_load_bundle(self):
+        self.assertIsNone(cache.load_export_bundle("v1"))
+        cache.store_export_bundle("v1", {"qa.csv": b"question,answer\n"}, {"counts": {"qa": 0}})
+        bundle = cache.load_export_bundle("v1")
+        self.assertIsNotNone(bundle)
+        self.assertEqual(bundle["meta"]["counts"]["qa"], 0)
+        self.assertEqual(bundle["files"]["qa.csv"].read_bytes(), b"question,answer\n")
+
+    def test_export_artifact_built_once(self):
+        cache.store_export_bundle("v1", {"qa.parquet": b"frame"})
+        build = mock.Mock(return_value=b"question,answer\n")
+        self.assertEqual(cache.export_artifact("v1", "qa.csv", build), b"question,answer\n")
+        self.assertEqual(cache.export_artifact("v1", "qa.csv", build), b"question,answer\n")
+        self.assertEqual(build.call_count, 1)
+        self.assertEqual(cache.load_export_bundle("v1")["version"], "v1")
+
+    def test_concurrent_artifact_writers(self):
+        from concurrent.futures import ThreadPoolExecutor
+        payloads = [bytes([i]) * 200_000 for i in range(8)]
+        with ThreadPoolExecutor(8) as pool:
+            list(pool.map(lambda p: cache._write_artifact(cache.EXPORT_CACHE_DIR / "v1" / "qa.csv", p), payloads))
+        self.assertIn((cache.EXPORT_CACHE_DIR / "v1" / "qa.csv").read_bytes(), payloads)
+        self.assertEqual([p.name for p in (cache.EXPORT_CACHE_DIR / "v1").iterdir()], ["qa.csv"])
+
+    def test_eviction_keeps_current(self):
+        cache.store_export_bundle("old", {"a.csv": b"x" * 100})
+        cache.store_export_bundle("new", {"a.csv": b"y" * 100})
+        removed = cache.evict_export_cache(max_bytes=150, keep="new")
+        self.assertEqual(removed, ["old"])
+        self.assertIsNone(cache.load_export_bundle("old"))
+        self.assertIsNotNone(cache.load_export_bundle("new"))
+
+
+class TestParseCache(unittest.TestCase):
+    def setUp(self):
+        cache._parse_cache.clear()
+
+    def _upload(self, content: bytes, name: str = "qa.csv"):
+        buf = BytesIO(content)
+        buf.name = name
+        return buf
+
+    def test_parse_runs_once_per_distinct_upload(self):
+        content = b"question,answer\nq1,a1\n"
+        with mock.patch("modules.cache.parse_uploaded_file", wraps=cache.parse_uploaded_file) as spy:
+            meta1, df1, _ = cache.parse_uploaded_file_cached(self._upload(content), "问答对")
+            meta2, df2, _ = cache.parse_uploaded_file_cached(self._upload(content), "问答对")
+            self.assertEqual(spy.call_count, 1)
+            self.assertIs(df1, df2)
+            self.assertTrue(meta2.get("parse_cached"))
+            self.assertFalse(meta1.get("parse_cached"))
+            cache.parse_uploaded_file_cached(self._upload(content), "习题库")
+            cache.parse_uploaded_file_cached(self._upload(b"question,answer\nq2,a2\n"), "问答对")
+            self.assertEqual(spy.call_count, 3)
+
+    def test_lru_memory_bound(self):
+        c = cache.ParseCache(max_bytes=100)
+        c.put("a", 1, 60)
+        c.put("b", 2, 60)
+        self.assertIsNone(c.get("a"))
+        self.assertEqual(c.get("b"), 2)
+        c.put("huge", 3, 1000)
+        self.assertIsNone(c.get("huge"))
+        self.assertLessEqual(c.nbytes, 100)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,53 @@
+import unittest
+import tempfile
+from pathlib import Path
+
+import modules.storage as storage
+from benchmarks.corpus import use_storage_root
+from modules.cli import main, _collect_files, _ingest_one
+
+
+class TestCliIngest(unittest.TestCase):
+    def setUp(self):
+        self._tmp = tempfile.TemporaryDirectory()
+        self.root = Path(self._tmp.name)
+        (self.root / "good.csv").write_text("question,answer\n问题一,答案一\n问题二,答案二\n", encoding="utf-8")
+        (self.root / "bad.csv").write_text("stem,answer\n题干,答案\n", encoding="utf-8")
+        (self.root / "notes.txt").write_text("skip", encoding="utf-8")
+
+    def tearDown(self):
+        self._tmp.cleanup()
+
+    def test_collect_files_filters_suffix(self):
+        files = _collect_files([str(self.root)])
+        self.assertEqual(sorted(f.name for f in files), ["bad.csv", "good.csv"])
+
+    def test_dry_run_does_not_save(self):
+        r = _ingest_one(str(self.root / "good.csv"), "economy", "问答对", None, None, 0.05, True, False)
+        self.assertEqual(r["status"], "dry-run")
+        self.assertEqual(r["rows"], 2)
+        self.assertEqual(r["saved"], 0)
+
+    def test_error_ratio_gate(self):
+        r = _ingest_one(str(self.root / "bad.csv"), "economy", "习题库", None, "本科", 0.05, True, False)
+        self.assertEqual(r["status"], "gated")
+
+    def test_same_base_name_in_different_dirs_kept(self):
+        for sub, rows in (("a", "qa1,a1\n"), ("b", "qb1,b1\nqb2,b2\n")):
+            (self.root / sub).mkdir()
+            (self.root / sub / "ch1.csv").write_text("question,answer\n" + rows, encoding="utf-8")
+        # 同一文件重复给出只导入一次
+        self.assertEqual(len(_collect_files([str(self.root / "a"), str(self.root / "a" / "ch1.csv")])), 1)
+        with tempfile.TemporaryDirectory() as tmp, use_storage_root(Path(tmp)):
+            code = main(["ingest", "--college", "economy", "--type", "问答对", "--workers", "2",
+                         str(self.root / "a"), str(self.root / "b")])
+            self.assertEqual(code, 0)
+            self.assertEqual(sorted(storage.merge_all_parsed()["question"]), ["qa1", "qb1", "qb2"])
+
+    def test_main_exit_code(self):
+        code = main(["ingest", "--college", "economy", "--type", "问答对", "--dry-run", "--workers", "1", str(self.root / "good.csv")])
+        self.assertEqual(code, 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
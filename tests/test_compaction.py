@@ -0,0 +1,119 @@
+import unittest
+import tempfile
+from pathlib import Path
+
+import pandas as pd
+
+import modules.compaction as compaction
+import modules.storage as storage
+from benchmarks.corpus import use_storage_root
+
+
+def _rows(df: pd.DataFrame) -> list:
+    return sorted(df.astype(object).fillna("").astype(str).itertuples(index=False, name=None))
+
+
+class TestCompaction(unittest.TestCase):
+    def setUp(self):
+        self._tmp = tempfile.TemporaryDirectory()
+        self._root = use_storage_root(Path(self._tmp.name))
+        self._root.__enter__()
+        self._today = storage._today
+        for i in range(3):
+            storage._today = lambda i=i: f"2025-01-0{i + 1}"
+            ex = pd.DataFrame({"type": ["选择题", "判断题"], "stem": [f"s{i}", f"j{i}"], "answer": ["A", "对"]})
+            storage.save_split_dataset(ex, {"filename": f"u{i}.xlsx", "type": "习题库", "level": "本科"}, "finance")
+            qa = pd.DataFrame({"question": [f"q{i}"], "answer": [f"a{i}"]})
+            storage.save_parsed_dataset(qa, {"filename": f"qa{i}.csv", "type": "问答对"}, "finance")
+        storage._today = self._today
+
+    def tearDown(self):
+        storage._today = self._today
+        self._root.__exit__(None, None, None)
+        self._tmp.cleanup()
+
+    def test_compaction_keeps_rows_and_provenance(self):
+        before, _ = storage.merge_parsed()
+        self.assertEqual(compaction.compact_parsed(min_files=4), [])
+        results = compaction.compact_parsed(min_files=3)
+        self.assertEqual([(r["files"], r["rows"]) for r in results], [(3, 3)] * 3)
+        items = storage.list_all_parsed()
+        self.assertEqual(len(items), 3)
+        self.assertTrue(all(it["path"].endswith(".parquet") for it in items))
+        after, skipped = storage.merge_parsed()
+        self.assertEqual(skipped, [])
+        self.assertEqual(list(after.columns), list(before.columns))
+        self.assertEqual(_rows(after), _rows(before))
+        # 溯源列按需投影；日期过滤对合并文件按行生效
+        df, _ = storage.merge_parsed(columns=["stem", storage.PROVENANCE_SOURCE, "date"], exercise_types=["判断题"],
+                                     dates=["2025-01-02"])
+        self.assertEqual(df["stem"].tolist(), ["j1"])
+        self.assertTrue(storage.plain_name(df[storage.PROVENANCE_SOURCE].iloc[0]).endswith("date=2025-01-02/u1_判断_parsed_ex_ug.csv"))
+
+    def test_history_types_from_partitions(self):
+        compaction.compact_parsed(min_files=3)
+        records = storage.list_history("finance")
+        compacted = [r for r in records if r["file"].endswith(".parquet")]
+        self.assertEqual(sorted((r["type"], r["level"]) for r in compacted),
+                         [("ex", "本科"), ("ex", "本科"), ("qa", None)])
+
+    def test_new_uploads_fold_into_existing_file(self):
+        compaction.compact_parsed(min_files=2)
+        storage._today = lambda: "2025-02-01"
+        storage.save_parsed_dataset(pd.DataFrame({"question": ["q9"], "answer": ["a9"]}),
+                                    {"filename": "qa9.csv", "type": "问答对"}, "finance")
+        self.assertEqual(len(storage.merge_parsed(types=["qa"])[0]), 4)
+        results = compaction.compact_parsed(min_files=1)
+        self.assertEqual([(r["files"], r["rows"]) for r in results], [(1, 4)])
+        part = storage.load_compaction_manifest(storage._parsed_root())["parts"][results[0]["partition"]]
+        self.assertEqual((len(part["sources"]), part["dates"][-1]), (4, "2025-02-01"))
+        self.assertEqual(len(list(Path(results[0]["file"]).parent.glob("*.parquet"))), 1)
+
+    def test_readers_listed_before_compaction_retry(self):
+        stale = storage.list_all_parsed()
+        orig = storage.list_all_parsed
+        calls = []
+
+        def _list(*args):
+            calls.append(1)
+            # 第一次返回合并前的文件列表，模拟读者与合并任务并发
+            return stale if len(calls) == 1 else orig(*args)
+
+        compaction.compact_parsed(min_files=2)
+        storage.list_all_parsed = _list
+        try:
+            df, skipped = storage.merge_parsed()
+        finally:
+            storage.list_all_parsed = orig
+        self.assertEqual((len(df), skipped, len(calls)), (9, [], 2))
+
+    def test_resaved_source_replaces_compacted_rows(self):
+        compaction.compact_parsed(min_files=3)
+        # 同日同名重新上传：新文件可见，合并文件中的旧行不再读取
+        storage._today = lambda: "2025-01-02"
+        storage.save_parsed_dataset(pd.DataFrame({"question": ["q1-new", "q1-extra"], "answer": ["a", "b"]}),
+                                    {"filename": "qa1.csv", "type": "问答对"}, "finance")
+        df, skipped = storage.merge_parsed(types=["qa"])
+        self.assertEqual(skipped, [])
+        self.assertEqual(sorted(df["question"]), ["q0", "q1-extra", "q1-new", "q2"])
+        m = storage.load_compaction_manifest(storage._parsed_root(False))
+        entry = [e for k, e in m["parts"].items() if "问答对" in k][0]
+        self.assertEqual(([storage.plain_name(Path(s["path"]).name) for s in entry["sources"]], entry["rows"]),
+                         (["qa0_parsed_qa.csv", "qa2_parsed_qa.csv"], 2))
+        self.assertEqual(len(storage.list_all_parsed(types=["qa"])), 2)
+        # 再次合并后新行进入合并文件
+        compaction.compact_parsed(min_files=1)
+        self.assertEqual(sorted(storage.merge_parsed(types=["qa"])[0]["question"]), ["q0", "q1-extra", "q1-new", "q2"])
+
+    def test_deleted_compacted_file(self):
+        results = compaction.compact_parsed(min_files=2)
+        self.assertTrue(storage.delete_path(results[0]["file"]))
+        self.assertEqual(len(storage.list_all_parsed()), 2)
+        storage.save_parsed_dataset(pd.DataFrame({"question": ["q9"], "answer": ["a9"]}),
+                                    {"filename": "qa9.csv", "type": "问答对"}, "finance")
+        again = compaction.compact_parsed(min_files=1)
+        self.assertEqual([(r["files"], r["rows"], r["skipped"]) for r in again], [(1, 1, [])])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,48 @@
+import unittest
+import tempfile
+from pathlib import Path
+
+import pandas as pd
+
+from modules.dtypes import apply_dtype_policy, concat_frames, text_dtype
+
+
+class TestDtypePolicy(unittest.TestCase):
+    def test_policy_converts_text_and_categories(self):
+        df = pd.DataFrame({
+            "type": ["选择题", "判断题", "选择题"],
+            "stem": ["a", "b", None],
+            "quality_score": [100, 80, 60],
+        }).astype({"stem": object})
+        out = apply_dtype_policy(df)
+        self.assertIsInstance(out["type"].dtype, pd.CategoricalDtype)
+        self.assertEqual(out["stem"].dtype, text_dtype())
+        self.assertTrue(pd.isna(out["stem"].iloc[2]))
+        self.assertTrue(pd.api.types.is_integer_dtype(out["quality_score"]))
+        self.assertEqual(out["stem"].tolist()[:2], ["a", "b"])
+
+    def test_concat_keeps_categories(self):
+        a = apply_dtype_policy(pd.DataFrame({"type": ["选择题"], "college": ["economy"], "stem": ["x"]}))
+        b = apply_dtype_policy(pd.DataFrame({"type": ["判断题"], "college": ["finance"], "stem": ["y"]}))
+        out = concat_frames([a, b])
+        self.assertIsInstance(out["type"].dtype, pd.CategoricalDtype)
+        self.assertIsInstance(out["college"].dtype, pd.CategoricalDtype)
+        self.assertEqual(out["type"].tolist(), ["选择题", "判断题"])
+        self.assertEqual(out["college"].value_counts().to_dict(), {"economy": 1, "finance": 1})
+
+    def test_concat_empty(self):
+        self.assertTrue(concat_frames([]).empty)
+
+    def test_load_csv_applies_policy(self):
+        import modules.storage as storage
+        with tempfile.TemporaryDirectory() as tmp:
+            path = Path(tmp) / "x.csv"
+            pd.DataFrame({"type": ["选择题", "判断题"], "stem": ["a", "b"], "level": ["本科", "本科"]}).to_csv(path, index=False)
+            df = storage.load_csv(path)
+        self.assertIsInstance(df["type"].dtype, pd.CategoricalDtype)
+        self.assertIsInstance(df["level"].dtype, pd.CategoricalDtype)
+        self.assertEqual(df["stem"].dtype, text_dtype())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,59 @@
+import unittest
+import tempfile
+from pathlib import Path
+
+import pandas as pd
+
+import modules.knowledge as knowledge
+import modules.search as search
+import modules.storage as storage
+from benchmarks.corpus import use_storage_root
+
+
+class TestSplitPoints(unittest.TestCase):
+    def test_split_and_normalize(self):
+        s = knowledge.split_points(pd.Series(["供给；需求、 弹性,供给", None, "nan", "ＧＤＰ　 核算。", "", "货币\n银行"]))
+        self.assertEqual(s.index.tolist(), [0, 0, 0, 3, 5, 5])
+        self.assertEqual(s.tolist(), ["供给", "需求", "弹性", "GDP 核算", "货币", "银行"])
+
+
+@unittest.skipUnless(search.search_available(), "SQLite 不支持 FTS5 trigram")
+class TestKnowledgeCoverage(unittest.TestCase):
+    def setUp(self):
+        self._tmp = tempfile.TemporaryDirectory()
+        self._root = use_storage_root(Path(self._tmp.name))
+        self._root.__enter__()
+        ex = pd.DataFrame({"type": ["选择题", "判断题", "选择题"],
+                           "stem": ["需求价格弹性的定义是", "货币乘数与法定准备金率", "边际效用递减"],
+                           "answer": ["A", "对", "B"], "knowledge": ["弹性；需求", "货币银行", None]})
+        storage.save_split_dataset(ex, {"filename": "ug.xlsx", "type": "习题库", "level": "本科"}, "economy")
+        grad = pd.DataFrame({"type": ["简答题"], "stem": ["交叉弹性"], "answer": ["略"], "knowledge": ["弹性"]})
+        storage.save_split_dataset(grad, {"filename": "grad.xlsx", "type": "习题库", "level": "研究生"}, "finance")
+
+    def tearDown(self):
+        self._root.__exit__(None, None, None)
+        self._tmp.cleanup()
+
+    def test_coverage_from_index(self):
+        totals = knowledge.point_totals()
+        self.assertEqual(totals.iloc[0].to_dict(), {"point": "弹性", "items": 2, "colleges": 2})
+        self.assertEqual(set(totals["point"]), {"弹性", "需求", "货币银行"})
+        cov = knowledge.coverage(levels=["研究生"])
+        self.assertEqual(cov[["point", "level", "items"]].values.tolist(), [["弹性", "研究生", 1]])
+        ratio = knowledge.labelled_ratio(colleges=["economy"])
+        self.assertEqual(ratio[["items", "labelled", "points"]].values.tolist(), [[3, 2, 3]])
+        self.assertAlmostEqual(ratio["labelled_pct"].iloc[0], 66.67)
+
+    def test_items_for_point_and_incremental_delete(self):
+        rows, total = knowledge.items_for_point(" 弹性 ")
+        self.assertEqual(total, 2)
+        self.assertEqual(sorted(r["stem"] for r in rows), ["交叉弹性", "需求价格弹性的定义是"])
+        self.assertEqual(knowledge.items_for_point("弹性", colleges=["finance"])[1], 1)
+        path = [it["path"] for it in storage.list_all_parsed() if "finance" in it["path"]][0]
+        self.assertTrue(storage.delete_path(path))
+        self.assertEqual(knowledge.items_for_point("弹性")[1], 1)
+        self.assertEqual(knowledge.items_for_point("nan"), ([], 0))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,58 @@
+import unittest
+import tempfile
+import datetime as dt
+from pathlib import Path
+
+import modules.logins as logins
+
+
+class TestLoginStore(unittest.TestCase):
+    def setUp(self):
+        self._tmp = tempfile.TemporaryDirectory()
+        self._orig = (logins.LOGIN_DIR, logins.LOGIN_DB)
+        logins.LOGIN_DIR = Path(self._tmp.name)
+        logins.LOGIN_DB = logins.LOGIN_DIR / "logins.db"
+
+    def tearDown(self):
+        logins.LOGIN_DIR, logins.LOGIN_DB = self._orig
+        self._tmp.cleanup()
+
+    def test_rollups_and_paging(self):
+        base = dt.datetime(2025, 12, 1, 9, 0)  # 周一
+        for i, (day, user) in enumerate([(0, "u1"), (0, "u1"), (0, "u2"), (1, "u1"), (7, "u3")]):
+            logins.record_login(user, "economy", base + dt.timedelta(days=day, minutes=i))
+        logins.record_login("x", "finance", base)
+        daily = logins.active_users("day", "economy")
+        self.assertEqual([(r["bucket"], r["users"], r["events"]) for r in daily],
+                         [("2025-12-01", 2, 3), ("2025-12-02", 1, 1), ("2025-12-08", 1, 1)])
+        weekly = logins.active_users("week", "economy")
+        self.assertEqual([(r["bucket"], r["users"]) for r in weekly], [("2025-W49", 2), ("2025-W50", 1)])
+        self.assertEqual(logins.active_users("day")[0]["users"], 3)
+
+        rows, total = logins.query_logins("economy", page=1, page_size=2)
+        self.assertEqual(total, 5)
+        self.assertEqual([r["username"] for r in rows], ["u3", "u1"])
+        rows, _ = logins.query_logins("economy", page=3, page_size=2)
+        self.assertEqual(len(rows), 1)
+        self.assertEqual(logins.query_logins(username="x")[1], 1)
+
+    def test_record_failure_logged(self):
+        logins.LOGIN_DB.mkdir()  # 数据库路径被目录占用，写入必然失败
+        with self.assertLogs(logins.logger, level="ERROR") as cm:
+            logins.record_login("u1", "economy")
+        self.assertIn("u1@economy", cm.output[0])
+
+    def test_legacy_logs_imported_once(self):
+        d = logins.LOGIN_DIR / "mgmt"
+        d.mkdir()
+        (d / "2025-12-04.log").write_text("2025-12-04T10:42:36.413105\tuser_mgmt\n2025-12-04T11:00:00\tuser_mgmt\n", encoding="utf-8")
+        self.assertEqual(logins.query_logins("mgmt")[1], 2)
+        logins._initialized.clear()
+        self.assertEqual(logins.query_logins("mgmt")[1], 2)
+        days = logins.login_days("mgmt")
+        self.assertEqual(days[0]["date"], "2025-12-04")
+        self.assertEqual(len(days[0]["events"]), 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
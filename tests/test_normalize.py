@@ -0,0 +1,72 @@
+import unittest
+import tempfile
+import unicodedata
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+import modules.storage as storage
+from benchmarks.corpus import as_upload, generate_csv, use_storage_root
+from modules.normalize import NFKC_STABLE_RANGES, add_shadow_columns, drop_shadow_columns, normalize_text, normalized, shadow_name
+from modules.parsing import _clean_answers, parse_uploaded_file
+from modules.quality import exercise_quality_columns
+
+
+class TestNormalizeText(unittest.TestCase):
+    def test_normalize_text(self):
+        values = pd.Series(["Ａ．ｘ　y ", "  a \r\n \n b  c ", "R²", "a\u200bb\ufeff", None, np.nan, " NaN ", "None",
+                            "（ＧＤＰ）；需求", "中文，“引号”", 5])
+        self.assertEqual(normalize_text(values).tolist(),
+                         ["A.x y", "a\nb c", "R2", "ab", "", "", "", "", "(GDP);需求", "中文,“引号”", "5"])
+        self.assertEqual(normalize_text(pd.Series([], dtype=object)).tolist(), [])
+
+    def test_matches_unicodedata_nfkc(self):
+        texts = ["①②", "ﬁ", "é", "ｶﾞ", "가", "𝐀𝐁", "全角ＡＢＣ１２３！", "…", "x\x1fy", " a　"]
+        expected = [" ".join(unicodedata.normalize("NFKC", t).replace("\x1f", " ").split()) for t in texts]
+        self.assertEqual(normalize_text(pd.Series(texts)).tolist(), expected)
+
+    def test_stable_ranges_are_nfkc_stable(self):
+        for lo, hi in NFKC_STABLE_RANGES:
+            for cp in range(lo, hi + 1):
+                c = chr(cp)
+                self.assertEqual(unicodedata.normalize("NFKC", c), c, hex(cp))
+                self.assertEqual(unicodedata.combining(c), 0, hex(cp))
+
+    def test_shadow_columns(self):
+        df = pd.DataFrame({"stem": ["ＡＢ"], "knowledge": [None]})
+        out = add_shadow_columns(df)
+        self.assertEqual(list(out.columns), ["stem", "knowledge", shadow_name("stem"), shadow_name("knowledge")])
+        self.assertEqual(normalized(out, "stem").name, shadow_name("stem"))
+        self.assertEqual(normalized(df, "stem").tolist(), ["AB"])
+        self.assertEqual(normalized(df, "answer").tolist(), [""])
+        self.assertEqual(list(drop_shadow_columns(out).columns), ["stem", "knowledge"])
+
+
+class TestNormalizationStage(unittest.TestCase):
+    def test_clean_answers_vectorized(self):
+        answers = pd.Series(["答案：A. 需求", "b", "Answer: It is 5.", np.nan, "C: 选项", "ABC"])
+        types = pd.Series(["选择题", "选择题", "简答题", "选择题", "填空题", "选择题"])
+        self.assertEqual(_clean_answers(answers, types).tolist(), ["A", "B", "It is 5.", "", "C: 选项", "ABC"])
+
+    def test_parse_adds_shadows_and_quality_reuses_them(self):
+        meta, df, _ = parse_uploaded_file(as_upload(generate_csv(200, 3), "bank.csv"), "习题库")
+        self.assertIn(shadow_name("stem"), df.columns)
+        self.assertFalse(any(c.startswith("_norm_") for c in meta["columns"]))
+        # 知识点为空（NaN）的行标记 KN_EMPTY
+        empty = df["knowledge"].isna()
+        self.assertTrue(empty.any())
+        self.assertTrue(df.loc[empty, "quality_flags"].str.contains("KN_EMPTY").all())
+        pd.testing.assert_frame_equal(exercise_quality_columns(df), exercise_quality_columns(drop_shadow_columns(df)))
+
+    def test_shadow_columns_are_not_saved(self):
+        _, df, _ = parse_uploaded_file(as_upload(generate_csv(50, 4), "bank.csv"), "习题库")
+        with tempfile.TemporaryDirectory() as tmp, use_storage_root(Path(tmp)):
+            storage.save_split_dataset(df, {"filename": "bank.csv", "type": "习题库", "level": "本科"}, "economy")
+            for it in storage.list_all_parsed():
+                saved = storage.load_csv(it["path"])
+                self.assertFalse([c for c in saved.columns if c.startswith("_norm_")])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,45 @@
+import unittest
+import tempfile
+from pathlib import Path
+
+import modules.profiling as profiling
+from modules.profiling import RerunProfile, list_slowest_reruns, branch_summary, load_profile_report, profiling_enabled
+
+
+def _busy(n):
+    return sum(i * i for i in range(n))
+
+
+class TestRerunProfiling(unittest.TestCase):
+    def setUp(self):
+        self._tmp = tempfile.TemporaryDirectory()
+        self._orig = (profiling.PROFILE_DIR, profiling.MAX_REPORTS)
+        profiling.PROFILE_DIR = Path(self._tmp.name)
+
+    def tearDown(self):
+        profiling.PROFILE_DIR, profiling.MAX_REPORTS = self._orig
+        self._tmp.cleanup()
+
+    def test_finish_writes_report_and_index(self):
+        prof = RerunProfile("📊 汇总统计", "admin")
+        _busy(20000)
+        entry = prof.finish()
+        report = load_profile_report(entry["report"])
+        self.assertEqual(report["branch"], "📊 汇总统计")
+        self.assertTrue(any("_busy" in r["function"] for r in report["top_cumulative"]))
+        self.assertEqual(list_slowest_reruns()[0]["report"], entry["report"])
+        self.assertEqual(branch_summary()[0]["reruns"], 1)
+
+    def test_reports_rotate(self):
+        profiling.MAX_REPORTS = 2
+        for _ in range(4):
+            RerunProfile("x").finish()
+        self.assertEqual(len(list(profiling.PROFILE_DIR.glob("*.json"))), 2)
+        self.assertEqual(len(profiling.load_rerun_index()), 4)
+
+    def test_profiling_enabled_by_toggle(self):
+        self.assertTrue(profiling_enabled(True))
+
+
+if __name__ == "__main__":
+    unittest.main()
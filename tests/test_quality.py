@@ -1,6 +1,6 @@
 import unittest
 import pandas as pd
-from modules.quality import assess_qa, assess_exercises, summarize_quality
+from modules.quality import assess_qa, assess_exercises, summarize_quality, error_cell_mask, exercise_quality_columns
 
 
 class TestQuality(unittest.TestCase):
@@ -23,6 +23,35 @@ class TestQuality(unittest.TestCase):
         flags = out["quality_flags"].iloc[0]
         self.assertIn("ANS_NOT_IN_OPTS", flags)
 
+    def test_quality_columns_only(self):
+        df = pd.DataFrame({"type": ["判断题"], "stem": ["s"], "answer": ["对"], "knowledge": ["k"]}, index=[7])
+        cols = exercise_quality_columns(df)
+        self.assertListEqual(list(cols.columns), ["quality_score", "quality_flags"])
+        self.assertListEqual(list(cols.index), [7])
+        out = assess_exercises(df)
+        self.assertNotIn("quality_score", df.columns)
+        self.assertEqual(int(out.loc[7, "quality_score"]), 100)
+
+    def test_error_cell_mask(self):
+        df = pd.DataFrame({
+            "type": ["选择题", "选择题", "选择题"],
+            "stem": ["", "题干", "题干"],
+            "options": ["A: 1\nB: 2", "A: 1\nB: 2", "A: 1\nB: 2"],
+            "answer": ["A", "C", "A"],
+            "knowledge": ["k", "k", ""],
+        }, index=[10, 11, 12])
+        out = assess_exercises(df)
+        view = out[["stem", "answer", "knowledge"]]
+        mask = error_cell_mask(view, out["quality_flags"])
+        self.assertEqual(mask.shape, view.shape)
+        self.assertListEqual(list(mask.index), [10, 11, 12])
+        self.assertTrue(mask.loc[10, "stem"])
+        self.assertTrue(mask.loc[11, "answer"])
+        self.assertTrue(mask.loc[12, "knowledge"])
+        self.assertEqual(int(mask.to_numpy().sum()), 3)
+        # 目标列不在视图中时不标红
+        self.assertFalse(error_cell_mask(pd.DataFrame({"x": [1]}), ["Error:STEM_EMPTY:题干为空"]).to_numpy().any())
+
 
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,87 @@
+import unittest
+import tempfile
+from pathlib import Path
+
+import pandas as pd
+
+import modules.sampling as sampling
+from benchmarks.corpus import populate_storage, use_storage_root
+from modules.storage import iter_csv_chunks
+
+
+class TestAllocate(unittest.TestCase):
+    def test_proportional_with_floor(self):
+        alloc = sampling.allocate({"a": 900, "b": 90, "c": 10}, 20)
+        self.assertEqual(sum(alloc.values()), 20)
+        self.assertGreaterEqual(alloc["c"], 1)
+        self.assertGreater(alloc["a"], alloc["b"])
+
+    def test_small_strata_capped(self):
+        alloc = sampling.allocate({"a": 2, "b": 3}, 20)
+        self.assertEqual(alloc, {"a": 2, "b": 3})
+
+
+class TestSampleFrame(unittest.TestCase):
+    def test_seeded_and_stratified(self):
+        df = pd.DataFrame({"type": ["选择题"] * 95 + ["判断题"] * 5, "stem": [f"s{i}" for i in range(100)]})
+        a = sampling.sample_frame(df, 20, seed=3, by=["type"])
+        b = sampling.sample_frame(df, 20, seed=3, by=["type"])
+        c = sampling.sample_frame(df, 20, seed=4, by=["type"])
+        self.assertEqual(len(a), 20)
+        self.assertListEqual(a["stem"].tolist(), b["stem"].tolist())
+        self.assertNotEqual(a["stem"].tolist(), c["stem"].tolist())
+        self.assertIn("判断题", set(a["type"]))
+
+
+class TestCorpusSample(unittest.TestCase):
+    def setUp(self):
+        self._tmp = tempfile.TemporaryDirectory()
+        self.root = Path(self._tmp.name)
+        populate_storage(self.root / "storage", 600, colleges=["c1", "c2"], files_per_college=3, seed=1)
+        self._orig_dir = sampling.SAMPLE_DIR
+        self._orig_chunk = sampling.SAMPLE_CHUNK_ROWS
+        sampling.SAMPLE_DIR = self.root / "samples"
+        # 小块读取，覆盖跨块的蓄水池合并
+        sampling.SAMPLE_CHUNK_ROWS = 37
+
+    def tearDown(self):
+        sampling.SAMPLE_DIR = self._orig_dir
+        sampling.SAMPLE_CHUNK_ROWS = self._orig_chunk
+        self._tmp.cleanup()
+
+    def test_stable_id_and_rows(self):
+        with use_storage_root(self.root / "storage"):
+            sid1, rows1 = sampling.draw_corpus_sample(["c1", "c2"], 20, seed=7)
+            sampling.SAMPLE_DIR = self.root / "samples2"
+            sid2, rows2 = sampling.draw_corpus_sample(["c2", "c1"], 20, seed=7)
+            sid3, _ = sampling.draw_corpus_sample(["c1", "c2"], 20, seed=8)
+        self.assertEqual(sid1, sid2)
+        self.assertNotEqual(sid1, sid3)
+        self.assertEqual(len(rows1), 20)
+        pd.testing.assert_frame_equal(rows1, rows2)
+        self.assertEqual(set(rows1["_college"]), {"c1", "c2"})
+        self.assertTrue({"_source", "_row", "_type", "_level"}.issubset(rows1.columns))
+
+    def test_reload_and_flag_strata(self):
+        with use_storage_root(self.root / "storage"):
+            sid, rows = sampling.draw_corpus_sample(["c1"], 10, seed=1, strata=("type", "flag"))
+        meta, again = sampling.load_sample(sid)
+        self.assertEqual(meta["id"], sid)
+        self.assertEqual(meta["scanned"], 300)
+        pd.testing.assert_frame_equal(rows, again)
+        self.assertTrue(set(rows["_flag"]).issubset({"Error", "Warn", "OK"}))
+        self.assertIsNone(sampling.load_sample("missing"))
+
+
+class TestIterCsvChunks(unittest.TestCase):
+    def test_gb18030_fallback_yields_all_rows(self):
+        with tempfile.TemporaryDirectory() as d:
+            p = Path(d) / "x_parsed_qa.csv"
+            pd.DataFrame({"question": [f"问题{i}" for i in range(25)], "answer": ["答"] * 25}).to_csv(p, index=False, encoding="gb18030")
+            chunks = list(iter_csv_chunks(str(p), chunksize=10))
+        self.assertEqual(sum(len(c) for c in chunks), 25)
+        self.assertEqual(chunks[-1]["question"].iloc[-1], "问题24")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,91 @@
+import unittest
+import tempfile
+from pathlib import Path
+
+import pandas as pd
+
+import modules.compaction as compaction
+import modules.search as search
+import modules.storage as storage
+from benchmarks.corpus import use_storage_root
+
+
+@unittest.skipUnless(search.search_available(), "SQLite 不支持 FTS5 trigram")
+class TestSearchIndex(unittest.TestCase):
+    def setUp(self):
+        self._tmp = tempfile.TemporaryDirectory()
+        self._root = use_storage_root(Path(self._tmp.name))
+        self._root.__enter__()
+        ex = pd.DataFrame({"type": ["选择题", "判断题", "选择题"],
+                           "stem": ["需求价格弹性的定义是", "货币乘数与法定准备金率", "边际效用递减"],
+                           "answer": ["A", "对", "B"], "knowledge": ["弹性", "货币银行", "消费者理论"]})
+        storage.save_split_dataset(ex, {"filename": "ug.xlsx", "type": "习题库", "level": "本科"}, "economy")
+        qa = pd.DataFrame({"question": ["什么是价格弹性？", "GDP 如何核算"], "answer": ["需求对价格变化的敏感度", "支出法"]})
+        storage.save_parsed_dataset(qa, {"filename": "qa.csv", "type": "问答对"}, "finance")
+
+    def tearDown(self):
+        self._root.__exit__(None, None, None)
+        self._tmp.cleanup()
+
+    def _stems(self, query: str, **kw) -> list:
+        rows, _ = search.search(query, **kw)
+        return sorted(r["stem"] or r["question"] for r in rows)
+
+    def test_saved_files_are_searchable(self):
+        self.assertEqual(search.index_stats(), {"items": 5, "files": 3})
+        # 三字及以上走 trigram，二字 / 单字走二元组索引，多个词同时包含
+        self.assertEqual(self._stems("价格弹性"), ["什么是价格弹性？", "需求价格弹性的定义是"])
+        self.assertEqual(self._stems("弹性"), ["什么是价格弹性？", "需求价格弹性的定义是"])
+        self.assertEqual(self._stems("率"), ["货币乘数与法定准备金率"])
+        self.assertEqual(self._stems("货币 准备金"), ["货币乘数与法定准备金率"])
+        self.assertEqual(self._stems("gdp"), ["GDP 如何核算"])
+        self.assertEqual(self._stems("弹性", colleges=["economy"]), ["需求价格弹性的定义是"])
+        self.assertEqual(self._stems("弹性", exercise_types=["问答对"]), ["什么是价格弹性？"])
+        row = search.search("边际效用")[0][0]
+        self.assertEqual((row["exercise_type"], row["level"], row["row"]), ("选择题", "本科", 1))
+        self.assertTrue(row["file"].endswith("_parsed_ex_ug.csv"))
+
+    def test_paging(self):
+        rows, total = search.search("的 是", page_size=1)
+        self.assertEqual((len(rows), total), (1, 2))
+        first, total = search.search("弹性", page=1, page_size=1)
+        second, _ = search.search("弹性", page=2, page_size=1)
+        self.assertEqual(total, 2)
+        self.assertNotEqual(first[0]["id"], second[0]["id"])
+        self.assertEqual(search.search("弹性", page=3, page_size=1), ([], 2))
+
+    def test_save_and_delete_update_incrementally(self):
+        path = [it["path"] for it in storage.list_all_parsed(types=["qa"])][0]
+        self.assertTrue(storage.delete_path(path))
+        self.assertEqual(self._stems("弹性"), ["需求价格弹性的定义是"])
+        storage.save_parsed_dataset(pd.DataFrame({"question": ["交叉弹性"], "answer": ["x"]}),
+                                    {"filename": "qa.csv", "type": "问答对"}, "finance")
+        self.assertEqual(self._stems("弹性"), ["交叉弹性", "需求价格弹性的定义是"])
+        self.assertEqual(search.sync_index()["files"], 0)
+
+    def test_sync_follows_rewritten_files(self):
+        compaction.compact_parsed(min_files=1)
+        res = search.sync_index()
+        self.assertEqual((res["files"], res["indexed"], res["removed"]), (3, 5, 5))
+        self.assertEqual(self._stems("弹性"), ["什么是价格弹性？", "需求价格弹性的定义是"])
+        self.assertEqual(search.sync_index(rebuild=True)["indexed"], 5)
+        self.assertEqual(search.index_stats()["items"], 5)
+
+    def test_schema_upgrade_clears_all_tables(self):
+        import sqlite3
+        db = search.search_db()
+        with sqlite3.connect(db) as conn:
+            conn.execute("PRAGMA user_version=1")
+        search._initialized.clear()
+        with search._connect() as conn:
+            counts = [conn.execute(f"SELECT count(*) FROM {t}").fetchone()[0]
+                      for t in ("sources", "items", "items_fts", "items_bigram", "item_knowledge")]
+        self.assertEqual(counts, [0, 0, 0, 0, 0])
+        # 重新同步后不残留旧行，也不重复
+        self.assertEqual(search.sync_index()["indexed"], 5)
+        self.assertEqual(search.index_stats(), {"items": 5, "files": 3})
+        self.assertEqual(self._stems("弹性"), ["什么是价格弹性？", "需求价格弹性的定义是"])
+
+
+if __name__ == "__main__":
+    unittest.main()
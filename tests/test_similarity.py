@@ -0,0 +1,92 @@
+import unittest
+import tempfile
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+import modules.similarity as similarity
+import modules.storage as storage
+from benchmarks.corpus import use_storage_root
+
+
+@unittest.skipUnless(similarity.similarity_available(), "未安装 scipy")
+class TestSimilarity(unittest.TestCase):
+    def setUp(self):
+        self._tmp = tempfile.TemporaryDirectory()
+        self._root = use_storage_root(Path(self._tmp.name))
+        self._root.__enter__()
+        ex = pd.DataFrame({"type": ["选择题", "选择题", "判断题"],
+                           "stem": ["需求价格弹性大于1时降价会增加总收益", "货币乘数的决定因素有哪些", "边际效用递减规律"],
+                           "answer": ["A", "B", "对"], "knowledge": ["需求价格弹性", "货币乘数", "边际效用"]})
+        storage.save_split_dataset(ex, {"filename": "ug.xlsx", "type": "习题库", "level": "本科"}, "economy")
+        qa = pd.DataFrame({"question": ["需求价格弹性大于1时，降价会如何影响总收益？"], "answer": ["总收益增加"]})
+        storage.save_parsed_dataset(qa, {"filename": "qa.csv", "type": "问答对"}, "finance")
+
+    def tearDown(self):
+        self._root.__exit__(None, None, None)
+        self._tmp.cleanup()
+
+    def test_vectorize_counts_char_ngrams(self):
+        x = similarity.vectorize(["abab", "", None, "a b"])
+        # abab: ab ×2、ba、aba、bab；空白被去除后 "a b" 与 "ab" 相同
+        self.assertEqual(x.shape, (4, similarity.N_FEATURES))
+        self.assertEqual(x[0].sum(), 5)
+        self.assertEqual((x[1].nnz, x[2].nnz), (0, 0))
+        self.assertEqual(x[3].nnz, 1)
+        self.assertIn(x[3].indices[0], x[0].indices)
+
+    def test_neighbours_across_colleges(self):
+        hits = similarity.similar_items("需求价格弹性与总收益", k=2)
+        self.assertEqual(len(hits), 2)
+        self.assertTrue(all("需求价格弹性" in h["stem"] for h in hits))
+        self.assertGreaterEqual(hits[0]["score"], hits[1]["score"])
+        other = similarity.similar_items("需求价格弹性与总收益", k=5, exclude_colleges=["economy"])
+        self.assertEqual([h["college_dir"] for h in other], ["finance"])
+        self.assertEqual(other[0]["exercise_type"], "问答对")
+
+    def test_exclude_reviewed_item(self):
+        src = [s for s in similarity.load_manifest()["sources"] if "判断" in s][0]
+        hits = similarity.similar_items("边际效用递减规律", k=3, exclude=(src, 0))
+        self.assertNotIn("边际效用递减规律", [h["stem"] for h in hits])
+
+    def test_batched_top_k_matches_single_queries(self):
+        texts = ["货币乘数", "边际效用", "总收益"]
+        idx, scores = similarity.top_k(texts, k=2)
+        self.assertEqual(idx.shape, (3, 2))
+        for i, t in enumerate(texts):
+            single, s = similarity.top_k([t], k=2)
+            np.testing.assert_array_equal(single[0], idx[i])
+            np.testing.assert_allclose(s[0], scores[i], rtol=1e-6)
+
+    def test_incremental_save_delete_and_sync(self):
+        before = len(similarity.load_matrix()["meta"])
+        path = [it["path"] for it in storage.list_all_parsed(types=["qa"])][0]
+        self.assertTrue(storage.delete_path(path))
+        self.assertEqual(len(similarity.load_matrix()["meta"]), before - 1)
+        storage.save_parsed_dataset(pd.DataFrame({"question": ["货币乘数如何计算"], "answer": ["1/r"]}),
+                                    {"filename": "qa2.csv", "type": "问答对"}, "finance")
+        self.assertEqual(len(similarity.load_matrix()["meta"]), before)
+        self.assertEqual(similarity.sync_similarity()["files"], 0)
+        Path(storage.list_all_parsed(types=["qa"])[0]["path"]).unlink()
+        res = similarity.sync_similarity()
+        self.assertEqual((res["removed"], len(similarity.load_matrix()["meta"])), (1, before - 1))
+
+    def test_knowledge_suggestions_for_empty_rows(self):
+        upload = pd.DataFrame({"type": ["选择题"] * 4,
+                               "stem": ["货币乘数的决定因素包括哪些", "需求价格弹性大于1时降价对总收益的影响",
+                                        "通货膨胀的成因", "下列关于通货膨胀的说法正确的是"],
+                               "knowledge": [None, "nan", "", "通货膨胀"]})
+        self.assertEqual(similarity.missing_knowledge(upload).tolist(), [True, True, True, False])
+        sugg = similarity.suggest_knowledge(upload)
+        # 上传中已填写知识点的行同样可作为近邻
+        self.assertEqual(sugg["suggested_knowledge"].to_dict(), {0: "货币乘数", 1: "需求价格弹性", 2: "通货膨胀"})
+        self.assertTrue((sugg["similarity"] >= similarity.SUGGEST_MIN_SCORE).all())
+        applied = similarity.apply_knowledge_suggestions(upload, sugg.loc[[0]])
+        self.assertEqual(applied["knowledge"].tolist()[:2], ["货币乘数", "nan"])
+        self.assertTrue(pd.isna(upload["knowledge"].iloc[0]))
+        self.assertTrue(similarity.suggest_knowledge(upload.iloc[[3]]).empty)
+
+
+if __name__ == "__main__":
+    unittest.main()
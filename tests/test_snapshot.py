@@ -0,0 +1,110 @@
+import unittest
+import tempfile
+from pathlib import Path
+from unittest import mock
+
+import pandas as pd
+
+import modules.snapshot as snapshot
+import modules.storage as storage
+from benchmarks.corpus import use_storage_root
+
+
+def _rows(df: pd.DataFrame, columns) -> list:
+    return sorted(df[columns].astype(object).fillna("").astype(str).itertuples(index=False, name=None))
+
+
+class TestCorpusSnapshot(unittest.TestCase):
+    def setUp(self):
+        self._tmp = tempfile.TemporaryDirectory()
+        self._root = use_storage_root(Path(self._tmp.name))
+        self._root.__enter__()
+        ex = pd.DataFrame({"type": ["选择题", "判断题", "选择题"], "stem": ["s1", "s2", "s3"], "answer": ["A", "对", "B"]})
+        storage.save_split_dataset(ex, {"filename": "ug.xlsx", "type": "习题库", "level": "本科"}, "economy")
+        storage.save_split_dataset(ex.iloc[:1], {"filename": "grad.xlsx", "type": "习题库", "level": "研究生"}, "finance")
+        qa = pd.DataFrame({"question": ["q1", "q2"], "answer": ["a1", "a2"]})
+        storage.save_parsed_dataset(qa, {"filename": "qa.csv", "type": "问答对"}, "economy")
+
+    def tearDown(self):
+        self._root.__exit__(None, None, None)
+        self._tmp.cleanup()
+
+    def assertMatchesFiles(self, **kw):
+        expected, _ = storage.merge_parsed(**kw)
+        got, skipped = snapshot.load_corpus(**kw)
+        self.assertEqual(skipped, [])
+        self.assertEqual(len(got), len(expected))
+        self.assertEqual(_rows(got, list(expected.columns)), _rows(expected, list(expected.columns)))
+
+    def test_saves_append_segments(self):
+        m = snapshot.load_manifest()
+        self.assertEqual(sorted(m["datasets"]), ["ex_grad", "ex_ug", "qa"])
+        self.assertEqual(len(m["sources"]), 4)
+        self.assertMatchesFiles()
+        self.assertMatchesFiles(colleges=["economy"], types=["ex"])
+        self.assertMatchesFiles(columns=["stem", "college"], levels=["研究生"])
+        self.assertMatchesFiles(columns=["stem"], exercise_types=["判断题", "问答对"])
+
+    def test_delete_tombstones_then_compaction_drops(self):
+        path = [it["path"] for it in storage.list_parsed_datasets("economy") if "选择" in it["file"]][0]
+        self.assertTrue(storage.delete_path(path))
+        ds = snapshot.load_manifest()["datasets"]["ex_ug"]
+        self.assertEqual(len(ds["tombstones"]), 1)
+        self.assertMatchesFiles()
+        stats = snapshot.compact_snapshot()
+        self.assertEqual(stats["ex_ug"], {"segments_before": 2, "rows": 1})
+        ds = snapshot.load_manifest()["datasets"]["ex_ug"]
+        self.assertEqual((len(ds["segments"]), ds["tombstones"]), (1, {}))
+        self.assertMatchesFiles()
+
+    def test_overwrite_and_external_changes_are_synced(self):
+        # 同名文件重新上传：旧行被新分段取代
+        qa = pd.DataFrame({"question": ["q9"], "answer": ["a9"]})
+        storage.save_parsed_dataset(qa, {"filename": "qa.csv", "type": "问答对"}, "economy")
+        self.assertMatchesFiles(types=["qa"])
+        # 绕过 storage 直接写入 / 删除的文件在读取前同步
+        extra = Path(self._tmp.name) / "tax" / "2025-01-01" / "x_parsed_qa.csv"
+        extra.parent.mkdir(parents=True)
+        qa.to_csv(extra, index=False)
+        self.assertMatchesFiles()
+        extra.unlink()
+        self.assertMatchesFiles()
+
+    def test_save_reuses_written_frame_and_logs_failures(self):
+        # 派生数据取自写入时的 CSV 文本，不回读文件；数字样式的文本与回读结果一致
+        qa = pd.DataFrame({"question": ["q1", "q2"], "answer": ["1", "002"]})
+        with mock.patch.object(storage, "_read_parsed", side_effect=AssertionError("re-read")):
+            storage.save_parsed_dataset(qa, {"filename": "nums.csv", "type": "问答对"}, "finance")
+        self.assertMatchesFiles(types=["qa"])
+        with mock.patch.object(snapshot, "_add_source", side_effect=OSError("disk full")), \
+                self.assertLogs("modules.storage", level="ERROR") as logs:
+            storage.save_parsed_dataset(qa, {"filename": "nums2.csv", "type": "问答对"}, "finance")
+        self.assertIn("nums2", logs.output[0])
+        self.assertMatchesFiles(types=["qa"])
+
+    def test_delete_failures_logged(self):
+        from modules import search, versions
+        path = [it["path"] for it in storage.list_parsed_datasets("economy") if "选择" in it["file"]][0]
+        # 留存失败：不删除文件
+        with mock.patch.object(versions, "preserve_deleted", side_effect=OSError("disk full")), \
+                self.assertLogs("modules.storage", level="ERROR") as logs:
+            self.assertFalse(storage.delete_path(path))
+        self.assertTrue(Path(path).exists())
+        self.assertIn("disk full", logs.output[0])
+        # 索引移除失败：文件照常删除，快照仍记墓碑
+        with mock.patch.object(search, "remove_file", side_effect=OSError("locked")), \
+                self.assertLogs("modules.storage", level="ERROR") as logs:
+            self.assertTrue(storage.delete_path(path))
+        self.assertFalse(Path(path).exists())
+        self.assertIn("全文索引移除失败", logs.output[0])
+        self.assertMatchesFiles()
+
+    def test_rebuild(self):
+        snapshot.rebuild_snapshot()
+        m = snapshot.load_manifest()
+        self.assertTrue(all(len(ds["segments"]) == 1 for ds in m["datasets"].values()))
+        self.assertMatchesFiles()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,44 @@
+import unittest
+import tempfile
+from pathlib import Path
+from unittest import mock
+
+import pandas as pd
+
+import modules.snapshot as snapshot
+import modules.stats as stats
+import modules.storage as storage
+from benchmarks.corpus import use_storage_root
+
+
+class TestSummarizeColleges(unittest.TestCase):
+    def setUp(self):
+        self._tmp = tempfile.TemporaryDirectory()
+        self._root = use_storage_root(Path(self._tmp.name))
+        self._root.__enter__()
+        ex = pd.DataFrame({"type": ["选择题", "判断题", "选择题"], "stem": ["s1", "s2", ""], "answer": ["A", "对", "B"]})
+        storage.save_split_dataset(ex, {"filename": "ug.xlsx", "type": "习题库", "level": "本科"}, "economy")
+        storage.save_split_dataset(ex.iloc[:1], {"filename": "grad.xlsx", "type": "习题库", "level": "研究生"}, "finance")
+        qa = pd.DataFrame({"question": ["q1", "q2"], "answer": ["a1", "a2"]})
+        storage.save_parsed_dataset(qa, {"filename": "qa.csv", "type": "问答对"}, "economy")
+
+    def tearDown(self):
+        self._root.__exit__(None, None, None)
+        self._tmp.cleanup()
+
+    def test_rows_match_single_college_and_sync_once(self):
+        codes = ["economy", "finance", "tax"]
+        sync = mock.Mock(wraps=snapshot.sync_snapshot)
+        with mock.patch.object(snapshot, "sync_snapshot", sync), mock.patch.object(stats, "sync_snapshot", sync):
+            rows = stats.summarize_colleges(codes)
+        self.assertEqual(sync.call_count, 1)
+        self.assertEqual([(r["问答对"], r["本科习题"], r["研究生习题"]) for r in rows], [(2, 3, 0), (0, 0, 1), (0, 0, 0)])
+        self.assertGreater(rows[0]["红色问题比例"], 0)
+        for code, row in zip(codes, rows):
+            self.assertEqual(stats.summarize_college(code), row)
+        grad = stats.summarize_colleges(codes, "研究生")
+        self.assertEqual([r["习题"] for r in grad], [0, 1, 0])
+
+
+if __name__ == "__main__":
+    unittest.main()
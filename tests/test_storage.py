@@ -1,8 +1,9 @@
 import unittest
+import tempfile
 from io import BytesIO
 from pathlib import Path
-import os
 
+from benchmarks.corpus import use_storage_root
 from modules.storage import archive_raw_file, save_parsed_dataset
 import pandas as pd
 
@@ -11,26 +12,288 @@ class TestStorage(unittest.TestCase):
     def test_archive_and_save(self):
         buf = BytesIO(b"question,answer\nq1,a1\n")
         buf.name = "qa.csv"
-        raw_path = archive_raw_file(buf, "economy")
-        self.assertTrue(raw_path.exists())
-        df = pd.DataFrame({"question": ["q1"], "answer": ["a1"]})
-        meta = {"filename": buf.name}
-        parsed_path = save_parsed_dataset(df, meta, "economy")
-        self.assertTrue(parsed_path.exists())
-        # cleanup
-        try:
-            os.remove(parsed_path)
-            os.remove(raw_path)
-            day_dir = raw_path.parent
-            if day_dir.exists():
-                for f in day_dir.iterdir():
-                    try:
-                        os.remove(f)
-                    except Exception:
-                        pass
-                os.rmdir(day_dir)
-        except Exception:
-            pass
+        with tempfile.TemporaryDirectory() as tmp, use_storage_root(Path(tmp)):
+            raw_path = archive_raw_file(buf, "economy")
+            self.assertTrue(raw_path.exists())
+            df = pd.DataFrame({"question": ["q1"], "answer": ["a1"]})
+            meta = {"filename": buf.name}
+            parsed_path = save_parsed_dataset(df, meta, "economy")
+            self.assertTrue(parsed_path.exists())
+
+    def test_college_mapping_follows_config_edits(self):
+        import os
+        import modules.storage as storage
+        cwd = os.getcwd()
+        with tempfile.TemporaryDirectory() as tmp:
+            os.chdir(tmp)
+            try:
+                cfg = Path("config/users.yaml")
+                cfg.parent.mkdir()
+                cfg.write_text("credentials:\n  usernames:\n    user_economy: {name: 经济学院}\n", encoding="utf-8")
+                self.assertEqual(storage.load_college_mapping(), {"economy": "经济学院"})
+                cfg.write_text("credentials:\n  usernames:\n    user_economy: {name: 经济学院}\n"
+                               "    user_finance: {name: 金融学院}\n", encoding="utf-8")
+                self.assertEqual(storage.get_college_display("finance"), "金融学院")
+            finally:
+                os.chdir(cwd)
+
+
+class TestRawBlobStore(unittest.TestCase):
+    def setUp(self):
+        import tempfile
+        import modules.storage as storage
+        self.storage = storage
+        self._tmp = tempfile.TemporaryDirectory()
+        self._orig = storage.BASE
+        storage.BASE = Path(self._tmp.name)
+
+    def tearDown(self):
+        self.storage.BASE = self._orig
+        self._tmp.cleanup()
+
+    def _upload(self, content: bytes, name: str):
+        buf = BytesIO(content)
+        buf.name = name
+        return buf
+
+    def test_identical_reupload_writes_once(self):
+        storage = self.storage
+        p1 = archive_raw_file(self._upload(b"question,answer\nq1,a1\n", "qa.csv"), "economy")
+        mtime = p1.stat().st_mtime_ns
+        p2 = archive_raw_file(self._upload(b"question,answer\nq1,a1\n", "qa.csv"), "economy")
+        self.assertEqual(p1, p2)
+        self.assertEqual(p2.stat().st_mtime_ns, mtime)
+        self.assertEqual(len(list((storage.BASE / storage.BLOBS_DIRNAME).rglob("*.*"))), 1)
+        self.assertEqual(storage.read_raw_bytes(str(p1)), b"question,answer\nq1,a1\n")
+
+    def test_same_name_different_content_kept(self):
+        storage = self.storage
+        archive_raw_file(self._upload(b"v1", "bank.csv"), "economy")
+        archive_raw_file(self._upload(b"v2", "bank.csv"), "economy")
+        raws = [r for r in storage.list_history("economy") if r.get("raw")]
+        self.assertEqual(len(raws), 2)
+        self.assertEqual(sorted(storage.read_raw_bytes(r["path"]) for r in raws), [b"v1", b"v2"])
+
+
+
+class TestSaveSplitDataset(unittest.TestCase):
+    def setUp(self):
+        import tempfile
+        import modules.storage as storage
+        self.storage = storage
+        self._tmp = tempfile.TemporaryDirectory()
+        self._orig = storage.BASE
+        storage.BASE = Path(self._tmp.name)
+
+    def tearDown(self):
+        self.storage.BASE = self._orig
+        self._tmp.cleanup()
+
+    def test_partitions_written_with_summaries(self):
+        storage = self.storage
+        df = pd.DataFrame({
+            "type": ["选择题", "判断题", "选择题", "填空题"],
+            "stem": ["s1", "s2", "s3", "s4"],
+            "answer": ["A", "对", "B", "x"],
+            "quality_score": [100, 100, 50, 100],
+            "quality_flags": ["", "", "Error:ANS_EMPTY:答案为空", ""],
+        })
+        before = df.copy()
+        meta = {"filename": "bank.xlsx", "type": "习题库", "level": "研究生"}
+        parts = storage.save_split_dataset(df, meta, "economy", max_workers=3)
+        self.assertEqual([p["exercise_type"] for p in parts], ["选择题", "判断题", "填空题"])
+        self.assertEqual([p["rows"] for p in parts], [2, 1, 1])
+        self.assertEqual(parts[0]["quality_summary"]["error_count"], 1)
+        for p in parts:
+            saved = pd.read_csv(p["path"])
+            self.assertEqual(len(saved), p["rows"])
+            self.assertEqual(set(saved["level"]), {"研究生"})
+            self.assertTrue(storage.plain_name(p["file"]).endswith("_parsed_ex_grad.csv"))
+        pd.testing.assert_frame_equal(df, before)
+        self.assertEqual(len(storage.list_parsed_datasets("economy")), 3)
+
+    def test_single_type_kept_whole(self):
+        df = pd.DataFrame({"question": ["q1", "q2"], "answer": ["a1", "a2"]})
+        parts = self.storage.save_split_dataset(df, {"filename": "qa.csv", "type": "问答对"}, "economy")
+        self.assertEqual(len(parts), 1)
+        self.assertTrue(self.storage.plain_name(parts[0]["file"]).endswith("_parsed_qa.csv"))
+
+
+class TestMergeParsed(unittest.TestCase):
+    def setUp(self):
+        import tempfile
+        import modules.storage as storage
+        self.storage = storage
+        self._tmp = tempfile.TemporaryDirectory()
+        self._orig = storage.BASE
+        storage.BASE = Path(self._tmp.name)
+        ex = pd.DataFrame({"type": ["选择题", "判断题"], "stem": ["s1", "s2"], "answer": ["A", "对"]})
+        storage.save_split_dataset(ex, {"filename": "ug.xlsx", "type": "习题库", "level": "本科"}, "economy")
+        storage.save_split_dataset(ex.iloc[:1], {"filename": "grad.xlsx", "type": "习题库", "level": "研究生"}, "finance")
+        qa = pd.DataFrame({"question": ["q1"], "answer": ["a1"]})
+        storage.save_parsed_dataset(qa, {"filename": "qa.csv", "type": "问答对"}, "economy")
+
+    def tearDown(self):
+        self.storage.BASE = self._orig
+        self._tmp.cleanup()
+
+    def test_merge_all_with_partition_columns(self):
+        df, skipped = self.storage.merge_parsed(max_workers=3)
+        self.assertEqual(skipped, [])
+        self.assertEqual(len(df), 4)
+        for col in ["college", "date", "level"]:
+            self.assertIsInstance(df[col].dtype, pd.CategoricalDtype)
+        disp = self.storage.get_college_display
+        self.assertEqual(df["college"].astype(str).value_counts().to_dict(), {disp("economy"): 3, disp("finance"): 1})
+
+    def test_filters_and_projection(self):
+        df, _ = self.storage.merge_parsed(columns=["stem", "college"], colleges=["economy"], types=["ex"])
+        self.assertEqual(list(df.columns), ["stem", "college"])
+        self.assertEqual(sorted(df["stem"]), ["s1", "s2"])
+        df, _ = self.storage.merge_parsed(columns=["college"], levels=["研究生"])
+        self.assertEqual(df["college"].tolist(), [self.storage.get_college_display("finance")])
+        self.assertIsNone(self.storage.merge_parsed(colleges=["tax"])[0])
+
+    def test_unreadable_files_reported(self):
+        bad = Path(self._tmp.name) / "economy" / "2025-01-01" / "bad_parsed_qa.csv"
+        bad.parent.mkdir(parents=True)
+        bad.write_bytes(b"")
+        df, skipped = self.storage.merge_parsed(types=["qa"])
+        self.assertEqual(len(df), 1)
+        self.assertEqual([s["path"] for s in skipped], [str(bad)])
+        self.assertEqual(len(self.storage.merge_all_parsed()), 4)
+
+
+class TestPartitionedLayout(unittest.TestCase):
+    def setUp(self):
+        import tempfile
+        import modules.storage as storage
+        self.storage = storage
+        self._tmp = tempfile.TemporaryDirectory()
+        self._orig = storage.BASE
+        storage.BASE = Path(self._tmp.name)
+        ex = pd.DataFrame({"type": ["选择题", "判断题", "选择题"], "stem": ["s1", "s2", "s3"], "answer": ["A", "对", "B"]})
+        storage.save_split_dataset(ex, {"filename": "ug.xlsx", "type": "习题库", "level": "本科"}, "finance")
+        storage.save_split_dataset(ex.iloc[:1], {"filename": "grad.xlsx", "type": "习题库", "level": "研究生"}, "finance")
+        storage.save_split_dataset(ex, {"filename": "ug.xlsx", "type": "习题库", "level": "本科"}, "economy")
+        qa = pd.DataFrame({"question": ["q1"], "answer": ["a1"]})
+        storage.save_parsed_dataset(qa, {"filename": "qa.csv", "type": "问答对"}, "finance")
+
+    def tearDown(self):
+        self.storage.BASE = self._orig
+        self._tmp.cleanup()
+
+    def test_files_written_under_partitions(self):
+        storage = self.storage
+        path = Path([it["path"] for it in storage.list_parsed_datasets("finance") if it["file"].startswith("grad")][0])
+        rel = path.relative_to(storage.BASE).parts
+        self.assertEqual(rel[:4], ("parsed", "college=finance", "level=研究生", "type=选择题"))
+        self.assertTrue(rel[4].startswith("date="))
+        it = storage.parsed_item(path)
+        self.assertEqual((it["type"], it["level"], it["exercise_type"], it["college_dir"]), ("ex", "研究生", "选择题", "finance"))
+        qa = [it for it in storage.list_parsed_datasets("finance") if it["type"] == "qa"][0]
+        self.assertIn(f"level={storage.NULL_PARTITION}", qa["path"])
+        history = storage.list_history("finance")
+        self.assertEqual(sorted((r["type"], r["level"] or "") for r in history),
+                         [("ex", "本科"), ("ex", "本科"), ("ex", "研究生"), ("qa", "")])
+
+    def test_filters_prune_partitions(self):
+        storage = self.storage
+        items = storage.list_all_parsed(colleges=["finance"], levels=["本科"], exercise_types=["选择题"])
+        self.assertEqual([(it["college_dir"], it["level"], it["exercise_type"]) for it in items], [("finance", "本科", "选择题")])
+        # 被裁剪的分区不会被读取：损坏其他文件不影响结果
+        for it in storage.list_all_parsed():
+            if it not in items:
+                Path(it["path"]).write_bytes(b"")
+        df, skipped = storage.merge_parsed(colleges=["finance"], levels=["本科"], exercise_types=["选择题"])
+        self.assertEqual((sorted(df["stem"]), skipped), (["s1", "s3"], []))
+        self.assertEqual(len(storage.list_all_parsed(exercise_types=["问答对"])), 1)
+        self.assertEqual(storage.list_all_parsed(dates=["1999-01-01"]), [])
+
+    def test_migrate_legacy_layout(self):
+        storage = self.storage
+        legacy = storage.BASE / storage.get_college_display("tax") / "2025-01-01"
+        legacy.mkdir(parents=True)
+        pd.DataFrame({"type": ["判断题", "选择题"], "stem": ["t1", "t2"]}).to_csv(legacy / "old_parsed_ex_ug.csv", index=False)
+        pd.DataFrame({"type": ["判断题"], "stem": ["t3"]}).to_csv(legacy / "j_parsed_ex_grad.csv", index=False)
+        before = storage.merge_parsed()[0]
+        df, _ = storage.merge_parsed(exercise_types=["判断题"], colleges=["tax"])
+        self.assertEqual(sorted(df["stem"]), ["t1", "t3"])
+
+        plan = storage.migrate_layout(dry_run=True)
+        self.assertEqual(len(plan), 2)
+        self.assertTrue((legacy / "old_parsed_ex_ug.csv").exists())
+        moves = storage.migrate_layout()
+        self.assertEqual(moves, plan)
+        self.assertEqual([Path(m["to"]).parent.relative_to(storage.BASE).as_posix() for m in moves], [
+            "parsed/college=tax/level=研究生/type=判断题/date=2025-01-01",
+            "parsed/college=tax/level=本科/type=混合/date=2025-01-01",
+        ])
+        self.assertFalse(any(legacy.iterdir()))
+        after = storage.merge_parsed()[0]
+        rows = lambda df: sorted(df[["college", "level", "stem"]].astype(object).fillna("").astype(str).itertuples(index=False))
+        self.assertEqual(rows(after), rows(before))
+        self.assertEqual(storage.migrate_layout(), [])
+
+
+class TestParsedCompression(unittest.TestCase):
+    def setUp(self):
+        import tempfile
+        import modules.storage as storage
+        self.storage = storage
+        self._tmp = tempfile.TemporaryDirectory()
+        self._orig = (storage.BASE, storage.PARSED_COMPRESSION)
+        storage.BASE = Path(self._tmp.name)
+        self.df = pd.DataFrame({"type": ["简答题"] * 50, "stem": [f"简述需求价格弹性的含义 {i}" for i in range(50)], "answer": ["略"] * 50})
+
+    def tearDown(self):
+        self.storage.BASE, self.storage.PARSED_COMPRESSION = self._orig
+        self._tmp.cleanup()
+
+    def _save(self):
+        return self.storage.save_parsed_dataset(self.df, {"filename": "bank.xlsx", "type": "习题库", "level": "本科"}, "economy")
+
+    def test_compressed_write_and_transparent_read(self):
+        storage = self.storage
+        storage.PARSED_COMPRESSION = "gzip"
+        path = self._save()
+        self.assertTrue(path.name.endswith("_parsed_ex_ug.csv.gz"))
+        self.assertEqual(path.read_bytes()[:2], b"\x1f\x8b")
+        self.assertEqual(storage.load_csv(str(path))["stem"].tolist(), self.df["stem"].tolist())
+        self.assertEqual(sum(len(c) for c in storage.iter_csv_chunks(str(path), 7)), 50)
+        self.assertEqual(len(storage.merge_parsed()[0]), 50)
+        self.assertEqual(storage.read_raw_bytes(str(path)).decode("utf-8").splitlines()[0], "type,stem,answer,level")
+
+    def test_recompress_and_overwrite(self):
+        storage = self.storage
+        storage.PARSED_COMPRESSION = "none"
+        plain = self._save()
+        self.assertEqual(plain.suffix, ".csv")
+        storage.PARSED_COMPRESSION = "gzip"
+        moves = storage.compress_parsed()
+        self.assertEqual([Path(m["to"]).name for m in moves], [plain.name + ".gz"])
+        self.assertLess(moves[0]["after"], moves[0]["before"])
+        self.assertEqual(storage.compress_parsed(), [])
+        self.assertFalse(plain.exists())
+        self.assertEqual(storage.load_csv(moves[0]["to"])["stem"].tolist(), self.df["stem"].tolist())
+        # 以另一种压缩方式重新保存同名上传时替换旧文件
+        storage.PARSED_COMPRESSION = "none"
+        self._save()
+        self.assertEqual([it["file"] for it in storage.list_all_parsed()], [plain.name])
+
+    def test_failed_overwrite_keeps_previous_file(self):
+        from unittest import mock
+        storage = self.storage
+        storage.PARSED_COMPRESSION = "gzip"
+        path = self._save()
+        before = path.read_bytes()
+        self.df = self.df.assign(answer="新答案")
+        with mock.patch.object(storage.os, "replace", side_effect=OSError("disk full")):
+            with self.assertRaises(OSError):
+                self._save()
+        # 写入失败时原文件完整保留，临时文件被清理
+        self.assertEqual(path.read_bytes(), before)
+        self.assertEqual(sorted(f.name for f in path.parent.iterdir()), [path.name])
 
 
 if __name__ == "__main__":
@@ -0,0 +1,54 @@
+import unittest
+import tempfile
+import json
+from io import BytesIO
+from pathlib import Path
+
+import modules.tracing as tracing
+from modules.tracing import start_trace, span, log_upload
+from modules.parsing import parse_uploaded_file
+
+
+class TestTracing(unittest.TestCase):
+    def test_span_noop_without_trace(self):
+        with span("outside") as rec:
+            rec["rows"] = 1
+        self.assertEqual(rec, {"rows": 1})
+
+    def test_nested_spans(self):
+        with start_trace("t") as tracer:
+            with span("outer", rows=3):
+                with span("inner"):
+                    pass
+        recs = tracer.records()
+        self.assertEqual([r["name"] for r in recs], ["outer", "inner"])
+        self.assertEqual([r["depth"] for r in recs], [0, 1])
+        self.assertEqual(recs[0]["rows"], 3)
+        self.assertGreaterEqual(recs[0]["ms"], recs[1]["ms"])
+        self.assertIn("mem_delta_kb", recs[1])
+
+    def test_parse_stages_recorded(self):
+        buf = BytesIO("stem,answer,knowledge\n题干,答案,知识点\n".encode("utf-8"))
+        buf.name = "ex.csv"
+        with start_trace("upload") as tracer:
+            parse_uploaded_file(buf, "习题库")
+        names = [r["name"] for r in tracer.records()]
+        for stage in ["read_file", "normalize[CSV]", "match_columns", "infer_type", "assess_quality"]:
+            self.assertIn(stage, names)
+
+    def test_log_upload_appends_jsonl(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            orig = tracing.UPLOAD_LOG_DIR
+            tracing.UPLOAD_LOG_DIR = Path(tmp)
+            try:
+                p = log_upload("economy", "a.csv", 2, {"parse": [{"name": "read_file", "depth": 0, "ms": 1.5}]})
+                log_upload("economy", "b.csv", 1, {"parse": []})
+            finally:
+                tracing.UPLOAD_LOG_DIR = orig
+            lines = p.read_text(encoding="utf-8").splitlines()
+            self.assertEqual(len(lines), 2)
+            self.assertEqual(json.loads(lines[0])["total_ms"], 1.5)
+
+
+if __name__ == "__main__":
+    unittest.main()
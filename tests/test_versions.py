@@ -0,0 +1,77 @@
+import unittest
+import tempfile
+from pathlib import Path
+
+import pandas as pd
+
+import modules.storage as storage
+import modules.versions as versions
+from benchmarks.corpus import use_storage_root
+
+
+class TestCorpusVersions(unittest.TestCase):
+    def setUp(self):
+        self._tmp = tempfile.TemporaryDirectory()
+        self._root = use_storage_root(Path(self._tmp.name))
+        self._root.__enter__()
+        ex = pd.DataFrame({"type": ["选择题", "判断题", "选择题"], "stem": ["s1", "s2", "s3"], "answer": ["A", "对", "B"]})
+        storage.save_split_dataset(ex, {"filename": "ug.xlsx", "type": "习题库", "level": "本科"}, "economy")
+        qa = pd.DataFrame({"question": ["q1", "q2"], "answer": ["a1", "a2"]})
+        storage.save_parsed_dataset(qa, {"filename": "qa.csv", "type": "问答对"}, "finance")
+
+    def tearDown(self):
+        self._root.__exit__(None, None, None)
+        self._tmp.cleanup()
+
+    def _path(self, needle: str) -> str:
+        return [it["path"] for it in storage.list_all_parsed() if needle in it["file"]][0]
+
+    def test_unchanged_files_reuse_blocks(self):
+        v1 = versions.create_version("first")
+        self.assertEqual((v1["id"], v1["files"], v1["rows"], v1["new_blocks"]), ("v0001", 3, 5, 3))
+        v2 = versions.create_version()
+        self.assertEqual((v2["parent"], v2["changed_files"], v2["new_blocks"]), ("v0001", 0, 0))
+        self.assertEqual([v["id"] for v in versions.list_versions()], ["v0001", "v0002"])
+
+    def test_history_survives_changes(self):
+        versions.create_version()
+        before = storage.merge_parsed()[0]
+        self.assertTrue(storage.delete_path(self._path("判断")))
+        qa_path = self._path("qa")
+        pd.DataFrame({"question": ["q1", "q3"], "answer": ["a1", "a3"]}).to_csv(qa_path, index=False)
+        v2 = versions.create_version()
+        self.assertEqual((v2["changed_files"], v2["new_blocks"]), (1, 1))
+
+        old = versions.load_version("v0001")
+        self.assertEqual(len(old), len(before))
+        self.assertEqual(sorted(old["stem"].dropna()), sorted(before["stem"].dropna()))
+        self.assertEqual(len(versions.load_version("v0002")), len(storage.merge_parsed()[0]))
+
+        d = versions.diff_versions("v0001", "v0002")
+        self.assertEqual(len(d["removed"]), 1)
+        self.assertEqual(d["changed"][0]["rows_added"], 1)
+        self.assertEqual(d["changed"][0]["rows_removed"], 1)
+        self.assertEqual((d["rows_added"], d["rows_removed"]), (1, 2))
+
+    def test_filters_and_export(self):
+        versions.create_version()
+        df = versions.load_version("v0001", columns=["stem", "college"], colleges=["economy"], levels=["本科"])
+        self.assertEqual(list(df.columns), ["stem", "college"])
+        self.assertEqual(len(df), 3)
+        out = Path(self._tmp.name) / "out"
+        names = [p.name for p in versions.export_version("v0001", out)]
+        self.assertEqual(names, ["v0001_qa.csv", "v0001_ug.csv", "v0001_grad.csv", "v0001_manifest.json"])
+        self.assertEqual(len(pd.read_csv(out / "v0001_qa.csv")), 2)
+
+    def test_deleted_files_are_preserved(self):
+        path = self._path("qa")
+        original = Path(path).read_bytes()
+        self.assertTrue(storage.delete_path(path))
+        self.assertFalse(Path(path).exists())
+        entry = versions.list_deleted()[0]
+        self.assertEqual(versions.restore_deleted(entry), Path(path))
+        self.assertEqual(Path(path).read_bytes(), original)
+
+
+if __name__ == "__main__":
+    unittest.main()